@@ -0,0 +1,151 @@
+"""
+Offline enrichment for analytics events
+Adds country/city from a local MaxMind-format GeoIP database opened with mmap,
+plus device class, OS and browser from an LRU-cached user-agent parser. No
+network calls are made; without a database file only device data is added.
+
+Config (env):
+  GEOIP_DB_PATH  path to a GeoLite2-City/Country .mmdb file
+"""
+
+import os
+import re
+import ipaddress
+import logging
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional, Dict, Any
+
+try:
+    import maxminddb
+except ImportError:  # enrichment degrades to device data only
+    maxminddb = None
+
+logger = logging.getLogger(__name__)
+
+GEOIP_DB_PATH = Path(
+    os.environ.get("GEOIP_DB_PATH",
+                   Path(__file__).parent / "data" / "GeoLite2-City.mmdb"))
+GEOIP_CACHE_SIZE = 8192
+
+_TABLET = re.compile(r"iPad|Tablet|PlayBook|Silk|Kindle|Android(?!.*Mobile)",
+                     re.IGNORECASE)
+_MOBILE = re.compile(r"Mobi|iPhone|iPod|Android|Windows Phone|Opera Mini",
+                     re.IGNORECASE)
+_OS_PATTERNS = [
+    ("iOS", re.compile(r"iPhone|iPad|iPod")),
+    ("Android", re.compile(r"Android")),
+    ("Windows", re.compile(r"Windows")),
+    ("macOS", re.compile(r"Mac OS X|Macintosh")),
+    ("ChromeOS", re.compile(r"CrOS")),
+    ("Linux", re.compile(r"Linux")),
+]
+_BROWSER_PATTERNS = [
+    ("Edge", re.compile(r"Edg(?:e|A|iOS)?/")),
+    ("Opera", re.compile(r"OPR/|Opera")),
+    ("Samsung Internet", re.compile(r"SamsungBrowser/")),
+    ("Firefox", re.compile(r"Firefox/|FxiOS/")),
+    ("Chrome", re.compile(r"Chrome/|CriOS/")),
+    ("Safari", re.compile(r"Safari/")),
+]
+
+
+@lru_cache(maxsize=4096)
+def parse_user_agent(user_agent: str) -> Dict[str, str]:
+    """Classify a user agent into device class, OS and browser"""
+    if _TABLET.search(user_agent):
+        device_class = "tablet"
+    elif _MOBILE.search(user_agent):
+        device_class = "mobile"
+    else:
+        device_class = "desktop"
+    os_name = next(
+        (name for name, pattern in _OS_PATTERNS if pattern.search(user_agent)),
+        "other")
+    browser = next((name for name, pattern in _BROWSER_PATTERNS
+                    if pattern.search(user_agent)), "other")
+    return {"class": device_class, "os": os_name, "browser": browser}
+
+
+class GeoIPLookup:
+
+    def __init__(self, db_path: Path):
+        self.db_path = db_path
+        self._reader = None
+        self._opened = False
+        # Per instance, so results never outlive this reader (see close)
+        self.lookup = lru_cache(maxsize=GEOIP_CACHE_SIZE)(self._lookup)
+
+    def _open(self):
+        self._opened = True
+        if maxminddb is None:
+            logger.info("maxminddb not installed, GeoIP enrichment disabled")
+            return
+        if not self.db_path.exists():
+            logger.info(f"No GeoIP database at {self.db_path}, "
+                        "GeoIP enrichment disabled")
+            return
+        try:
+            self._reader = maxminddb.open_database(str(self.db_path),
+                                                   maxminddb.MODE_MMAP)
+            logger.info(f"GeoIP database loaded from {self.db_path}")
+        except Exception as e:
+            logger.error(f"Failed to open GeoIP database: {e}")
+
+    def _lookup(self, ip: str) -> Optional[Dict[str, Any]]:
+        """Country/city for a public IP, or None"""
+        if not self._opened:
+            self._open()
+        if self._reader is None:
+            return None
+        try:
+            if not ipaddress.ip_address(ip).is_global:
+                return None
+            record = self._reader.get(ip)
+        except ValueError:
+            return None
+        if not record:
+            return None
+
+        country = record.get("country") or {}
+        city = record.get("city") or {}
+        subdivisions = record.get("subdivisions") or [{}]
+        return {
+            "country": country.get("iso_code"),
+            "countryName": (country.get("names") or {}).get("en"),
+            "region": (subdivisions[0].get("names") or {}).get("en"),
+            "city": (city.get("names") or {}).get("en")
+        }
+
+    def close(self):
+        """Release the database; the next lookup opens it again"""
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+        self._opened = False
+        self.lookup.cache_clear()
+
+
+def client_ip(request) -> Optional[str]:
+    """Originating client IP, honouring the proxy's X-Forwarded-For"""
+    forwarded = request.headers.get("x-forwarded-for")
+    if forwarded:
+        return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else None
+
+
+def enrich_event(request, user_agent: Optional[str]) -> Dict[str, Any]:
+    """Fields to merge into an analytics event document"""
+    enrichment = {}
+    if user_agent:
+        enrichment["device"] = dict(parse_user_agent(user_agent))
+    ip = client_ip(request)
+    if ip:
+        geo = geoip.lookup(ip)
+        if geo:
+            enrichment["geo"] = dict(geo)
+    return enrichment
+
+
+# Global GeoIP reader (opened lazily, one mmap per worker process)
+geoip = GeoIPLookup(GEOIP_DB_PATH)
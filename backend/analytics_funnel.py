@@ -0,0 +1,170 @@
+"""
+Conversion funnel tracking for the public site
+Advances each analytics session through page_view -> click -> inquiry and
+keeps precomputed step counts per day and entry page, so funnel reports never
+scan the raw analytics_events collection. A sampled session carries one
+weight, fixed when it is first seen, that every one of its steps counts with.
+"""
+
+import logging
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, List
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+FUNNEL_STEPS = ["page_view", "click", "inquiry"]
+
+# Sessions only need to live long enough to convert
+SESSION_TTL_DAYS = 30
+
+
+async def ensure_funnel_indexes(db):
+    """Create indexes used by funnel updates and reports"""
+    await db.analytics_sessions.create_index("sessionId", unique=True)
+    await db.analytics_sessions.create_index(
+        "startedAt", expireAfterSeconds=SESSION_TTL_DAYS * 24 * 60 * 60)
+    await db.analytics_funnels.create_index([("day", 1), ("entryPage", 1)],
+                                            unique=True)
+
+
+async def record_funnel_step(db,
+                             session_id: Optional[str],
+                             step: str,
+                             page: Optional[str] = None,
+                             weight: float = 1):
+    """
+    Move a session forward to `step` and increment the precomputed counters
+    Counts are cumulative: a session that reaches a step also counts for every
+    earlier step it skipped, and each session is counted at most once per step.
+    The session is attributed to the day and page it was first seen on, and
+    counts with the `weight` it was first seen with (see session_weight).
+    """
+    if not session_id or step not in FUNNEL_STEPS:
+        return
+
+    stage = FUNNEL_STEPS.index(step) + 1
+    now = datetime.utcnow()
+
+    try:
+        await db.analytics_sessions.update_one({"sessionId": session_id}, {
+            "$setOnInsert": {
+                "sessionId": session_id,
+                "entryPage": page or "unknown",
+                "day": now.strftime("%Y-%m-%d"),
+                "stage": 0,
+                "weight": weight,
+                "startedAt": now
+            }
+        },
+                                               upsert=True)
+    except DuplicateKeyError:
+        # Another request created the session first
+        pass
+
+    previous = await db.analytics_sessions.find_one_and_update(
+        {
+            "sessionId": session_id,
+            "stage": {
+                "$lt": stage
+            }
+        }, {"$set": {
+            "stage": stage,
+            "updatedAt": now
+        }},
+        return_document=ReturnDocument.BEFORE)
+    if not previous:
+        return
+
+    increments = {
+        f"steps.{name}": previous.get("weight", 1)
+        for name in FUNNEL_STEPS[previous["stage"]:stage]
+    }
+    try:
+        await db.analytics_funnels.update_one(
+            {
+                "day": previous["day"],
+                "entryPage": previous["entryPage"]
+            }, {
+                "$inc": increments,
+                "$set": {
+                    "updatedAt": now
+                }
+            },
+            upsert=True)
+    except DuplicateKeyError:
+        await db.analytics_funnels.update_one(
+            {
+                "day": previous["day"],
+                "entryPage": previous["entryPage"]
+            }, {
+                "$inc": increments,
+                "$set": {
+                    "updatedAt": now
+                }
+            })
+
+
+def _step_summary(counts: Dict[str, float]) -> List[Dict[str, Any]]:
+    summary = []
+    first = counts.get(FUNNEL_STEPS[0], 0)
+    previous = None
+    for name in FUNNEL_STEPS:
+        count = counts.get(name, 0)
+        summary.append({
+            "step": name,
+            "count": round(count),
+            "conversionFromPrevious":
+            round(count / previous, 4) if previous else None,
+            "conversionFromStart": round(count / first, 4) if first else None
+        })
+        previous = count
+    return summary
+
+
+async def get_funnel_report(db,
+                            days: int = 30,
+                            entry_page: Optional[str] = None,
+                            top_pages: int = 10) -> Dict[str, Any]:
+    """Build a funnel report from the precomputed day/entry-page counters"""
+    end = datetime.utcnow()
+    start = end - timedelta(days=max(days, 1) - 1)
+    query = {
+        "day": {
+            "$gte": start.strftime("%Y-%m-%d"),
+            "$lte": end.strftime("%Y-%m-%d")
+        }
+    }
+    if entry_page:
+        query["entryPage"] = entry_page
+
+    totals: Dict[str, float] = {}
+    by_day: Dict[str, Dict[str, float]] = {}
+    by_page: Dict[str, Dict[str, float]] = {}
+    async for doc in db.analytics_funnels.find(query, {"_id": 0}):
+        for name, value in (doc.get("steps") or {}).items():
+            totals[name] = totals.get(name, 0) + value
+            day_counts = by_day.setdefault(doc["day"], {})
+            day_counts[name] = day_counts.get(name, 0) + value
+            page_counts = by_page.setdefault(doc["entryPage"], {})
+            page_counts[name] = page_counts.get(name, 0) + value
+
+    pages = sorted(by_page.items(),
+                   key=lambda item: item[1].get(FUNNEL_STEPS[0], 0),
+                   reverse=True)[:top_pages]
+
+    return {
+        "from": start.strftime("%Y-%m-%d"),
+        "to": end.strftime("%Y-%m-%d"),
+        "steps": _step_summary(totals),
+        "byDay": [{
+            "day": day,
+            "steps": _step_summary(counts)
+        } for day, counts in sorted(by_day.items())],
+        "byEntryPage": [{
+            "entryPage": page,
+            "steps": _step_summary(counts)
+        } for page, counts in pages]
+    }
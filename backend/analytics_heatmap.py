@@ -0,0 +1,227 @@
+"""
+Click heatmap aggregation
+Click positions from track_event are buffered in memory and binned in periodic
+batches into fixed grids per page and viewport class with NumPy. Each grid is
+stored as a compact uint32 count matrix in the `heatmaps` collection.
+"""
+
+import os
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime
+from typing import Optional, Dict, Any, List, Tuple
+
+import numpy as np
+from bson import Binary
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+HEATMAP_COLS = 50
+HEATMAP_ROWS = 100
+FLUSH_INTERVAL_SECONDS = int(os.environ.get("HEATMAP_FLUSH_SECONDS", "30"))
+MAX_BUFFERED_CLICKS = 50000
+MERGE_RETRIES = 5
+# Longer page keys are rejected rather than stored
+MAX_PAGE_LENGTH = 512
+
+# Upper bounds on viewport width (px) for each class
+VIEWPORT_CLASSES = [("mobile", 768), ("tablet", 1024), ("desktop", None)]
+VIEWPORT_NAMES = tuple(name for name, _ in VIEWPORT_CLASSES)
+
+
+def viewport_class(width: Optional[float]) -> str:
+    """Map a viewport width in pixels to mobile/tablet/desktop"""
+    if not width:
+        return "desktop"
+    for name, max_width in VIEWPORT_CLASSES:
+        if max_width is None or width < max_width:
+            return name
+    return "desktop"
+
+
+def _to_float(value) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def bin_clicks(points: np.ndarray,
+               weights: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Bin normalized (x, y) points into a flat HEATMAP_ROWS x HEATMAP_COLS grid
+    Points outside [0, 1] are clamped onto the border cells
+    """
+    cols = np.clip((points[:, 0] * HEATMAP_COLS).astype(np.int64), 0,
+                   HEATMAP_COLS - 1)
+    rows = np.clip((points[:, 1] * HEATMAP_ROWS).astype(np.int64), 0,
+                   HEATMAP_ROWS - 1)
+    counts = np.bincount(rows * HEATMAP_COLS + cols,
+                         weights=weights,
+                         minlength=HEATMAP_ROWS * HEATMAP_COLS)
+    return np.rint(counts).astype(np.uint32)
+
+
+class HeatmapAggregator:
+
+    def __init__(self):
+        self._buffer: Dict[Tuple[str, str],
+                           List[Tuple[float, float, float]]] = defaultdict(list)
+        self._buffered = 0
+        self._db = None
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+
+    def add_click(self,
+                  page: Optional[str],
+                  data: Optional[dict],
+                  weight: float = 1) -> bool:
+        """
+        Buffer a click from an analytics event payload
+        Expects `x`/`y` either as fractions of the page or in pixels together
+        with `viewportWidth`/`pageHeight`. `weight` scales sampled clicks back
+        up. Returns False if unusable.
+        """
+        if not isinstance(page, str) or not 0 < len(page) <= MAX_PAGE_LENGTH \
+                or not isinstance(data, dict):
+            return False
+        x = _to_float(data.get("x"))
+        y = _to_float(data.get("y"))
+        if x is None or y is None:
+            return False
+
+        width = _to_float(data.get("viewportWidth"))
+        height = _to_float(data.get("pageHeight"))
+        if width:
+            x /= width
+        if height:
+            y /= height
+        if not (0 <= x <= 1 and 0 <= y <= 1):
+            return False
+
+        # Client-supplied names are keys of stored grids: known classes only
+        viewport = data.get("viewport")
+        if viewport not in VIEWPORT_NAMES:
+            viewport = viewport_class(width)
+        self._buffer[(page, viewport)].append((x, y, weight))
+        self._buffered += 1
+
+        if self._buffered >= MAX_BUFFERED_CLICKS and self._db is not None:
+            asyncio.create_task(self.flush())
+        return True
+
+    async def flush(self):
+        """Bin all buffered clicks and merge them into the stored grids"""
+        if self._db is None:
+            return
+        async with self._flush_lock:
+            buffer, self._buffer = self._buffer, defaultdict(list)
+            self._buffered = 0
+            for (page, viewport), points in buffer.items():
+                points = np.asarray(points, dtype=np.float64)
+                delta = bin_clicks(points[:, :2], weights=points[:, 2])
+                try:
+                    await self._merge(page, viewport, delta,
+                                      int(round(points[:, 2].sum())))
+                except Exception as e:
+                    logger.error(f"Heatmap merge failed for {page}: {e}")
+
+    async def _merge(self, page: str, viewport: str, delta: np.ndarray,
+                     clicks: int):
+        # Optimistic read-modify-write so several workers can flush safely
+        key = {"page": page, "viewport": viewport}
+        for _ in range(MERGE_RETRIES):
+            now = datetime.utcnow()
+            doc = await self._db.heatmaps.find_one(key)
+            if doc is None:
+                try:
+                    await self._db.heatmaps.insert_one({
+                        **key, "rows": HEATMAP_ROWS,
+                        "cols": HEATMAP_COLS,
+                        "counts": Binary(delta.tobytes()),
+                        "total": clicks,
+                        "version": 1,
+                        "updatedAt": now
+                    })
+                    return
+                except DuplicateKeyError:
+                    continue
+
+            merged = np.frombuffer(doc["counts"], dtype=np.uint32) + delta
+            result = await self._db.heatmaps.update_one(
+                {
+                    "_id": doc["_id"],
+                    "version": doc["version"]
+                }, {
+                    "$set": {
+                        "counts": Binary(merged.tobytes()),
+                        "updatedAt": now
+                    },
+                    "$inc": {
+                        "total": clicks,
+                        "version": 1
+                    }
+                })
+            if result.modified_count:
+                return
+        logger.warning(f"Heatmap merge for {page} ({viewport}) gave up "
+                       f"after {MERGE_RETRIES} conflicting writes")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL_SECONDS)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Heatmap flush failed: {e}")
+
+    async def start(self, db):
+        """Create indexes and start the periodic flush loop"""
+        self._db = db
+        await db.heatmaps.create_index([("page", 1), ("viewport", 1)],
+                                       unique=True)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flush loop and write out whatever is still buffered"""
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+
+async def get_heatmap(db, page: str, viewport: str) -> Optional[Dict[str, Any]]:
+    """Load a stored grid as a rows x cols matrix for the dashboard"""
+    doc = await db.heatmaps.find_one({"page": page, "viewport": viewport})
+    if not doc:
+        return None
+    counts = np.frombuffer(doc["counts"], dtype=np.uint32).reshape(
+        doc["rows"], doc["cols"])
+    return {
+        "page": page,
+        "viewport": viewport,
+        "rows": doc["rows"],
+        "cols": doc["cols"],
+        "total": doc.get("total", 0),
+        "max": int(counts.max()) if counts.size else 0,
+        "counts": counts.tolist(),
+        "updatedAt": doc.get("updatedAt")
+    }
+
+
+async def list_heatmaps(db) -> List[Dict[str, Any]]:
+    """List available grids without loading their matrices"""
+    return await db.heatmaps.find({}, {
+        "_id": 0,
+        "page": 1,
+        "viewport": 1,
+        "total": 1,
+        "updatedAt": 1
+    }).sort("total", -1).to_list(1000)
+
+
+# Global aggregator instance (one per worker process)
+heatmap_aggregator = HeatmapAggregator()
@@ -0,0 +1,197 @@
+"""
+Real-user performance metrics (web vitals)
+Timing samples (LCP, FID, INP, CLS, TTFB, FCP) are folded into DDSketch
+quantile sketches per page, day and metric. Sketches are plain bucket counters
+updated with $inc, so they are mergeable across days and pages and percentiles
+never require the raw samples.
+"""
+
+import math
+import logging
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, List
+
+logger = logging.getLogger(__name__)
+
+VITAL_METRICS = {"LCP", "FID", "INP", "CLS", "TTFB", "FCP"}
+REPORT_QUANTILES = {"p50": 0.50, "p75": 0.75, "p95": 0.95}
+
+# Quantile estimates are within 1% of the true sample value
+RELATIVE_ACCURACY = 0.01
+MIN_INDEXABLE_VALUE = 1e-6
+
+
+class DDSketch:
+    """
+    Minimal DDSketch with logarithmic buckets
+    Bucket keys are integers; values at or below MIN_INDEXABLE_VALUE are kept
+    in a separate zero bucket (CLS is frequently exactly 0).
+    """
+
+    gamma = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+    _log_gamma = math.log(gamma)
+
+    def __init__(self):
+        self.bins: Dict[int, float] = {}
+        self.zero_count = 0.0
+        self.count = 0.0
+
+    @classmethod
+    def key(cls, value: float) -> Optional[int]:
+        """Bucket key for a value, or None for the zero bucket"""
+        if value <= MIN_INDEXABLE_VALUE:
+            return None
+        return math.ceil(math.log(value) / cls._log_gamma)
+
+    @classmethod
+    def bucket_value(cls, key: int) -> float:
+        return 2 * cls.gamma**key / (cls.gamma + 1)
+
+    def add(self, value: float, weight: float = 1):
+        key = self.key(value)
+        if key is None:
+            self.zero_count += weight
+        else:
+            self.bins[key] = self.bins.get(key, 0) + weight
+        self.count += weight
+
+    def merge_doc(self, doc: dict):
+        """Merge a stored sketch document into this sketch"""
+        for key, value in (doc.get("bins") or {}).items():
+            key = int(key)
+            self.bins[key] = self.bins.get(key, 0) + value
+        self.zero_count += doc.get("zeroCount", 0)
+        self.count += doc.get("count", 0)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if self.count <= 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if seen > rank:
+            return 0.0
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if seen > rank:
+                return self.bucket_value(key)
+        return self.bucket_value(max(self.bins)) if self.bins else 0.0
+
+
+async def ensure_vitals_indexes(db):
+    await db.web_vitals.create_index([("day", 1), ("page", 1), ("metric", 1)],
+                                     unique=True)
+
+
+async def record_vital(db,
+                       page: Optional[str],
+                       data: Optional[dict],
+                       weight: float = 1) -> bool:
+    """
+    Fold a web-vitals sample into today's sketch for its page and metric
+    Expects `data` shaped like the web-vitals callback: {name, value}.
+    Returns False if the sample is not usable.
+    """
+    if not isinstance(data, dict):
+        return False
+    metric = str(data.get("name", "")).upper()
+    try:
+        value = float(data.get("value"))
+    except (TypeError, ValueError):
+        return False
+    if metric not in VITAL_METRICS or value < 0 or not math.isfinite(value):
+        return False
+
+    key = DDSketch.key(value)
+    bucket = "zeroCount" if key is None else f"bins.{key}"
+    now = datetime.utcnow()
+    await db.web_vitals.update_one(
+        {
+            "day": now.strftime("%Y-%m-%d"),
+            "page": page or "unknown",
+            "metric": metric
+        }, {
+            "$inc": {
+                bucket: weight,
+                "count": weight,
+                "sum": value * weight
+            },
+            "$min": {
+                "min": value
+            },
+            "$max": {
+                "max": value
+            },
+            "$set": {
+                "updatedAt": now
+            }
+        },
+        upsert=True)
+    return True
+
+
+def _summarize(sketch: DDSketch, total: float, low: float,
+               high: float) -> Dict[str, Any]:
+    summary = {
+        name: sketch.quantile(q)
+        for name, q in REPORT_QUANTILES.items()
+    }
+    summary.update({
+        "count": round(sketch.count),
+        "mean": total / sketch.count if sketch.count else None,
+        "min": low,
+        "max": high
+    })
+    return summary
+
+
+async def get_vitals_report(db,
+                            days: int = 7,
+                            page: Optional[str] = None) -> Dict[str, Any]:
+    """Merge daily sketches into p50/p75/p95 per metric, overall and per page"""
+    end = datetime.utcnow()
+    start = end - timedelta(days=max(days, 1) - 1)
+    query = {
+        "day": {
+            "$gte": start.strftime("%Y-%m-%d"),
+            "$lte": end.strftime("%Y-%m-%d")
+        }
+    }
+    if page:
+        query["page"] = page
+
+    # (page or None, metric) -> [sketch, sum, min, max]
+    merged: Dict[tuple, list] = {}
+    async for doc in db.web_vitals.find(query):
+        for scope in (None, doc["page"]):
+            entry = merged.setdefault((scope, doc["metric"]),
+                                      [DDSketch(), 0.0, None, None])
+            entry[0].merge_doc(doc)
+            entry[1] += doc.get("sum", 0)
+            if doc.get("min") is not None:
+                entry[2] = doc["min"] if entry[2] is None else min(
+                    entry[2], doc["min"])
+            if doc.get("max") is not None:
+                entry[3] = doc["max"] if entry[3] is None else max(
+                    entry[3], doc["max"])
+
+    overall: Dict[str, Any] = {}
+    by_page: Dict[str, Dict[str, Any]] = {}
+    for (scope, metric), (sketch, total, low, high) in merged.items():
+        summary = _summarize(sketch, total, low, high)
+        if scope is None:
+            overall[metric] = summary
+        else:
+            by_page.setdefault(scope, {})[metric] = summary
+
+    pages: List[Dict[str, Any]] = [{
+        "page": name,
+        "metrics": metrics
+    } for name, metrics in sorted(by_page.items())]
+
+    return {
+        "from": start.strftime("%Y-%m-%d"),
+        "to": end.strftime("%Y-%m-%d"),
+        "relativeAccuracy": RELATIVE_ACCURACY,
+        "metrics": overall,
+        "pages": pages
+    }
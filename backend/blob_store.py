@@ -0,0 +1,162 @@
+"""
+Content-addressed upload storage
+Every uploaded file is stored once under the key blobs/ab/cd/<sha256>.<ext> of
+the configured storage backend (see storage.py) and described by a document
+in the `blobs` collection (_id = sha256) whose refCount tracks how many
+media/portfolio documents point at it. Uploading the same bytes again only
+bumps the reference count.
+"""
+
+import re
+import uuid
+import shutil
+import logging
+from contextlib import asynccontextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, Dict, Any, Tuple, AsyncIterator
+
+from fastapi import UploadFile
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from starlette.concurrency import run_in_threadpool
+
+from uploads import discard, stream_upload
+
+logger = logging.getLogger(__name__)
+
+BLOB_DIR = "blobs"
+INCOMING_DIR = ".incoming"
+SHA256_PATTERN = re.compile(r"[0-9a-f]{64}")
+_EXTENSION_PATTERN = re.compile(r"[a-z0-9]{1,8}")
+
+
+def blob_key(sha256: str, filename: Optional[str]) -> str:
+    """Storage key (path below /uploads/) for a blob"""
+    ext = Path(filename or "").suffix.lower().lstrip(".")
+    name = f"{sha256}.{ext}" if _EXTENSION_PATTERN.fullmatch(ext) else sha256
+    return f"{BLOB_DIR}/{sha256[:2]}/{sha256[2:4]}/{name}"
+
+
+def is_blob_path(path: Path) -> bool:
+    """True for files whose name is their own content hash"""
+    return BLOB_DIR in path.parts and bool(
+        SHA256_PATTERN.fullmatch(path.name.split(".")[0]))
+
+
+class BlobStore:
+
+    def __init__(self, storage, staging_root: Path):
+        self.storage = storage
+        # Local scratch space for uploads in flight and derived files
+        self.root = staging_root
+
+    def local_copy(self, blob: Dict[str, Any]) -> AsyncIterator[Path]:
+        """Readable local file with the blob's bytes (for processing)"""
+        return self.storage.local_copy(blob["key"])
+
+    @asynccontextmanager
+    async def scratch_dir(self) -> AsyncIterator[Path]:
+        """Temporary local directory, removed on exit"""
+        path = self.root / INCOMING_DIR / uuid.uuid4().hex
+        try:
+            yield path
+        finally:
+            await run_in_threadpool(shutil.rmtree, path, ignore_errors=True)
+
+    @staticmethod
+    def url(blob: Dict[str, Any]) -> str:
+        return f"/uploads/{blob['key']}"
+
+    async def ensure_indexes(self, db):
+        await db.blobs.create_index("refCount")
+        await db.media.create_index("blobId")
+        await db.portfolio.create_index("blobId")
+
+    async def acquire(self, db, sha256: str) -> Optional[Dict[str, Any]]:
+        """Add a reference to an existing blob, or return None if unknown"""
+        if not SHA256_PATTERN.fullmatch(sha256 or ""):
+            return None
+        blob = await db.blobs.find_one_and_update(
+            {"_id": sha256}, {
+                "$inc": {
+                    "refCount": 1
+                },
+                "$set": {
+                    "lastReferencedAt": datetime.utcnow()
+                }
+            },
+            return_document=ReturnDocument.AFTER)
+        if blob and not await self.storage.exists(blob["key"]):
+            # Bytes went missing (e.g. wiped disk); force a real upload
+            await self.release(db, sha256)
+            return None
+        return blob
+
+    async def release(self, db, sha256: Optional[str]):
+        """Drop a reference; unreferenced blobs are removed by the GC job"""
+        if sha256:
+            await db.blobs.update_one({"_id": sha256},
+                                      {"$inc": {
+                                          "refCount": -1
+                                      }})
+
+    async def store_upload(self, db,
+                           file: UploadFile) -> Tuple[Dict[str, Any], bool]:
+        """
+        Stream an upload into the store and take a reference to it
+        Returns (blob, created); `created` is False when identical bytes were
+        already stored and the new copy was discarded.
+        """
+        incoming = self.root / INCOMING_DIR
+        await run_in_threadpool(incoming.mkdir, parents=True, exist_ok=True)
+        tmp_path = incoming / uuid.uuid4().hex
+        stored = await stream_upload(file, tmp_path)
+        return await self.adopt(db, tmp_path, stored["sha256"],
+                                stored["size"], file.filename,
+                                file.content_type)
+
+    async def adopt(self, db, tmp_path: Path, sha256: str, size: int,
+                    filename: Optional[str],
+                    content_type: Optional[str]) -> Tuple[Dict[str, Any], bool]:
+        """
+        Move a fully written temporary file into storage (or discard it if
+        the content is already stored) and take a reference to the blob
+        """
+        existing = await self.acquire(db, sha256)
+        if existing:
+            await run_in_threadpool(discard, tmp_path)
+            return existing, False
+
+        blob = {
+            "_id": sha256,
+            "key": blob_key(sha256, filename),
+            "size": size,
+            "contentType": content_type,
+            "refCount": 1,
+            "createdAt": datetime.utcnow(),
+            "lastReferencedAt": datetime.utcnow()
+        }
+        try:
+            await self.storage.put_file(blob["key"], tmp_path, content_type)
+        except BaseException:
+            await run_in_threadpool(discard, tmp_path)
+            raise
+        try:
+            await db.blobs.insert_one(blob)
+        except DuplicateKeyError:
+            # Same bytes finished uploading concurrently, or the record
+            # outlived its file and the upload above has just restored it
+            placed = blob["key"]
+            blob = await db.blobs.find_one_and_update(
+                {"_id": sha256}, {"$inc": {
+                    "refCount": 1
+                }},
+                return_document=ReturnDocument.AFTER)
+            if placed != blob["key"]:
+                await self.storage.move(placed, blob["key"])
+        return blob, True
+
+    async def save_metadata(self, db, sha256: str, fields: Dict[str, Any]):
+        """Cache derived data (variants, dimensions) on the blob for reuse"""
+        await db.blobs.update_one({"_id": sha256}, {"$set": fields})
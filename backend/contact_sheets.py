@@ -0,0 +1,232 @@
+"""
+Contact sheets (sprite sheets) for the admin gallery grid
+A page of portfolio items is rendered into one or two sprite images of square
+thumbnails plus a coordinate map, so a grid of 100 images costs two requests
+instead of a hundred. Sheets are named by a hash of the page content (item
+ids, the images they show and the layout), so an unchanged page is served from
+cache and any edit, reorder or new upload yields a new name.
+
+Thumbnails are cut from the smallest stored variant that is large enough,
+falling back to the original. Rendering runs in the image process pool; sheets
+live in UPLOAD_DIR/.cache/sheets, a disk cache like the resize cache's (see
+disk_cache.py).
+
+Config (env):
+  CONTACT_SHEET_CACHE_MB  byte budget of the sheet cache (default 256)
+"""
+
+import os
+import json
+import uuid
+import asyncio
+import hashlib
+import logging
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Optional, Dict, Any, List, AsyncIterator
+
+from fastapi import HTTPException, Request
+from PIL import Image, ImageOps
+from starlette.responses import Response
+
+from disk_cache import DiskCache
+from image_variants import run_in_pool
+from storage import key_from_url
+from upload_serving import upload_response
+
+logger = logging.getLogger(__name__)
+
+CONTACT_SHEET_CACHE_BYTES = int(os.environ.get("CONTACT_SHEET_CACHE_MB",
+                                               "256")) * 1024 * 1024
+CACHE_DIR = ".cache/sheets"
+TILE_SIZES = (64, 96, 128, 160)
+COLUMNS = 10
+TILES_PER_SHEET = 100
+SHEET_FORMATS = {
+    "webp": {
+        "format": "WEBP",
+        "quality": 75,
+        "method": 4
+    },
+    "jpeg": {
+        "format": "JPEG",
+        "quality": 80,
+        "progressive": True
+    }
+}
+SOURCE_FORMATS = ("webp", "jpeg")
+EMPTY_TILE = (229, 231, 235)
+# Bump when the rendering changes so old sheets are not reused
+LAYOUT_VERSION = 1
+
+
+def render_contact_sheet(sources: List[Optional[str]], dest: str, tile: int,
+                         columns: int, fmt: str):
+    """Runs in a worker process: paste cover-cropped tiles into one sheet"""
+    rows = -(-len(sources) // columns)
+    sheet = Image.new("RGB", (columns * tile, rows * tile), EMPTY_TILE)
+    for index, src in enumerate(sources):
+        if src:
+            try:
+                with Image.open(src) as image:
+                    if image.format == "JPEG":
+                        image.draft("RGB", (tile * 2, tile * 2))
+                    image = ImageOps.exif_transpose(image)
+                    if image.mode not in ("RGB", "L"):
+                        background = Image.new("RGB", image.size, EMPTY_TILE)
+                        background.paste(image.convert("RGBA"),
+                                         mask=image.convert("RGBA").getchannel(
+                                             "A"))
+                        image = background
+                    thumb = ImageOps.fit(image.convert("RGB"), (tile, tile),
+                                         Image.LANCZOS)
+                sheet.paste(thumb,
+                            ((index % columns) * tile, (index // columns) * tile))
+            except Exception:
+                # Leave a blank tile rather than fail the whole page
+                pass
+
+    target = Path(dest)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_name(f".{target.name}.{uuid.uuid4().hex}")
+    sheet.save(tmp, **SHEET_FORMATS[fmt])
+    os.replace(tmp, target)
+
+
+def source_key(item: Dict[str, Any], tile: int) -> Optional[str]:
+    """Storage key of the smallest stored image that still fills a tile"""
+    candidates = [
+        variant for variant in item.get("variants") or []
+        if variant.get("format") in SOURCE_FORMATS
+        and min(variant["width"], variant["height"]) >= tile
+    ]
+    if candidates:
+        smallest = min(candidates, key=lambda variant: variant["width"])
+        return key_from_url(smallest["url"])
+    return key_from_url(item.get("image"))
+
+
+def page_hash(items: List[Dict[str, Any]], tile: int, fmt: str) -> str:
+    content = [LAYOUT_VERSION, tile, COLUMNS, TILES_PER_SHEET, fmt]
+    content.extend([str(item["_id"]), source_key(item, tile)] for item in items)
+    return hashlib.sha256(json.dumps(content).encode()).hexdigest()
+
+
+class ContactSheets:
+
+    def __init__(self,
+                 storage,
+                 root: Path,
+                 budget: int = CONTACT_SHEET_CACHE_BYTES):
+        self.storage = storage
+        self.root = root / CACHE_DIR
+        self.cache = DiskCache(self.root, budget)
+
+    @staticmethod
+    def validate(tile: int, fmt: str):
+        if tile not in TILE_SIZES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"size must be one of {', '.join(map(str, TILE_SIZES))}"
+            )
+        if fmt not in SHEET_FORMATS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"fmt must be one of {', '.join(SHEET_FORMATS)}")
+
+    @staticmethod
+    def sheet_name(digest: str, index: int, fmt: str) -> str:
+        return f"{digest}-{index}.{fmt}"
+
+    async def build(self, items: List[Dict[str, Any]], tile: int,
+                    fmt: str) -> Dict[str, Any]:
+        """Sheets and coordinate map for one page of portfolio items"""
+        self.validate(tile, fmt)
+        digest = page_hash(items, tile, fmt)
+        chunks = [
+            items[start:start + TILES_PER_SHEET]
+            for start in range(0, len(items), TILES_PER_SHEET)
+        ]
+        await asyncio.gather(*(self._sheet_once(
+            self.sheet_name(digest, index, fmt), chunk, tile, fmt)
+                               for index, chunk in enumerate(chunks)))
+
+        sheets, tiles = [], []
+        for index, chunk in enumerate(chunks):
+            rows = -(-len(chunk) // COLUMNS)
+            sheets.append({
+                "url": f"/img/sheets/{self.sheet_name(digest, index, fmt)}",
+                "width": COLUMNS * tile,
+                "height": rows * tile
+            })
+            for position, item in enumerate(chunk):
+                tiles.append({
+                    "id": str(item["_id"]),
+                    "sheet": index,
+                    "x": (position % COLUMNS) * tile,
+                    "y": (position // COLUMNS) * tile,
+                    # Not an uploaded file (e.g. an external URL): blank tile
+                    "missing": source_key(item, tile) is None
+                })
+        return {
+            "hash": digest,
+            "tileSize": tile,
+            "sheets": sheets,
+            "tiles": tiles
+        }
+
+    async def _sheet_once(self, name: str, items: List[Dict[str, Any]],
+                          tile: int, fmt: str):
+        """Render a sheet unless cached, sharing work between requests"""
+
+        async def render(dest: Path):
+            keys = [source_key(item, tile) for item in items]
+            try:
+                async with self._local_copies(keys) as sources:
+                    await run_in_pool(render_contact_sheet, sources, str(dest),
+                                      tile, COLUMNS, fmt)
+            except Exception as e:
+                logger.warning(f"Contact sheet {name} failed: {e}")
+                raise HTTPException(
+                    status_code=500,
+                    detail="Contact sheet could not be rendered")
+
+        await self.cache.ensure(name, render)
+
+    @asynccontextmanager
+    async def _local_copies(
+            self, keys: List[Optional[str]]) -> AsyncIterator[List[Optional[str]]]:
+        """Fetch every source concurrently and keep them until exit"""
+        paths: List[Optional[str]] = [None] * len(keys)
+        done = asyncio.Event()
+
+        async def hold(index: int, key: str, ready: asyncio.Event):
+            try:
+                async with self.storage.local_copy(key) as path:
+                    paths[index] = str(path)
+                    ready.set()
+                    await done.wait()
+            except FileNotFoundError:
+                pass
+            finally:
+                ready.set()
+
+        holders, readiness = [], []
+        for index, key in enumerate(keys):
+            if key:
+                ready = asyncio.Event()
+                readiness.append(ready)
+                holders.append(asyncio.create_task(hold(index, key, ready)))
+        try:
+            await asyncio.gather(*(ready.wait() for ready in readiness))
+            yield paths
+        finally:
+            done.set()
+            await asyncio.gather(*holders, return_exceptions=True)
+
+    async def response(self, request: Request, name: str) -> Response:
+        digest, _, rest = name.partition("-")
+        index, _, fmt = rest.partition(".")
+        if len(digest) != 64 or not index.isdigit() or fmt not in SHEET_FORMATS:
+            raise HTTPException(status_code=404, detail="Sheet not found")
+        return await upload_response(request, self.root, name)
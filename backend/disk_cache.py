@@ -0,0 +1,125 @@
+"""
+Disk caches for rendered files under UPLOAD_DIR/.cache
+Used by the resize cache (image_resize.py) and the contact sheets
+(contact_sheets.py). Entries are named by what they contain, so an existing
+file is always current. A missing entry is rendered once per process:
+concurrent requests for it wait for the first one instead of rendering it
+again. Each cache is kept under its byte budget by evicting the least
+recently used files; hits refresh the file mtime at most once per
+TOUCH_INTERVAL_SECONDS, so every worker process shares one LRU order.
+"""
+
+import os
+import time
+import asyncio
+import logging
+from pathlib import Path
+from typing import Optional, Dict, Callable, Awaitable
+
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+TOUCH_INTERVAL_SECONDS = 3600
+# Evict down to this fraction of the budget so eviction runs rarely
+LOW_WATER = 0.9
+
+
+def scan_and_evict(root: Path, budget: int) -> int:
+    """Total cache size after evicting least recently used files"""
+    entries = []
+    total = 0
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            if name.startswith("."):
+                continue
+            path = os.path.join(dirpath, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+    if total <= budget:
+        return total
+
+    entries.sort()
+    removed = 0
+    for _, size, path in entries:
+        if total <= budget * LOW_WATER:
+            break
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+    logger.info(f"Disk cache {root}: evicted {removed} files")
+    return total
+
+
+def cached_stat(path: Path) -> Optional[os.stat_result]:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    if time.time() - stat.st_mtime > TOUCH_INTERVAL_SECONDS:
+        os.utime(path)
+    return stat
+
+
+class DiskCache:
+
+    def __init__(self, root: Path, budget: int):
+        self.root = root
+        self.budget = budget
+        self.used: Optional[int] = None
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._evict_lock = asyncio.Lock()
+
+    async def ensure(self, name: str, render: Callable[[Path],
+                                                       Awaitable[None]]):
+        """
+        Make sure the entry `name` exists, calling `await render(path)` to
+        write it if it is missing; concurrent calls share one rendering
+        """
+        path = self.root / name
+        if await run_in_threadpool(cached_stat, path) is not None:
+            return
+        pending = self._inflight.get(name)
+        if pending is not None:
+            await asyncio.wait([pending])
+            if not pending.cancelled():
+                pending.result()
+                return
+            # The rendering request went away; render it here instead
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[name] = future
+        try:
+            await render(path)
+            future.set_result(None)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Waiters re-raise it; mark it retrieved for the common case
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(name, None)
+
+        size = (await run_in_threadpool(os.stat, path)).st_size
+        await self._enforce_budget(size)
+
+    async def _enforce_budget(self, added: int):
+        if self.used is not None:
+            self.used += added
+            if self.used <= self.budget:
+                return
+        async with self._evict_lock:
+            # Rescan rather than trust the counter: other workers share the
+            # cache directory
+            self.used = await run_in_threadpool(scan_and_evict, self.root,
+                                                self.budget)
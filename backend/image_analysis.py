@@ -0,0 +1,194 @@
+"""
+Background image analysis
+Each portfolio/media image is decoded once in the background (in the image
+process pool) after upload, producing:
+
+  placeholder  a tiny blurred WebP preview (16px wide, inlined as a base64
+               data URI) plus the intrinsic width/height, so the frontend can
+               reserve space and paint a preview without extra requests
+  metadata     orientation, camera/lens, capture time, exposure and dominant
+               colors (see image_metadata.py)
+  perceptualHash
+               pHash/dHash for near-duplicate detection (see image_hashes.py)
+
+Results are cached on the blob and copied onto every document pointing at it,
+except the feature vector behind "similar photos" (see image_features.py),
+which only lives on the blob.
+Both steps run as background jobs (see job_queue.py and the handlers in
+server.py).
+"""
+
+import io
+import base64
+import logging
+from datetime import timedelta
+from pathlib import Path
+from typing import Optional, Dict, Any
+
+from PIL import Image, ImageFilter
+
+from locks import acquire_lock, release_lock
+from storage import key_from_url
+from image_variants import upright, run_in_pool
+from image_metadata import read_exif, describe_image
+from image_hashes import perceptual_hash
+from image_features import feature_vector
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_FIELDS = ("placeholder", "metadata", "perceptualHash")
+BLOB_ONLY_FIELDS = ("features",)
+PLACEHOLDER_WIDTH = 16
+BACKFILL_BATCH_SIZE = 100
+BACKFILL_LOCK = timedelta(hours=1)
+
+def render_placeholder(image: Image.Image) -> str:
+    """Base64 WebP data URI of a tiny blurred copy of an upright image"""
+    preview_height = max(1,
+                         round(image.height * PLACEHOLDER_WIDTH / image.width))
+    preview = image.convert("RGB").resize((PLACEHOLDER_WIDTH, preview_height),
+                                          Image.BILINEAR,
+                                          reducing_gap=2.0)
+    preview = preview.filter(ImageFilter.GaussianBlur(0.6))
+    buffer = io.BytesIO()
+    preview.save(buffer, format="WEBP", quality=40)
+    encoded = base64.b64encode(buffer.getvalue()).decode("ascii")
+    return f"data:image/webp;base64,{encoded}"
+
+
+def analyze_image(src: str) -> Dict[str, Any]:
+    """Runs in a worker process: every analysis field from one decode"""
+    with Image.open(src) as raw:
+        exif_fields = read_exif(raw)
+        with upright(raw) as image:
+            return {
+                "width": image.width,
+                "height": image.height,
+                "placeholder": render_placeholder(image),
+                "metadata": describe_image(image, exif_fields),
+                "perceptualHash": perceptual_hash(image),
+                "features": feature_vector(image)
+            }
+
+
+async def create_analysis(path: Path) -> Optional[Dict[str, Any]]:
+    try:
+        return await run_in_pool(analyze_image, str(path))
+    except Exception as e:
+        logger.warning(f"Image analysis failed for {path.name}: {e}")
+        return None
+
+
+def _missing_filter() -> Dict[str, Any]:
+    return {"$or": [{field: {"$exists": False}} for field in ANALYSIS_FIELDS]}
+
+
+async def ensure_media_indexes(db):
+    """Indexes behind the media library filters (see get_all_media)"""
+    # _id breaks ties in every sort, so keyset pages can seek on the index
+    await db.media.create_index([("createdAt", -1), ("_id", -1)])
+    await db.media.create_index([("type", 1), ("createdAt", -1), ("_id", -1)])
+    await db.media.create_index([("metadata.capturedAt", -1), ("_id", -1)])
+    for field in ("metadata.camera", "metadata.lens", "metadata.orientation",
+                  "metadata.colorFamily"):
+        await db.media.create_index([(field, 1), ("createdAt", -1),
+                                     ("_id", -1)])
+    await db.media.create_index([("width", -1), ("_id", -1)])
+    await db.media.create_index([("size", -1), ("_id", -1)])
+
+
+def is_analyzed(blob: Dict[str, Any]) -> bool:
+    return all(field in blob for field in ANALYSIS_FIELDS + BLOB_ONLY_FIELDS)
+
+
+async def process_blob(db, blob_store, blob: Dict[str, Any]):
+    """Analyze a blob once and copy the results onto its documents"""
+    if is_analyzed(blob):
+        fields = {field: blob[field] for field in ANALYSIS_FIELDS}
+    else:
+        try:
+            async with blob_store.local_copy(blob) as path:
+                fields = await create_analysis(path)
+        except FileNotFoundError:
+            fields = None
+        if not fields:
+            # Not decodable; don't retry on every backfill
+            fields = {"analysisFailed": True}
+        await blob_store.save_metadata(db, blob["_id"], fields)
+        for field in BLOB_ONLY_FIELDS:
+            fields.pop(field, None)
+
+    missing = {"blobId": blob["_id"], **_missing_filter()}
+    await db.portfolio.update_many(missing, {"$set": fields})
+    await db.media.update_many(missing, {"$set": fields})
+
+
+async def backfill(db, blob_store) -> int:
+    """
+    Analyze existing images that are missing any analysis field
+    Runs in one worker at a time. Images hosted elsewhere (seed data on
+    external CDNs) are skipped because processing must stay offline.
+    """
+    if not await acquire_lock(db, "image_analysis_backfill", BACKFILL_LOCK):
+        return 0
+
+    processed = 0
+    # Blobs analyzed before a field was added (documents may be complete)
+    missing_on_blob = {
+        "$or": [{
+            field: {
+                "$exists": False
+            }
+        } for field in ANALYSIS_FIELDS + BLOB_ONLY_FIELDS]
+    }
+    async for blob in db.blobs.find({
+            **missing_on_blob, "refCount": {
+                "$gt": 0
+            },
+            "contentType": {
+                "$regex": "^image/"
+            },
+            "analysisFailed": {
+                "$exists": False
+            }
+    }).batch_size(BACKFILL_BATCH_SIZE):
+        await process_blob(db, blob_store, blob)
+        processed += 1
+
+    for collection, url_field in ((db.portfolio, "image"), (db.media, "url")):
+        cursor = collection.find(
+            {
+                **_missing_filter(), "analysisFailed": {
+                    "$ne": True
+                }
+            }, {
+                "blobId": 1,
+                url_field: 1
+            }).batch_size(BACKFILL_BATCH_SIZE)
+        async for doc in cursor:
+            if doc.get("blobId"):
+                blob = await db.blobs.find_one({"_id": doc["blobId"]})
+                if blob and "analysisFailed" not in blob and (
+                        blob.get("contentType") or "").startswith("image/"):
+                    await process_blob(db, blob_store, blob)
+                    processed += 1
+                continue
+
+            key = key_from_url(doc.get(url_field))
+            if key is None:
+                continue
+            try:
+                async with blob_store.storage.local_copy(key) as path:
+                    fields = await create_analysis(path)
+            except FileNotFoundError:
+                continue
+            if not fields:
+                fields = {"analysisFailed": True}
+            await collection.update_one({"_id": doc["_id"]}, {"$set": fields})
+            processed += 1
+
+    await release_lock(db, "image_analysis_backfill")
+    if processed:
+        logger.info(f"Analyzed {processed} images")
+    return processed
+
@@ -0,0 +1,204 @@
+"""
+"Similar photos" recommendations from compact image feature vectors
+Each image gets an 84-dimensional float32 vector, computed in the image
+process pool alongside the rest of the analysis (see image_analysis.py) and
+cached on its blob as raw bytes under `features`:
+
+  72  joint HSV color histogram (8 hue x 3 saturation x 3 value bins)
+   8  gradient orientation histogram, weighted by gradient magnitude
+   4  texture statistics: contrast, mean edge strength, edge density and
+      gray-level entropy
+
+Histograms are square-rooted (Hellinger) and the whole vector L2-normalized,
+so cosine similarity is a dot product. The index keeps every active portfolio
+item's vector in one float32 matrix per process and scores a query against
+all rows with a single matrix-vector product, which stays in the low
+milliseconds for tens of thousands of images. New items are appended as their
+analysis finishes; the matrix is reloaded every SIMILARITY_TTL seconds to pick
+up other processes' writes.
+"""
+
+import time
+import asyncio
+import logging
+from typing import Optional, Dict, Any, List, Set, Tuple
+
+import numpy as np
+from PIL import Image
+
+from image_hashes import ACTIVE_PORTFOLIO
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_SIZE = 64
+HUE_BINS, SATURATION_BINS, VALUE_BINS = 8, 3, 3
+ORIENTATION_BINS = 8
+EDGE_THRESHOLD = 0.1
+# Texture matters less than color for "looks similar"
+TEXTURE_WEIGHT = 0.5
+FEATURE_DIM = HUE_BINS * SATURATION_BINS * VALUE_BINS + ORIENTATION_BINS + 4
+SIMILARITY_TTL = 300
+
+
+def _bins(channel: np.ndarray, count: int) -> np.ndarray:
+    return np.minimum((channel.astype(np.int32) * count) // 256, count - 1)
+
+
+def feature_vector(image: Image.Image) -> bytes:
+    """Runs in a worker process on an upright image; float32 bytes"""
+    small = image.convert("RGB").resize((SAMPLE_SIZE, SAMPLE_SIZE),
+                                        Image.BILINEAR,
+                                        reducing_gap=2.0)
+
+    hsv = np.asarray(small.convert("HSV"))
+    color_bins = (_bins(hsv[..., 0], HUE_BINS) * SATURATION_BINS +
+                  _bins(hsv[..., 1], SATURATION_BINS)) * VALUE_BINS + _bins(
+                      hsv[..., 2], VALUE_BINS)
+    color = np.bincount(color_bins.ravel(),
+                        minlength=HUE_BINS * SATURATION_BINS * VALUE_BINS)
+    color = np.sqrt(color / color.sum())
+
+    gray = np.asarray(small.convert("L"), dtype=np.float32) / 255
+    gx = gray[:-1, 1:] - gray[:-1, :-1]
+    gy = gray[1:, :-1] - gray[:-1, :-1]
+    magnitude = np.hypot(gx, gy)
+    angle = np.mod(np.arctan2(gy, gx), np.pi)
+    orientation_bins = np.minimum((angle / np.pi * ORIENTATION_BINS).astype(
+        np.int32), ORIENTATION_BINS - 1)
+    orientation = np.bincount(orientation_bins.ravel(),
+                              weights=magnitude.ravel(),
+                              minlength=ORIENTATION_BINS)
+    total = orientation.sum()
+    orientation = np.sqrt(orientation / total) if total > 0 else orientation
+
+    levels = np.bincount((gray * 15.999).astype(np.int32).ravel(),
+                         minlength=16) / gray.size
+    levels = levels[levels > 0]
+    stats = np.array([
+        min(gray.std() * 2, 1.0),
+        min(magnitude.mean() * 4, 1.0),
+        (magnitude > EDGE_THRESHOLD).mean(),
+        -(levels * np.log2(levels)).sum() / 4
+    ])
+
+    vector = np.concatenate(
+        [color, TEXTURE_WEIGHT * orientation, TEXTURE_WEIGHT * stats])
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector = vector / norm
+    return vector.astype(np.float32).tobytes()
+
+
+def decode_vector(value) -> Optional[np.ndarray]:
+    """Vector stored on a blob, or None if missing or from another layout"""
+    if not isinstance(value, bytes) or len(value) != FEATURE_DIM * 4:
+        return None
+    return np.frombuffer(value, dtype=np.float32)
+
+
+class SimilarityIndex:
+
+    def __init__(self):
+        self._matrix = np.zeros((0, FEATURE_DIM), dtype=np.float32)
+        self._count = 0
+        self._ids: List[str] = []
+        self._blob_ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._blob_rows: Dict[str, List[int]] = {}
+        self._removed: Set[int] = set()
+        self._loaded_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def ensure_loaded(self, db, force: bool = False):
+        if not force and time.monotonic() - self._loaded_at < SIMILARITY_TTL:
+            return
+        async with self._lock:
+            if not force and time.monotonic(
+            ) - self._loaded_at < SIMILARITY_TTL:
+                return
+            items: List[Tuple[str, str]] = []
+            async for item in db.portfolio.find(
+                {
+                    **ACTIVE_PORTFOLIO, "blobId": {
+                        "$exists": True
+                    }
+                }, {"blobId": 1}):
+                items.append((str(item["_id"]), item["blobId"]))
+            vectors = {}
+            blob_ids = list({blob_id for _, blob_id in items})
+            for start in range(0, len(blob_ids), 1000):
+                async for blob in db.blobs.find(
+                    {"_id": {
+                        "$in": blob_ids[start:start + 1000]
+                    }}, {"features": 1}):
+                    vector = decode_vector(blob.get("features"))
+                    if vector is not None:
+                        vectors[blob["_id"]] = vector
+
+            self._reset()
+            for item_id, blob_id in items:
+                if blob_id in vectors:
+                    self._append(item_id, blob_id, vectors[blob_id])
+            self._loaded_at = time.monotonic()
+
+    def _reset(self):
+        self._matrix = np.zeros((0, FEATURE_DIM), dtype=np.float32)
+        self._count = 0
+        self._ids, self._blob_ids, self._rows = [], [], {}
+        self._blob_rows = {}
+        self._removed = set()
+
+    def _append(self, item_id: str, blob_id: str, vector: np.ndarray):
+        if item_id in self._rows:
+            self._matrix[self._rows[item_id]] = vector
+            self._removed.discard(self._rows[item_id])
+            return
+        if self._count == len(self._matrix):
+            # Grow geometrically so appends stay amortized O(1)
+            grown = np.zeros((max(64, 2 * self._count), FEATURE_DIM),
+                             dtype=np.float32)
+            grown[:self._count] = self._matrix[:self._count]
+            self._matrix = grown
+        self._matrix[self._count] = vector
+        self._rows[item_id] = self._count
+        self._ids.append(item_id)
+        self._blob_ids.append(blob_id)
+        self._blob_rows.setdefault(blob_id, []).append(self._count)
+        self._count += 1
+
+    async def add_blob(self, db, blob: Dict[str, Any]):
+        """Index the active portfolio items showing a freshly analyzed blob"""
+        vector = decode_vector(blob.get("features"))
+        if vector is None:
+            return
+        await self.ensure_loaded(db)
+        async for item in db.portfolio.find(
+            {
+                **ACTIVE_PORTFOLIO, "blobId": blob["_id"]
+            }, {"_id": 1}):
+            self._append(str(item["_id"]), blob["_id"], vector)
+
+    def discard(self, item_id: str):
+        """Stop recommending a deleted item (its row stays until reload)"""
+        row = self._rows.get(item_id)
+        if row is not None:
+            self._removed.add(row)
+
+    async def similar(self, db, item_id: str,
+                      limit: int) -> List[Tuple[str, float]]:
+        """(item id, cosine similarity) of the closest items, best first"""
+        await self.ensure_loaded(db)
+        row = self._rows.get(item_id)
+        if row is None or row in self._removed or limit <= 0:
+            return []
+        matrix = self._matrix[:self._count]
+        scores = matrix @ matrix[row]
+        # The item itself, other uploads of the same file and deleted rows
+        scores[self._blob_rows[self._blob_ids[row]]] = -np.inf
+        scores[list(self._removed)] = -np.inf
+
+        limit = min(limit, self._count)
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top])]
+        return [(self._ids[index], round(float(scores[index]), 4))
+                for index in top if np.isfinite(scores[index])]
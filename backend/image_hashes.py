@@ -0,0 +1,223 @@
+"""
+Perceptual hashes and near-duplicate lookup for portfolio images
+Two 64-bit hashes are computed in the image process pool alongside the rest
+of the analysis (see image_analysis.py) and stored as hex strings under
+`perceptualHash`:
+
+  phash  sign of the low-frequency 8x8 DCT block of a 32x32 grayscale copy
+         against its median; robust to re-encoding, resizing and small edits
+  dhash  sign of horizontal gradients on a 9x8 grayscale copy
+
+Near duplicates are found by Hamming distance between pHashes, using a BK-tree
+over the active portfolio kept in memory per process. It is filled from the
+`portfolio` collection on first use and refreshed every NEAR_DUPLICATE_TTL
+seconds, so items added by other processes show up within that window.
+
+Config (env):
+  NEAR_DUPLICATE_DISTANCE  max pHash bits that may differ (default 6 of 64)
+"""
+
+import os
+import time
+import asyncio
+import logging
+from typing import Optional, Dict, Any, List, Set, Tuple
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+NEAR_DUPLICATE_DISTANCE = int(os.environ.get("NEAR_DUPLICATE_DISTANCE", "6"))
+NEAR_DUPLICATE_TTL = 60
+PHASH_SIZE = 32
+HASH_SIZE = 8
+# Portfolio items the photo indexes cover, here and in image_features.py
+ACTIVE_PORTFOLIO = {"isActive": {"$ne": False}}
+
+# Orthonormal DCT-II basis, so the 2D transform is two matrix products
+_n = np.arange(PHASH_SIZE)
+_DCT = np.cos(np.pi * (2 * _n[None, :] + 1) * _n[:, None] / (2 * PHASH_SIZE))
+
+
+def _grayscale(image: Image.Image, size: Tuple[int, int]) -> np.ndarray:
+    small = image.convert("L").resize(size, Image.LANCZOS, reducing_gap=2.0)
+    return np.asarray(small, dtype=np.float32)
+
+
+def _pack(bits: np.ndarray) -> str:
+    value = 0
+    for bit in bits.flatten():
+        value = (value << 1) | int(bit)
+    return f"{value:016x}"
+
+
+def phash(image: Image.Image) -> str:
+    pixels = _grayscale(image, (PHASH_SIZE, PHASH_SIZE))
+    low = (_DCT @ pixels @ _DCT.T)[:HASH_SIZE, :HASH_SIZE]
+    # The DC term only encodes overall brightness
+    median = np.median(low.flatten()[1:])
+    return _pack(low > median)
+
+
+def dhash(image: Image.Image) -> str:
+    pixels = _grayscale(image, (HASH_SIZE + 1, HASH_SIZE))
+    return _pack(pixels[:, 1:] > pixels[:, :-1])
+
+
+def perceptual_hash(image: Image.Image) -> Dict[str, str]:
+    """Runs in a worker process on an upright image"""
+    return {"phash": phash(image), "dhash": dhash(image)}
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class BKTree:
+    """Metric tree over 64-bit hashes; each node holds the ids sharing a hash"""
+
+    def __init__(self):
+        # node: [hash, ids, {distance: child}]
+        self._root: Optional[list] = None
+
+    def add(self, value: int, item_id: str):
+        if self._root is None:
+            self._root = [value, {item_id}, {}]
+            return
+        node = self._root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                node[1].add(item_id)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, {item_id}, {}]
+                return
+            node = child
+
+    def search(self, value: int,
+               max_distance: int) -> List[Tuple[int, int, Set[str]]]:
+        """(distance, hash, ids) of every node within max_distance"""
+        found = []
+        stack = [self._root] if self._root else []
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= max_distance and node[1]:
+                found.append((distance, node[0], node[1]))
+            # Triangle inequality: only these subtrees can hold matches
+            for edge, child in node[2].items():
+                if distance - max_distance <= edge <= distance + max_distance:
+                    stack.append(child)
+        return found
+
+
+class NearDuplicateIndex:
+
+    def __init__(self):
+        self._tree = BKTree()
+        self._hashes: Dict[str, Tuple[int, int]] = {}
+        self._loaded_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def ensure_loaded(self, db, force: bool = False):
+        if not force and time.monotonic() - self._loaded_at < NEAR_DUPLICATE_TTL:
+            return
+        async with self._lock:
+            if not force and time.monotonic(
+            ) - self._loaded_at < NEAR_DUPLICATE_TTL:
+                return
+            tree, hashes = BKTree(), {}
+            async for item in db.portfolio.find(
+                {
+                    **ACTIVE_PORTFOLIO, "perceptualHash": {
+                        "$exists": True
+                    }
+                }, {"perceptualHash": 1}):
+                item_id = str(item["_id"])
+                value = item["perceptualHash"]
+                hashes[item_id] = (int(value["phash"],
+                                       16), int(value["dhash"], 16))
+                tree.add(hashes[item_id][0], item_id)
+            self._tree, self._hashes = tree, hashes
+            self._loaded_at = time.monotonic()
+
+    def add(self, item_id: str, value: Dict[str, str]):
+        self._hashes[item_id] = (int(value["phash"], 16),
+                                 int(value["dhash"], 16))
+        self._tree.add(self._hashes[item_id][0], item_id)
+
+    def discard(self, item_id: str):
+        """Forget a deleted item (its tree node stays, with one id fewer)"""
+        hashes = self._hashes.pop(item_id, None)
+        if hashes:
+            for _, _, ids in self._tree.search(hashes[0], 0):
+                ids.discard(item_id)
+
+    def lookup(self,
+               value: Dict[str, str],
+               max_distance: int = NEAR_DUPLICATE_DISTANCE,
+               exclude: Set[str] = frozenset()) -> List[Dict[str, Any]]:
+        """Indexed items whose pHash is within max_distance, closest first"""
+        target = int(value["phash"], 16), int(value["dhash"], 16)
+        matches = []
+        for distance, _, ids in self._tree.search(target[0], max_distance):
+            for item_id in ids - exclude:
+                matches.append({
+                    "id": item_id,
+                    "distance": distance,
+                    "dhashDistance": hamming(target[1],
+                                             self._hashes[item_id][1])
+                })
+        matches.sort(key=lambda match: (match["distance"],
+                                        match["dhashDistance"]))
+        return matches
+
+    async def flag(self, db, item: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Record an item's near duplicates on it and add it to the index"""
+        await self.ensure_loaded(db)
+        item_id = str(item["_id"])
+        matches = self.lookup(item["perceptualHash"], exclude={item_id})
+        await db.portfolio.update_one({"_id": item["_id"]},
+                                      {"$set": {
+                                          "nearDuplicates": matches
+                                      }})
+        self.add(item_id, item["perceptualHash"])
+        if matches:
+            logger.info(f"Portfolio item {item_id} has {len(matches)} "
+                        f"near duplicates")
+        return matches
+
+    async def groups(self,
+                     db,
+                     max_distance: int = NEAR_DUPLICATE_DISTANCE
+                     ) -> List[List[Dict[str, Any]]]:
+        """Clusters of mutually reachable near duplicates across the portfolio"""
+        await self.ensure_loaded(db, force=True)
+        parent = {item_id: item_id for item_id in self._hashes}
+
+        def find(item_id):
+            while parent[item_id] != item_id:
+                parent[item_id] = parent[parent[item_id]]
+                item_id = parent[item_id]
+            return item_id
+
+        pairs: Dict[str, Dict[str, int]] = {}
+        for item_id, (value, _) in self._hashes.items():
+            for distance, _, ids in self._tree.search(value, max_distance):
+                for other in ids:
+                    if other != item_id and other in parent:
+                        parent[find(other)] = find(item_id)
+                        pairs.setdefault(item_id, {})[other] = distance
+
+        clusters: Dict[str, List[str]] = {}
+        for item_id in parent:
+            clusters.setdefault(find(item_id), []).append(item_id)
+        return [[{
+            "id": item_id,
+            "closest": min(pairs[item_id].values())
+        } for item_id in members]
+                for members in clusters.values()
+                if len(members) > 1]
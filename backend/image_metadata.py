@@ -0,0 +1,146 @@
+"""
+Image metadata extraction
+Reads layout orientation, camera/lens, capture time and exposure settings from
+EXIF, and the dominant colors from a small downscaled copy. The functions run
+in the image process pool (see image_analysis.py); results are stored under
+`metadata` on media/portfolio documents.
+"""
+
+import colorsys
+from datetime import datetime
+from typing import Optional, Dict, Any, List
+
+from PIL import Image
+
+DOMINANT_COLORS = 5
+COLOR_SAMPLE_SIZE = 64
+
+# EXIF tags (base IFD and Exif sub-IFD)
+TAG_MAKE = 0x010F
+TAG_MODEL = 0x0110
+TAG_ORIENTATION = 0x0112
+TAG_EXIF_IFD = 0x8769
+TAG_EXPOSURE_TIME = 0x829A
+TAG_F_NUMBER = 0x829D
+TAG_ISO = 0x8827
+TAG_DATETIME_ORIGINAL = 0x9003
+TAG_FOCAL_LENGTH = 0x920A
+TAG_LENS_MODEL = 0xA434
+
+
+def _text(value) -> Optional[str]:
+    if isinstance(value, bytes):
+        value = value.decode("utf-8", "ignore")
+    if not isinstance(value, str):
+        return None
+    value = value.strip("\x00 ").strip()
+    return value or None
+
+
+def _number(value) -> Optional[float]:
+    if isinstance(value, tuple):
+        value = value[0] if value else None
+    try:
+        number = float(value)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None
+    return round(number, 4) if number == number else None
+
+
+def _captured_at(value) -> Optional[datetime]:
+    text = _text(value)
+    if not text:
+        return None
+    try:
+        return datetime.strptime(text[:19], "%Y:%m:%d %H:%M:%S")
+    except ValueError:
+        return None
+
+
+def camera_name(make: Optional[str], model: Optional[str]) -> Optional[str]:
+    """'Canon' + 'Canon EOS R5' -> 'Canon EOS R5'"""
+    if make and model and model.lower().startswith(make.split()[0].lower()):
+        return model
+    return " ".join(part for part in (make, model) if part) or None
+
+
+def read_exif(image: Image.Image) -> Dict[str, Any]:
+    """Camera fields from EXIF; call before the image is transposed"""
+    exif = image.getexif()
+    details = exif.get_ifd(TAG_EXIF_IFD)
+    fields = {
+        "exifOrientation": exif.get(TAG_ORIENTATION),
+        "camera": camera_name(_text(exif.get(TAG_MAKE)),
+                              _text(exif.get(TAG_MODEL))),
+        "lens": _text(details.get(TAG_LENS_MODEL)),
+        "capturedAt": _captured_at(details.get(TAG_DATETIME_ORIGINAL)),
+        "iso": _number(details.get(TAG_ISO)),
+        "focalLength": _number(details.get(TAG_FOCAL_LENGTH)),
+        "fNumber": _number(details.get(TAG_F_NUMBER)),
+        "exposureTime": _number(details.get(TAG_EXPOSURE_TIME)),
+    }
+    return {key: value for key, value in fields.items() if value is not None}
+
+
+def layout_orientation(width: int, height: int) -> str:
+    if abs(width - height) <= max(width, height) * 0.02:
+        return "square"
+    return "landscape" if width > height else "portrait"
+
+
+def color_family(rgb) -> str:
+    """Coarse, indexable name for a color (used for filtering)"""
+    hue, saturation, value = colorsys.rgb_to_hsv(*(c / 255 for c in rgb))
+    if value < 0.18:
+        return "black"
+    if saturation < 0.18:
+        return "white" if value > 0.85 else "gray"
+    degrees = hue * 360
+    if degrees < 15 or degrees >= 345:
+        return "red"
+    if degrees < 45:
+        return "orange" if value >= 0.6 else "brown"
+    if degrees < 70:
+        return "yellow"
+    if degrees < 165:
+        return "green"
+    if degrees < 195:
+        return "cyan"
+    if degrees < 255:
+        return "blue"
+    if degrees < 290:
+        return "purple"
+    return "pink"
+
+
+def dominant_colors(image: Image.Image) -> List[Dict[str, Any]]:
+    """Most common colors of an upright RGB/RGBA image, largest share first"""
+    sample = image.convert("RGB")
+    sample.thumbnail((COLOR_SAMPLE_SIZE, COLOR_SAMPLE_SIZE), Image.BILINEAR)
+    quantized = sample.quantize(colors=DOMINANT_COLORS,
+                                method=Image.Quantize.MEDIANCUT)
+    palette = quantized.getpalette()
+    counts = sorted(quantized.getcolors(), reverse=True)
+    total = sum(count for count, _ in counts)
+    colors = []
+    for count, index in counts:
+        rgb = tuple(palette[index * 3:index * 3 + 3])
+        colors.append({
+            "hex": "#{:02x}{:02x}{:02x}".format(*rgb),
+            "share": round(count / total, 3),
+            "family": color_family(rgb)
+        })
+    return colors
+
+
+def describe_image(image: Image.Image, exif_fields: Dict[str, Any]) -> Dict[
+        str, Any]:
+    """Metadata document for an upright image plus its EXIF fields"""
+    colors = dominant_colors(image)
+    return {
+        **exif_fields,
+        "orientation": layout_orientation(*image.size),
+        "colors": colors,
+        "dominantColor": colors[0]["hex"] if colors else None,
+        "colorFamily": colors[0]["family"] if colors else None,
+    }
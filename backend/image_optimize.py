@@ -0,0 +1,371 @@
+"""
+Lossless re-optimization of stored uploads
+Older uploads were stored exactly as received: unoptimized Huffman tables,
+embedded EXIF thumbnails, XMP packets. This pass recompresses JPEG and PNG
+blobs without changing a single decoded pixel:
+
+  JPEG  jpegtran -optimize -progressive (when jpegtran is installed)
+  PNG   re-encoded by Pillow with optimize=True (same mode, palette,
+        transparency and color profile)
+
+and can optionally strip metadata. Stripping keeps everything that affects
+how the image looks: the ICC profile, the Adobe marker (CMYK JPEGs) and the
+EXIF orientation, which is rewritten as a minimal EXIF block. The metadata
+shown in the admin was already extracted at upload (see image_analysis.py).
+
+Every candidate is decoded before and after and only replaced when the pixels
+are identical and the file got smaller. Files are processed in the image
+process pool, one per worker, and the new bytes are written over the same
+key, so every URL (including ones embedded in HTML) keeps working. The blob
+id stays the hash of the uploaded bytes, which is what deduplication compares
+against; `optimized` on the blob records the outcome, the hash of the stored
+bytes and the sizes. Blobs that already carry it are skipped, so an
+interrupted run simply resumes. Each run stores a per-file before/after
+report in `maintenance_reports`.
+"""
+
+import io
+import os
+import uuid
+import struct
+import shutil
+import asyncio
+import hashlib
+import logging
+import subprocess
+from datetime import datetime
+from typing import Dict, Any
+
+from PIL import Image
+from PIL.PngImagePlugin import PngInfo
+
+from image_variants import run_in_pool, IMAGE_WORKERS
+
+logger = logging.getLogger(__name__)
+
+OPTIMIZABLE_TYPES = ("image/jpeg", "image/png")
+OPTIMIZE_BATCH_SIZE = 100
+REPORT_FILE_LIMIT = 10000
+JPEGTRAN_TIMEOUT = 120
+# APPn segments that change how a JPEG is displayed
+KEPT_JPEG_SEGMENTS = ((0xE0, b"JFIF\0"), (0xE2, b"ICC_PROFILE\0"),
+                      (0xEE, b"Adobe"))
+ORIENTATION_TAG = 0x0112
+
+
+def _segments(data: bytes):
+    """(marker, segment bytes) up to the first SOS, then (None, the rest)"""
+    position = 2
+    while position < len(data):
+        if data[position] != 0xFF:
+            raise ValueError("Corrupt JPEG marker")
+        marker = data[position + 1]
+        if marker == 0xFF:
+            # Fill byte
+            position += 1
+            continue
+        if 0xD0 <= marker <= 0xD8 or marker == 0x01:
+            yield marker, data[position:position + 2]
+            position += 2
+            continue
+        length = struct.unpack(">H", data[position + 2:position + 4])[0]
+        if marker == 0xDA:
+            yield None, data[position:]
+            return
+        yield marker, data[position:position + 2 + length]
+        position += 2 + length
+
+
+def _orientation_segment(orientation: int) -> bytes:
+    exif = Image.Exif()
+    exif[ORIENTATION_TAG] = orientation
+    payload = exif.tobytes()
+    return b"\xff\xe1" + struct.pack(">H", len(payload) + 2) + payload
+
+
+def strip_jpeg_metadata(data: bytes, orientation: int) -> bytes:
+    """JPEG bytes without EXIF/XMP/IPTC/comments and trailing data"""
+    if data[:2] != b"\xff\xd8":
+        raise ValueError("Not a JPEG")
+    parts = [data[:2]]
+    for marker, segment in _segments(data):
+        if marker is None:
+            # Drop whatever follows the image (MPF pages, vendor trailers)
+            end = segment.find(b"\xff\xd9")
+            parts.append(segment[:end + 2] if end >= 0 else segment)
+            break
+        if 0xE0 <= marker <= 0xEF or marker == 0xFE:
+            if any(marker == kept and segment[4:4 + len(signature)] ==
+                   signature for kept, signature in KEPT_JPEG_SEGMENTS):
+                parts.append(segment)
+            continue
+        parts.append(segment)
+    if orientation != 1:
+        # EXIF goes right after SOI (and the JFIF header, if any)
+        jfif = len(parts) > 1 and parts[1][4:9] == b"JFIF\0"
+        parts.insert(2 if jfif else 1, _orientation_segment(orientation))
+    return b"".join(parts)
+
+
+def _pixels(data: bytes) -> bytes:
+    with Image.open(io.BytesIO(data)) as image:
+        image.load()
+        if image.mode == "P":
+            # Palette order may change; compare the colors shown
+            image = image.convert("RGBA")
+        return image.mode.encode() + struct.pack(">II", *
+                                                 image.size) + image.tobytes()
+
+
+def _jpegtran(data: bytes, tool: str) -> bytes:
+    completed = subprocess.run(
+        [tool, "-copy", "all", "-optimize", "-progressive"],
+        input=data,
+        capture_output=True,
+        timeout=JPEGTRAN_TIMEOUT,
+        check=True)
+    return completed.stdout
+
+
+def _optimize_jpeg(data: bytes, image: Image.Image, strip: bool):
+    """(new bytes or None, tool or skip reason)"""
+    tool = shutil.which("jpegtran")
+    if tool is None and not strip:
+        return None, "jpegtran not installed"
+    optimized, steps = data, []
+    if tool is not None:
+        optimized = _jpegtran(optimized, tool)
+        steps.append("jpegtran")
+    if strip:
+        orientation = image.getexif().get(ORIENTATION_TAG, 1)
+        optimized = strip_jpeg_metadata(optimized, orientation)
+        steps.append("strip")
+    return optimized, "+".join(steps)
+
+
+def _optimize_png(data: bytes, image: Image.Image, strip: bool):
+    if getattr(image, "n_frames", 1) > 1:
+        return None, "animated"
+    # IHDR bit depth; Pillow would reduce 16-bit color to 8 bits
+    if data[24] == 16:
+        return None, "16-bit"
+    if "gamma" in image.info or "chromaticity" in image.info:
+        # Pillow cannot write gAMA/cHRM back
+        return None, "gamma"
+
+    options = {"format": "PNG", "optimize": True}
+    for field in ("transparency", "icc_profile", "dpi"):
+        if image.info.get(field) is not None:
+            options[field] = image.info[field]
+    exif = image.getexif()
+    if exif and not strip:
+        options["exif"] = exif.tobytes()
+    elif exif.get(ORIENTATION_TAG, 1) != 1:
+        options["exif"] = Image.Exif()
+        options["exif"][ORIENTATION_TAG] = exif[ORIENTATION_TAG]
+    if not strip and getattr(image, "text", None):
+        info = PngInfo()
+        for key, value in image.text.items():
+            info.add_itxt(key, value)
+        options["pnginfo"] = info
+
+    buffer = io.BytesIO()
+    image.save(buffer, **options)
+    return buffer.getvalue(), "pillow" + ("+strip" if strip else "")
+
+
+def optimize_file(src: str, dest: str, strip: bool) -> Dict[str, Any]:
+    """
+    Runs in a worker process: losslessly recompress `src` into `dest`
+    `dest` is only written when the result is smaller with identical pixels.
+    """
+    with open(src, "rb") as f:
+        data = f.read()
+    result = {"before": len(data), "after": len(data)}
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            if image.format == "JPEG":
+                optimized, tool = _optimize_jpeg(data, image, strip)
+            elif image.format == "PNG":
+                image.load()
+                optimized, tool = _optimize_png(data, image, strip)
+            else:
+                return {**result, "status": "skipped", "reason": image.format}
+    except Exception as e:
+        return {**result, "status": "failed", "reason": str(e)[:200]}
+    if optimized is None:
+        return {**result, "status": "skipped", "reason": tool}
+    result["tool"] = tool
+    if len(optimized) >= len(data):
+        return {**result, "status": "unchanged"}
+    try:
+        if _pixels(optimized) != _pixels(data):
+            return {**result, "status": "failed", "reason": "pixels changed"}
+    except Exception as e:
+        return {**result, "status": "failed", "reason": str(e)[:200]}
+
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    with open(dest, "wb") as f:
+        f.write(optimized)
+    return {
+        **result, "status": "optimized",
+        "after": len(optimized),
+        "sha256": hashlib.sha256(optimized).hexdigest()
+    }
+
+
+class UploadOptimizer:
+
+    def __init__(self, blob_store):
+        self.blob_store = blob_store
+
+    @staticmethod
+    def pending_filter(strip: bool) -> Dict[str, Any]:
+        """Blobs this kind of run has not handled yet"""
+        done = {"optimized.stripped": {"$ne": True}} if strip else {
+            "optimized": {
+                "$exists": False
+            }
+        }
+        return {
+            **done, "refCount": {
+                "$gt": 0
+            },
+            "contentType": {
+                "$in": list(OPTIMIZABLE_TYPES)
+            }
+        }
+
+    async def run(self,
+                  db,
+                  strip: bool = False,
+                  dry_run: bool = False) -> Dict[str, Any]:
+        """Optimize every pending blob; returns the report"""
+        report = {
+            "type": "upload_optimize",
+            "dryRun": dry_run,
+            "stripMetadata": strip,
+            "startedAt": datetime.utcnow(),
+            "scanned": 0,
+            "optimized": 0,
+            "unchanged": 0,
+            "skipped": 0,
+            "failed": 0,
+            "bytesBefore": 0,
+            "bytesAfter": 0
+        }
+        # Stored as it goes so an interrupted run still leaves its numbers
+        report_id = (await db.maintenance_reports.insert_one({
+            **report, "files": []
+        })).inserted_id
+        slots = asyncio.Semaphore(IMAGE_WORKERS)
+        last_id = ""
+        while True:
+            # Keyset pages: blobs skipped without a mark are not revisited
+            batch = await db.blobs.find({
+                **self.pending_filter(strip), "_id": {
+                    "$gt": last_id
+                }
+            }).sort("_id", 1).to_list(OPTIMIZE_BATCH_SIZE)
+            if not batch:
+                break
+            last_id = batch[-1]["_id"]
+            files = await asyncio.gather(
+                *(self._optimize_blob(db, blob, strip, dry_run, slots)
+                  for blob in batch))
+            counts = {"scanned": len(files), "bytesBefore": 0, "bytesAfter": 0}
+            for entry in files:
+                counts[entry["status"]] = counts.get(entry["status"], 0) + 1
+                counts["bytesBefore"] += entry["before"]
+                counts["bytesAfter"] += entry["after"]
+                report[entry["status"]] += 1
+            for field in ("scanned", "bytesBefore", "bytesAfter"):
+                report[field] += counts[field]
+            await db.maintenance_reports.update_one({"_id": report_id}, {
+                "$inc": counts,
+                "$push": {
+                    "files": {
+                        "$each": files,
+                        "$slice": REPORT_FILE_LIMIT
+                    }
+                }
+            })
+
+        report["finishedAt"] = datetime.utcnow()
+        report["bytesSaved"] = report["bytesBefore"] - report["bytesAfter"]
+        await db.maintenance_reports.update_one({"_id": report_id}, {
+            "$set": {
+                "finishedAt": report["finishedAt"],
+                "bytesSaved": report["bytesSaved"],
+                "filesTruncated": report["scanned"] > REPORT_FILE_LIMIT
+            }
+        })
+        logger.info(f"Upload optimization: {report['optimized']} of "
+                    f"{report['scanned']} files, {report['bytesSaved']} "
+                    f"bytes saved")
+        return report
+
+    async def _optimize_blob(self, db, blob: Dict[str, Any], strip: bool,
+                             dry_run: bool,
+                             slots: asyncio.Semaphore) -> Dict[str, Any]:
+        entry = {"blobId": blob["_id"], "key": blob["key"]}
+        # Problems that may go away (file restored, storage back, jpegtran
+        # installed) leave the blob unmarked for the next run
+        retry = dry_run
+        async with slots:
+            try:
+                async with self.blob_store.local_copy(blob) as src, \
+                        self.blob_store.scratch_dir() as out_dir:
+                    dest = out_dir / uuid.uuid4().hex
+                    result = await run_in_pool(optimize_file, str(src),
+                                               str(dest), strip)
+                    if result["status"] == "optimized" and not dry_run:
+                        await self.blob_store.storage.put_file(
+                            blob["key"], dest, blob.get("contentType"))
+            except Exception as e:
+                if not isinstance(e, FileNotFoundError):
+                    logger.warning(f"Optimizing {blob['key']} failed: {e}")
+                result = {
+                    "status": "failed",
+                    "reason": "missing" if isinstance(e, FileNotFoundError)
+                    else str(e)[:200],
+                    "before": blob["size"],
+                    "after": blob["size"]
+                }
+                retry = True
+        entry.update(status=result["status"],
+                     before=result["before"],
+                     after=result["after"])
+        if "reason" in result:
+            entry["reason"] = result["reason"]
+        if not retry and result.get("reason") != "jpegtran not installed":
+            await self._record(db, blob, strip, result)
+        return entry
+
+    async def _record(self, db, blob: Dict[str, Any], strip: bool,
+                      result: Dict[str, Any]):
+        previous = blob.get("optimized") or {}
+        mark = {
+            "status": result["status"],
+            "stripped": strip,
+            "originalSize": previous.get("originalSize", result["before"]),
+            "size": result["after"],
+            "at": datetime.utcnow()
+        }
+        for field in ("tool", "reason"):
+            if field in result:
+                mark[field] = result[field]
+        update: Dict[str, Any] = {"$set": {"optimized": mark}}
+        if result["status"] == "optimized":
+            mark["sha256"] = result["sha256"]
+            update["$set"]["size"] = result["after"]
+            # Stale once the stored bytes change (see zip_stream.py)
+            update["$unset"] = {"crc32": ""}
+        await db.blobs.update_one({"_id": blob["_id"]}, update)
+        if result["status"] == "optimized":
+            for collection in (db.media, db.portfolio):
+                await collection.update_many(
+                    {"blobId": blob["_id"]},
+                    {"$set": {
+                        "size": result["after"]
+                    }})
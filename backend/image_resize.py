@@ -0,0 +1,178 @@
+"""
+On-the-fly image resizing
+GET /img/{blobId}?w=&h=&fit=&fmt= renders a size of an uploaded image from the
+original in the image process pool and keeps the result in a disk cache, so
+later requests are plain static file responses. Only widths/heights from
+IMAGE_RESIZE_SIZES are accepted, which bounds the number of cache entries per
+image.
+
+The cache lives in UPLOAD_DIR/.cache/img and is kept under IMAGE_CACHE_MB by
+evicting the least recently used files (see disk_cache.py).
+
+Config (env):
+  IMAGE_RESIZE_SIZES  comma-separated allowed values for w and h
+  IMAGE_CACHE_MB      byte budget of the resize cache (default 1024)
+"""
+
+import os
+import math
+import uuid
+import logging
+from pathlib import Path
+from typing import Optional
+
+from fastapi import HTTPException, Request
+from PIL import Image, ImageOps, features
+from starlette.responses import Response
+
+from blob_store import SHA256_PATTERN
+from disk_cache import DiskCache
+from image_variants import SAVE_OPTIONS, run_in_pool
+from upload_serving import (upload_response, CACHE_CONTROL,
+                            PRIVATE_CACHE_CONTROL)
+
+logger = logging.getLogger(__name__)
+
+RESIZE_SIZES = frozenset(
+    int(s) for s in os.environ.get(
+        "IMAGE_RESIZE_SIZES",
+        "64,128,160,256,320,480,640,800,1024,1280,1600,1920,2048").split(",")
+    if s.strip())
+IMAGE_CACHE_BYTES = int(os.environ.get("IMAGE_CACHE_MB", "1024")) * 1024 * 1024
+CACHE_DIR = ".cache/img"
+FITS = ("contain", "cover")
+
+RESIZE_SAVE_OPTIONS = {
+    **SAVE_OPTIONS,
+    "jpeg": {
+        "format": "JPEG",
+        "quality": 82,
+        "progressive": True,
+        "optimize": True
+    },
+    "png": {
+        "format": "PNG",
+        "optimize": True
+    },
+}
+
+
+def resize_formats():
+    return [
+        fmt for fmt in RESIZE_SAVE_OPTIONS
+        if fmt != "avif" or features.check("avif")
+    ]
+
+
+def resize_image(src: str, dest: str, width: int, height: int, fit: str,
+                 fmt: str):
+    """Runs in a worker process: render one size and atomically write it"""
+    with Image.open(src) as image:
+        if image.format == "JPEG":
+            # Let libjpeg decode at 1/2, 1/4 or 1/8 scale when that is still
+            # large enough; by far the most expensive step for big originals
+            w, h = image.size
+            if image.getexif().get(0x0112, 1) in (5, 6, 7, 8):
+                w, h = h, w
+            scale = (max(width / w, height / h) if fit == "cover" else min(
+                width / w if width else 1, height / h if height else 1))
+            side = math.ceil(max(w, h) * min(scale, 1))
+            image.draft("RGB", (side, side))
+        image = ImageOps.exif_transpose(image)
+
+        if fit == "cover":
+            # Never upscale: shrink the box, keeping its aspect ratio
+            shrink = min(image.width / width, image.height / height, 1)
+            box = (max(1, round(width * shrink)), max(1, round(height * shrink)))
+            image = ImageOps.fit(image, box, Image.LANCZOS)
+        else:
+            image.thumbnail((width or image.width, height or image.height),
+                            Image.LANCZOS,
+                            reducing_gap=3.0)
+
+        has_alpha = "A" in image.getbands() or "transparency" in image.info
+        if fmt == "jpeg" or not has_alpha:
+            if has_alpha:
+                background = Image.new("RGB", image.size, (255, 255, 255))
+                background.paste(image.convert("RGBA"),
+                                 mask=image.convert("RGBA").getchannel("A"))
+                image = background
+            elif image.mode != "RGB":
+                image = image.convert("RGB")
+        elif image.mode != "RGBA":
+            image = image.convert("RGBA")
+
+        target = Path(dest)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp = target.with_name(f".{target.name}.{uuid.uuid4().hex}")
+        image.save(tmp, **RESIZE_SAVE_OPTIONS[fmt])
+    os.replace(tmp, target)
+
+
+class ImageResizer:
+
+    def __init__(self, blob_store, root: Path, budget: int = IMAGE_CACHE_BYTES):
+        self.blob_store = blob_store
+        self.root = root / CACHE_DIR
+        self.cache = DiskCache(self.root, budget)
+
+    @staticmethod
+    def validate(w: Optional[int], h: Optional[int], fit: str, fmt: str):
+        if not w and not h:
+            raise HTTPException(status_code=400, detail="w or h is required")
+        for value in (w, h):
+            if value and value not in RESIZE_SIZES:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Size must be one of "
+                    f"{', '.join(map(str, sorted(RESIZE_SIZES)))}")
+        if fit not in FITS:
+            raise HTTPException(status_code=400,
+                                detail=f"fit must be one of {', '.join(FITS)}")
+        if fit == "cover" and not (w and h):
+            raise HTTPException(status_code=400,
+                                detail="fit=cover requires both w and h")
+        if fmt not in resize_formats():
+            raise HTTPException(
+                status_code=400,
+                detail=f"fmt must be one of {', '.join(resize_formats())}")
+
+    async def response(self,
+                       request: Request,
+                       db,
+                       blob_id: str,
+                       w: Optional[int],
+                       h: Optional[int],
+                       fit: str,
+                       fmt: str,
+                       private: bool = False) -> Response:
+        """The resized image; `private` keeps it out of shared caches"""
+        self.validate(w, h, fit, fmt)
+        if not SHA256_PATTERN.fullmatch(blob_id):
+            raise HTTPException(status_code=404, detail="Image not found")
+
+        key = f"{blob_id[:2]}/{blob_id}_{w or 0}x{h or 0}_{fit}.{fmt}"
+
+        async def render(dest: Path):
+            await self._render(db, blob_id, dest, w or 0, h or 0, fit, fmt)
+
+        await self.cache.ensure(key, render)
+        return await upload_response(
+            request, self.root, key,
+            PRIVATE_CACHE_CONTROL if private else CACHE_CONTROL)
+
+    async def _render(self, db, blob_id: str, dest: Path, w: int, h: int,
+                      fit: str, fmt: str):
+        blob = await db.blobs.find_one({"_id": blob_id})
+        if not blob or not (blob.get("contentType") or "").startswith("image/"):
+            raise HTTPException(status_code=404, detail="Image not found")
+        try:
+            async with self.blob_store.local_copy(blob) as src:
+                await run_in_pool(resize_image, str(src), str(dest), w, h, fit,
+                                  fmt)
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="Image not found")
+        except Exception as e:
+            logger.warning(f"Resize failed for {blob_id}: {e}")
+            raise HTTPException(status_code=422,
+                                detail="Image could not be resized")
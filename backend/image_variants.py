@@ -0,0 +1,180 @@
+"""
+Responsive image derivatives
+Renders a set of width variants of each uploaded image in modern formats
+(WebP, plus AVIF when the installed Pillow supports it) in a process pool, and
+builds the srcset data stored on portfolio/media documents.
+
+Config (env):
+  IMAGE_VARIANT_WIDTHS   comma-separated widths in px (default 320,640,1024,1600,2048)
+  IMAGE_VARIANT_FORMATS  comma-separated formats (default webp,avif)
+  IMAGE_WORKERS          processes in the image pool (default 2)
+"""
+
+import os
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Optional, Dict, Any, List
+
+from PIL import Image, ImageOps, features
+
+from watermark_overlay import prepare_logo, apply_watermark
+
+logger = logging.getLogger(__name__)
+
+VARIANT_WIDTHS = sorted(
+    int(w) for w in os.environ.get("IMAGE_VARIANT_WIDTHS",
+                                   "320,640,1024,1600,2048").split(",")
+    if w.strip())
+VARIANT_FORMATS = [
+    f.strip().lower()
+    for f in os.environ.get("IMAGE_VARIANT_FORMATS", "webp,avif").split(",")
+    if f.strip()
+]
+IMAGE_WORKERS = int(os.environ.get("IMAGE_WORKERS", "2"))
+
+SAVE_OPTIONS = {
+    "webp": {
+        "format": "WEBP",
+        "quality": 80,
+        "method": 4
+    },
+    "avif": {
+        "format": "AVIF",
+        "quality": 55,
+        "speed": 6
+    },
+}
+MIME_TYPES = {"webp": "image/webp", "avif": "image/avif"}
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def supported_formats() -> List[str]:
+    """Configured formats this Pillow build can actually encode"""
+    return [
+        fmt for fmt in VARIANT_FORMATS
+        if fmt in SAVE_OPTIONS and (fmt != "avif" or features.check("avif"))
+    ]
+
+
+def target_widths(width: int, widths: List[int]) -> List[int]:
+    """Configured widths below the original, plus the original if it fits"""
+    targets = [w for w in widths if w < width]
+    if not widths or width <= widths[-1]:
+        targets.append(width)
+    return targets
+
+
+def load_image(src: str) -> Image.Image:
+    """Open an image upright (EXIF orientation applied) in RGB/RGBA"""
+    return upright(Image.open(src))
+
+
+def upright(image: Image.Image) -> Image.Image:
+    """Apply EXIF orientation and convert to RGB/RGBA"""
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ("RGB", "RGBA"):
+        has_alpha = "A" in image.getbands() or "transparency" in image.info
+        image = image.convert("RGBA" if has_alpha else "RGB")
+    return image
+
+
+def render_variants(src: str,
+                    out_dir: str,
+                    widths: List[int],
+                    formats: List[str],
+                    watermark: Optional[Dict[str, Any]] = None
+                    ) -> Dict[str, Any]:
+    """
+    Runs in a worker process: write every width/format combination,
+    optionally watermarked ({"config": ..., "logo": path or None})
+    """
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    logo = None
+    if watermark and watermark.get("logo"):
+        logo = prepare_logo(watermark["logo"])
+    with load_image(src) as image:
+        width, height = image.size
+        variants = []
+        for target in target_widths(width, widths):
+            target_height = max(1, round(height * target / width))
+            resized = image if target == width else image.resize(
+                (target, target_height), Image.LANCZOS)
+            if watermark:
+                resized = apply_watermark(resized, watermark["config"], logo)
+            for fmt in formats:
+                path = out / f"{target}w.{fmt}"
+                resized.save(path, **SAVE_OPTIONS[fmt])
+                variants.append({
+                    "width": target,
+                    "height": target_height,
+                    "format": fmt,
+                    "name": path.name,
+                    "size": path.stat().st_size
+                })
+    return {"width": width, "height": height, "variants": variants}
+
+
+def get_pool() -> ProcessPoolExecutor:
+    """Shared process pool for CPU-bound image work (created on first use)"""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=IMAGE_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def run_in_pool(func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_pool(), func, *args)
+
+
+async def create_variants(
+        src: Path,
+        out_dir: Path,
+        url_prefix: str,
+        watermark: Optional[Dict[str, Any]] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Render variants for `src` into `out_dir` and return document fields:
+    width, height, variants [{url, width, height, format, size}] and srcset
+    keyed by MIME type. Returns None if the file is not a readable image.
+    """
+    formats = supported_formats()
+    try:
+        result = await run_in_pool(render_variants, str(src), str(out_dir),
+                                   VARIANT_WIDTHS, formats, watermark)
+    except Exception as e:
+        logger.warning(f"Variant generation failed for {src.name}: {e}")
+        return None
+
+    variants = [{
+        "url": f"{url_prefix}/{v['name']}",
+        "width": v["width"],
+        "height": v["height"],
+        "format": v["format"],
+        "size": v["size"]
+    } for v in result["variants"]]
+    srcset = {
+        MIME_TYPES[fmt]: ", ".join(f"{v['url']} {v['width']}w"
+                                   for v in variants if v["format"] == fmt)
+        for fmt in formats
+    }
+    return {
+        "width": result["width"],
+        "height": result["height"],
+        "variants": variants,
+        "srcset": srcset
+    }
@@ -0,0 +1,343 @@
+"""
+Persistent background job queue backed by the `jobs` collection
+Jobs are claimed atomically (highest priority, then oldest), held under a lease
+that the running worker keeps renewing, and retried with exponential backoff
+until maxAttempts. A job whose worker died is picked up again once its lease
+expires. Every web process runs JOB_WORKERS workers; set JOB_WORKERS=0 and run
+`python worker.py` to process jobs beside the web server instead.
+
+Job document:
+  jobId, type, payload, status (queued | running | succeeded | failed |
+  cancelled), priority, attempts, maxAttempts, runAfter, leaseUntil,
+  leaseToken, workerId, result, error, createdBy, createdAt, startedAt,
+  finishedAt, dedupeKey (kept for retries), activeKey (dedupeKey while queued
+  or running)
+
+Config (env):
+  JOB_WORKERS         concurrent jobs per process (default 2)
+  JOB_POLL_SECONDS    idle poll interval (default 2)
+  JOB_RETENTION_DAYS  finished jobs are removed after this (default 7)
+"""
+
+import os
+import uuid
+import socket
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, Callable, Awaitable, List
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+JOB_POLL_SECONDS = float(os.environ.get("JOB_POLL_SECONDS", "2"))
+JOB_RETENTION = timedelta(days=int(os.environ.get("JOB_RETENTION_DAYS", "7")))
+JOB_LEASE = timedelta(minutes=5)
+RETRY_BASE_SECONDS = 30
+RETRY_MAX_SECONDS = 3600
+
+PRIORITY_HIGH = 10
+PRIORITY_NORMAL = 0
+PRIORITY_LOW = -10
+
+JobHandler = Callable[[Any, Dict[str, Any]], Awaitable[Any]]
+
+
+class JobQueue:
+
+    def __init__(self):
+        self._handlers: Dict[str, Dict[str, Any]] = {}
+        self._workers: List[asyncio.Task] = []
+        self._wakeup = asyncio.Event()
+        self.worker_id = ""
+
+    def register(self,
+                 job_type: str,
+                 handler: JobHandler,
+                 max_attempts: int = 3,
+                 timeout: Optional[float] = None):
+        """Handle jobs of `job_type` with `await handler(db, payload)`"""
+        self._handlers[job_type] = {
+            "handler": handler,
+            "maxAttempts": max_attempts,
+            "timeout": timeout
+        }
+
+    async def ensure_indexes(self, db):
+        await db.jobs.create_index("jobId", unique=True)
+        await db.jobs.create_index([("status", 1), ("priority", -1),
+                                    ("runAfter", 1)])
+        await db.jobs.create_index([("status", 1), ("leaseUntil", 1)])
+        await db.jobs.create_index([("type", 1), ("createdAt", -1)])
+        # Only one queued/running job per dedupe key
+        await db.jobs.create_index("activeKey", unique=True, sparse=True)
+        await db.jobs.create_index(
+            "finishedAt", expireAfterSeconds=int(JOB_RETENTION.total_seconds()))
+
+    async def enqueue(self,
+                      db,
+                      job_type: str,
+                      payload: Optional[Dict[str, Any]] = None,
+                      priority: int = PRIORITY_NORMAL,
+                      delay: Optional[timedelta] = None,
+                      dedupe_key: Optional[str] = None,
+                      created_by: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Add a job and return its document. With `dedupe_key`, an identical
+        job that is still queued or running is returned instead.
+        """
+        if job_type not in self._handlers:
+            raise ValueError(f"Unknown job type: {job_type}")
+        now = datetime.utcnow()
+        job = {
+            "jobId": uuid.uuid4().hex,
+            "type": job_type,
+            "payload": payload or {},
+            "status": "queued",
+            "priority": priority,
+            "attempts": 0,
+            "maxAttempts": self._handlers[job_type]["maxAttempts"],
+            "runAfter": now + (delay or timedelta()),
+            "createdBy": created_by,
+            "createdAt": now,
+            "updatedAt": now
+        }
+        if dedupe_key:
+            job["dedupeKey"] = job["activeKey"] = f"{job_type}:{dedupe_key}"
+        try:
+            await db.jobs.insert_one(job)
+        except DuplicateKeyError:
+            existing = await db.jobs.find_one({"activeKey": job["activeKey"]})
+            if existing:
+                return existing
+            # The other job finished in between; queue this one
+            job.pop("_id", None)
+            await db.jobs.insert_one(job)
+        self._wakeup.set()
+        return job
+
+    async def get(self, db, job_id: str) -> Optional[Dict[str, Any]]:
+        return await db.jobs.find_one({"jobId": job_id})
+
+    async def cancel(self, db, job_id: str) -> bool:
+        """Cancel a job that has not started yet"""
+        result = await db.jobs.update_one({
+            "jobId": job_id,
+            "status": "queued"
+        }, {
+            "$set": {
+                "status": "cancelled",
+                "finishedAt": datetime.utcnow(),
+                "updatedAt": datetime.utcnow()
+            },
+            "$unset": {
+                "activeKey": ""
+            }
+        })
+        return result.modified_count == 1
+
+    async def retry(self, db, job_id: str) -> bool:
+        """
+        Queue a failed or cancelled job again with a fresh attempt budget
+        False if it isn't failed or cancelled, or an identical job (same
+        dedupe key) is already queued or running.
+        """
+        retryable = {
+            "jobId": job_id,
+            "status": {
+                "$in": ["failed", "cancelled"]
+            }
+        }
+        job = await db.jobs.find_one(retryable, {"dedupeKey": 1})
+        if not job:
+            return False
+        update = {
+            "$set": {
+                "status": "queued",
+                "attempts": 0,
+                "runAfter": datetime.utcnow(),
+                "updatedAt": datetime.utcnow()
+            },
+            "$unset": {
+                "finishedAt": "",
+                "error": ""
+            }
+        }
+        if job.get("dedupeKey"):
+            # Back under the dedupe index, as enqueue would put it
+            update["$set"]["activeKey"] = job["dedupeKey"]
+        try:
+            result = await db.jobs.update_one(retryable, update)
+        except DuplicateKeyError:
+            return False
+        if result.modified_count:
+            self._wakeup.set()
+        return result.modified_count == 1
+
+    async def claim(self, db) -> Optional[Dict[str, Any]]:
+        """Lease the next runnable job: queued and due, or abandoned"""
+        now = datetime.utcnow()
+        return await db.jobs.find_one_and_update(
+            {
+                "type": {
+                    "$in": list(self._handlers)
+                },
+                "$or": [{
+                    "status": "queued",
+                    "runAfter": {
+                        "$lte": now
+                    }
+                }, {
+                    "status": "running",
+                    "leaseUntil": {
+                        "$lt": now
+                    }
+                }]
+            }, {
+                "$set": {
+                    "status": "running",
+                    "leaseUntil": now + JOB_LEASE,
+                    "leaseToken": uuid.uuid4().hex,
+                    "workerId": self.worker_id,
+                    "startedAt": now,
+                    "updatedAt": now
+                },
+                "$inc": {
+                    "attempts": 1
+                }
+            },
+            sort=[("priority", -1), ("runAfter", 1)],
+            return_document=ReturnDocument.AFTER)
+
+    async def _renew_lease(self, db, owned: Dict[str, Any]):
+        while True:
+            await asyncio.sleep(JOB_LEASE.total_seconds() / 3)
+            await db.jobs.update_one(
+                owned, {"$set": {
+                    "leaseUntil": datetime.utcnow() + JOB_LEASE
+                }})
+
+    async def execute(self, db, job: Dict[str, Any]):
+        """Run a claimed job and record its outcome"""
+        # Updates only apply while this claim still holds the lease
+        owned = {"jobId": job["jobId"], "leaseToken": job["leaseToken"]}
+        if job["attempts"] > job["maxAttempts"]:
+            # Its workers keep dying mid-job (lease expired every time)
+            await db.jobs.update_one(
+                owned, {
+                    "$set": {
+                        "status": "failed",
+                        "error": job.get("error") or "Lease expired",
+                        "finishedAt": datetime.utcnow(),
+                        "updatedAt": datetime.utcnow()
+                    },
+                    "$unset": {
+                        "activeKey": ""
+                    }
+                })
+            return
+
+        spec = self._handlers[job["type"]]
+        renewer = asyncio.create_task(self._renew_lease(db, owned))
+        try:
+            result = await asyncio.wait_for(
+                spec["handler"](db, job["payload"]), spec["timeout"])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            if job["attempts"] < job["maxAttempts"]:
+                backoff = min(RETRY_BASE_SECONDS * 2**(job["attempts"] - 1),
+                              RETRY_MAX_SECONDS)
+                logger.warning(f"Job {job['type']} {job['jobId']} failed "
+                               f"(attempt {job['attempts']}), retrying in "
+                               f"{backoff}s: {error}")
+                update = {
+                    "$set": {
+                        "status": "queued",
+                        "error": error,
+                        "runAfter":
+                        datetime.utcnow() + timedelta(seconds=backoff)
+                    }
+                }
+            else:
+                logger.error(f"Job {job['type']} {job['jobId']} failed: {error}")
+                update = {
+                    "$set": {
+                        "status": "failed",
+                        "error": error,
+                        "finishedAt": datetime.utcnow()
+                    },
+                    "$unset": {
+                        "activeKey": ""
+                    }
+                }
+            update["$set"]["updatedAt"] = datetime.utcnow()
+            await db.jobs.update_one(owned, update)
+        else:
+            await db.jobs.update_one(
+                owned, {
+                    "$set": {
+                        "status": "succeeded",
+                        "result": result,
+                        "finishedAt": datetime.utcnow(),
+                        "updatedAt": datetime.utcnow()
+                    },
+                    "$unset": {
+                        "activeKey": "",
+                        "error": ""
+                    }
+                })
+        finally:
+            renewer.cancel()
+
+    async def _work(self, db):
+        while True:
+            try:
+                job = await self.claim(db)
+                if job is None:
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(),
+                                               JOB_POLL_SECONDS)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                await self.execute(db, job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Job worker error: {e}")
+                await asyncio.sleep(JOB_POLL_SECONDS)
+
+    def start(self, db, workers: int = JOB_WORKERS):
+        if self._workers:
+            return
+        # Set here rather than at import: gunicorn forks after importing
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._workers = [
+            asyncio.create_task(self._work(db)) for _ in range(workers)
+        ]
+        if workers:
+            logger.info(f"Started {workers} job workers")
+
+    def stop(self):
+        for task in self._workers:
+            task.cancel()
+        self._workers = []
+
+
+def job_status(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Public view of a job document for status polling"""
+    return {
+        key: job.get(key)
+        for key in ("jobId", "type", "status", "priority", "attempts",
+                    "maxAttempts", "result", "error", "createdAt",
+                    "startedAt", "finishedAt")
+    }
+
+
+job_queue = JobQueue()
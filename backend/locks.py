@@ -0,0 +1,36 @@
+"""
+Named locks shared by every worker process
+A lock is a document in `locks` whose lockedUntil lies in the future; it
+expires on its own if the holder dies, so it needs no cleanup.
+"""
+
+from datetime import datetime, timedelta
+
+from pymongo.errors import DuplicateKeyError
+
+
+async def acquire_lock(db, name: str, ttl: timedelta) -> bool:
+    """Take the lock for `ttl` unless another worker holds it"""
+    now = datetime.utcnow()
+    try:
+        await db.locks.update_one(
+            {
+                "_id": name,
+                "lockedUntil": {
+                    "$lte": now
+                }
+            }, {"$set": {
+                "lockedUntil": now + ttl
+            }},
+            upsert=True)
+    except DuplicateKeyError:
+        # Lock document exists and is still held by another worker
+        return False
+    return True
+
+
+async def release_lock(db, name: str):
+    await db.locks.update_one({"_id": name},
+                              {"$set": {
+                                  "lockedUntil": datetime.utcnow()
+                              }})
@@ -77,7 +77,8 @@ class VideoCreate(BaseModel):
     title: str
     description: str
     videoUrl: str
-    thumbnail: str
+    # Filled in from the uploaded video's poster frame when empty
+    thumbnail: Optional[str] = None
     category: str
     duration: Optional[str] = None
     tags: List[str] = []
@@ -0,0 +1,165 @@
+"""
+Keyset pagination for the admin list endpoints
+Every list is sorted on an indexed field with _id as the tiebreaker and read
+one page at a time. The opaque `cursor` returned with a page holds the sort
+key of its last row, so the next page starts with an index seek instead of
+skipping over everything before it, and rows inserted or deleted meanwhile
+never shift the pages. Filters are exact matches on indexed fields only, so
+no combination falls back to a collection scan.
+
+Responses keep their list key and add:
+  nextCursor      pass as ?cursor= for the following page (null on the last)
+  total           matching rows, counted up to COUNT_LIMIT
+  totalEstimated  true when `total` is the collection's metadata count or
+                  hit COUNT_LIMIT
+
+Lists are described by ListSpec; ensure_list_indexes creates the indexes
+each spec relies on.
+"""
+
+import base64
+import logging
+from typing import Optional, Dict, Any, List, Tuple, NamedTuple
+
+from bson import json_util
+from fastapi import HTTPException
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+COUNT_LIMIT = 10000
+
+
+class ListSpec(NamedTuple):
+    """Sortable and filterable fields of one admin list (param -> field)"""
+    sort_fields: Dict[str, str]
+    filter_fields: Dict[str, str]
+    default_sort: str
+    default_order: str = "desc"
+
+
+def encode_cursor(values: List[Any]) -> str:
+    # Extended JSON keeps ObjectIds and datetimes intact
+    raw = json_util.dumps(values).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> List[Any]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json_util.loads(raw.decode("utf-8"))
+    except Exception:
+        # Anything from bad base64 to malformed $oid/$date values
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(values, list) or len(values) != 2 or any(
+            isinstance(value, (dict, list)) for value in values):
+        # Documents would be read as query operators
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+
+def _field_value(doc: Dict[str, Any], field: str) -> Any:
+    for part in field.split("."):
+        if not isinstance(doc, dict):
+            return None
+        doc = doc.get(part)
+    return doc
+
+
+def _after(field: str, direction: int, value: Any,
+           last_id: Any) -> Dict[str, Any]:
+    """Rows that sort after (value, last_id)"""
+    beyond = "$gt" if direction == 1 else "$lt"
+    if field == "_id":
+        return {"_id": {beyond: last_id}}
+    same = {field: value, "_id": {beyond: last_id}}
+    if value is None:
+        # Missing values sort lowest: first ascending, last descending
+        return {"$or": [same, {field: {"$ne": None}}]} if direction == 1 \
+            else same
+    rest = [same, {field: {beyond: value}}]
+    if direction == -1:
+        rest.append({field: None})
+    return {"$or": rest}
+
+
+def build_query(spec: ListSpec, filters: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        spec.filter_fields[name]: value
+        for name, value in filters.items() if value is not None
+    }
+
+
+async def count_matching(collection, query: Dict[str, Any]) -> Tuple[int, bool]:
+    """(count, estimated) without scanning more than COUNT_LIMIT rows"""
+    if not query:
+        return await collection.estimated_document_count(), True
+    count = await collection.count_documents(query, limit=COUNT_LIMIT)
+    return count, count >= COUNT_LIMIT
+
+
+async def list_page(collection,
+                    spec: ListSpec,
+                    filters: Optional[Dict[str, Any]] = None,
+                    sort: Optional[str] = None,
+                    order: Optional[str] = None,
+                    limit: int = DEFAULT_PAGE_SIZE,
+                    cursor: Optional[str] = None,
+                    projection: Optional[Dict[str, Any]] = None,
+                    query: Optional[Dict[str, Any]] = None
+                    ) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    One page of a list: (rows, page info for the response)
+    `filters` are keyed by spec.filter_fields (None values are ignored);
+    `query` adds conditions the endpoint builds itself.
+    """
+    sort = sort or spec.default_sort
+    if sort not in spec.sort_fields:
+        raise HTTPException(
+            status_code=400,
+            detail=f"sort must be one of {', '.join(spec.sort_fields)}")
+    order = order or spec.default_order
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="order must be asc or desc")
+    field = spec.sort_fields[sort]
+    direction = 1 if order == "asc" else -1
+
+    matching = {**build_query(spec, filters or {}), **(query or {})}
+    page_query = matching
+    if cursor:
+        value, last_id = decode_cursor(cursor)
+        page_query = {
+            "$and": [matching, _after(field, direction, value, last_id)]
+        } if matching else _after(field, direction, value, last_id)
+
+    order_by = [(field, direction)] if field == "_id" else [(field, direction),
+                                                          ("_id", direction)]
+    # One extra row tells whether another page follows
+    rows = await collection.find(page_query,
+                                 projection).sort(order_by).to_list(limit + 1)
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor([_field_value(last, field), last["_id"]])
+
+    total, estimated = await count_matching(collection, matching)
+    return rows, {
+        "nextCursor": next_cursor,
+        "total": total,
+        "totalEstimated": estimated
+    }
+
+
+async def ensure_list_indexes(collection, spec: ListSpec):
+    """Indexes for every sort, and every filter with the default sort"""
+    for field in spec.sort_fields.values():
+        if field != "_id":
+            await collection.create_index([(field, -1), ("_id", -1)])
+    default = spec.sort_fields[spec.default_sort]
+    for field in spec.filter_fields.values():
+        keys = [(field, 1), (default, -1)]
+        if default != "_id":
+            keys.append(("_id", -1))
+        await collection.create_index(keys)
@@ -0,0 +1,318 @@
+"""
+Resumable chunked uploads (tus-like) for large files such as videos
+Protocol:
+  POST   /uploads/resumable                 create {filename, size, ...}
+  HEAD   /uploads/resumable/{id}            Upload-Offset / Upload-Length
+  PATCH  /uploads/resumable/{id}            body = next chunk, Upload-Offset
+  POST   /uploads/resumable/{id}/finalize   move into the blob store
+  DELETE /uploads/resumable/{id}            abort
+
+Chunks are appended in place to UPLOAD_DIR/.partial/<uploadId>, so finalizing
+is a rename rather than a reassembly. Session state lives in `upload_sessions`;
+sessions idle for longer than RESUMABLE_UPLOAD_TTL_HOURS are garbage-collected
+together with their partial files.
+"""
+
+import os
+import time
+import uuid
+import asyncio
+import hashlib
+import logging
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Optional, Dict, Any, AsyncIterator, Tuple, List
+
+from fastapi import HTTPException
+from pymongo import ReturnDocument
+from starlette.concurrency import run_in_threadpool
+
+from uploads import discard
+
+logger = logging.getLogger(__name__)
+
+PARTIAL_DIR = ".partial"
+UPLOAD_TTL = timedelta(
+    hours=int(os.environ.get("RESUMABLE_UPLOAD_TTL_HOURS", "24")))
+MAX_RESUMABLE_BYTES = int(
+    os.environ.get("MAX_RESUMABLE_UPLOAD_MB", "8192")) * 1024 * 1024
+RECOMMENDED_CHUNK_SIZE = 8 * 1024 * 1024
+CHUNK_LEASE = timedelta(minutes=5)
+# Covers hashing and moving the largest allowed file
+FINALIZE_LEASE = timedelta(minutes=30)
+GC_INTERVAL_SECONDS = 3600
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def _append(path: Path, offset: int, chunk: bytes):
+    with open(path, "r+b") as f:
+        f.seek(offset)
+        f.write(chunk)
+
+
+def _truncate(path: Path, size: int):
+    with open(path, "r+b") as f:
+        f.truncate(size)
+
+
+def _sha256_file(path: Path) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def _stale_partials(directory: Path, stale_before: float) -> List[Path]:
+    """Partial files last written before `stale_before` (a timestamp)"""
+    if not directory.exists():
+        return []
+    with os.scandir(directory) as entries:
+        return [
+            Path(entry.path) for entry in entries
+            if entry.stat().st_mtime < stale_before
+        ]
+
+
+class ResumableUploads:
+
+    def __init__(self, root: Path, blob_store):
+        self.root = root
+        self.blob_store = blob_store
+        # uploadId -> (offset, running sha256) for chunks seen by this worker
+        self._hashers: Dict[str, Tuple[int, Any]] = {}
+        self._gc_task: Optional[asyncio.Task] = None
+
+    @property
+    def partial_dir(self) -> Path:
+        return self.root / PARTIAL_DIR
+
+    def partial_path(self, upload_id: str) -> Path:
+        return self.partial_dir / upload_id
+
+    async def ensure_indexes(self, db):
+        await db.upload_sessions.create_index("uploadId", unique=True)
+        await db.upload_sessions.create_index("updatedAt")
+
+    async def get_session(self, db, upload_id: str) -> Dict[str, Any]:
+        session = await db.upload_sessions.find_one({"uploadId": upload_id})
+        if not session:
+            raise HTTPException(status_code=404, detail="Upload not found")
+        return session
+
+    async def create(self, db, data: dict, user_id: str) -> Dict[str, Any]:
+        """Register a new upload and create its empty partial file"""
+        try:
+            size = int(data.get("size"))
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="size is required")
+        if size <= 0:
+            raise HTTPException(status_code=400, detail="size must be positive")
+        if size > MAX_RESUMABLE_BYTES:
+            raise HTTPException(status_code=413,
+                                detail="File exceeds resumable upload limit")
+
+        upload_id = uuid.uuid4().hex
+        await run_in_threadpool(self.partial_dir.mkdir,
+                                parents=True,
+                                exist_ok=True)
+        await run_in_threadpool(self.partial_path(upload_id).touch)
+
+        now = datetime.utcnow()
+        session = {
+            "uploadId": upload_id,
+            "filename": Path(data.get("filename") or upload_id).name,
+            "contentType": data.get("contentType"),
+            "size": size,
+            "offset": 0,
+            "videoId": data.get("videoId"),
+            "createdBy": user_id,
+            "lockedUntil": now,
+            "createdAt": now,
+            "updatedAt": now
+        }
+        await db.upload_sessions.insert_one(session)
+        return session
+
+    async def append(self, db, upload_id: str, offset: int,
+                     chunks: AsyncIterator[bytes]) -> int:
+        """
+        Append the request body at `offset`, which must equal the stored
+        offset. Returns the new offset. A lease stops two requests writing
+        the same upload at once.
+        """
+        now = datetime.utcnow()
+        session = await db.upload_sessions.find_one_and_update(
+            {
+                "uploadId": upload_id,
+                "offset": offset,
+                "lockedUntil": {
+                    "$lte": now
+                }
+            }, {"$set": {
+                "lockedUntil": now + CHUNK_LEASE
+            }},
+            return_document=ReturnDocument.AFTER)
+        if not session:
+            current = await self.get_session(db, upload_id)
+            raise HTTPException(
+                status_code=409,
+                detail=f"Upload-Offset mismatch or upload busy "
+                f"(current offset {current['offset']})")
+
+        path = self.partial_path(upload_id)
+        cached = self._hashers.get(upload_id)
+        hasher = cached[1] if cached and cached[0] == offset else None
+        if offset == 0:
+            hasher = hashlib.sha256()
+
+        position = offset
+        try:
+            async for chunk in chunks:
+                if not chunk:
+                    continue
+                if position + len(chunk) > session["size"]:
+                    raise HTTPException(status_code=413,
+                                        detail="Chunk exceeds declared size")
+                await run_in_threadpool(_append, path, position, chunk)
+                if hasher is not None:
+                    hasher.update(chunk)
+                position += len(chunk)
+        except HTTPException:
+            # Rejected chunk: roll back to the last acknowledged offset
+            await run_in_threadpool(_truncate, path, offset)
+            await self._release(db, upload_id, offset, None)
+            raise
+        except BaseException:
+            # Dropped connection: keep every byte that reached the disk so the
+            # client resumes from there instead of resending the whole chunk
+            await self._release(db, upload_id, position, hasher)
+            raise
+
+        await self._release(db, upload_id, position, hasher)
+        return position
+
+    async def _release(self, db, upload_id: str, position: int, hasher):
+        if hasher is not None:
+            self._hashers[upload_id] = (position, hasher)
+        else:
+            self._hashers.pop(upload_id, None)
+        await db.upload_sessions.update_one({"uploadId": upload_id}, {
+            "$set": {
+                "offset": position,
+                "lockedUntil": datetime.utcnow(),
+                "updatedAt": datetime.utcnow()
+            }
+        })
+
+    async def finalize(self, db, upload_id: str) -> Tuple[Dict[str, Any],
+                                                          bool,
+                                                          Dict[str, Any]]:
+        """
+        Move a complete upload into the blob store
+        Returns (blob, created, session). The SHA-256 comes from the running
+        hash when every chunk went through this worker, otherwise the file
+        is hashed once here.
+        """
+        # Claim the session like a chunk does, so a second finalize (or a
+        # late chunk) can't run against the same partial file
+        now = datetime.utcnow()
+        session = await db.upload_sessions.find_one_and_update(
+            {
+                "uploadId": upload_id,
+                "lockedUntil": {
+                    "$lte": now
+                }
+            }, {"$set": {
+                "lockedUntil": now + FINALIZE_LEASE,
+                "updatedAt": now
+            }},
+            return_document=ReturnDocument.AFTER)
+        if not session:
+            await self.get_session(db, upload_id)
+            raise HTTPException(status_code=409,
+                                detail="Upload busy or already finalizing")
+
+        try:
+            if session["offset"] != session["size"]:
+                raise HTTPException(
+                    status_code=409,
+                    detail=f"Upload incomplete ({session['offset']} of "
+                    f"{session['size']} bytes)")
+
+            path = self.partial_path(upload_id)
+            cached = self._hashers.pop(upload_id, None)
+            if cached and cached[0] == session["size"]:
+                sha256 = cached[1].hexdigest()
+            else:
+                sha256 = await run_in_threadpool(_sha256_file, path)
+
+            blob, created = await self.blob_store.adopt(
+                db, path, sha256, session["size"], session["filename"],
+                session["contentType"])
+        except BaseException:
+            await db.upload_sessions.update_one(
+                {"uploadId": upload_id},
+                {"$set": {
+                    "lockedUntil": datetime.utcnow()
+                }})
+            raise
+        await db.upload_sessions.delete_one({"uploadId": upload_id})
+        return blob, created, session
+
+    async def abort(self, db, upload_id: str):
+        await self.get_session(db, upload_id)
+        self._hashers.pop(upload_id, None)
+        await run_in_threadpool(discard, self.partial_path(upload_id))
+        await db.upload_sessions.delete_one({"uploadId": upload_id})
+
+    async def collect_garbage(self, db) -> int:
+        """Remove sessions idle past the TTL and partial files without one"""
+        cutoff = datetime.utcnow() - UPLOAD_TTL
+        removed = 0
+        async for session in db.upload_sessions.find(
+            {
+                "updatedAt": {
+                    "$lt": cutoff
+                },
+                "lockedUntil": {
+                    "$lte": datetime.utcnow()
+                }
+            }, {"uploadId": 1}):
+            upload_id = session["uploadId"]
+            self._hashers.pop(upload_id, None)
+            await run_in_threadpool(discard, self.partial_path(upload_id))
+            await db.upload_sessions.delete_one({"uploadId": upload_id})
+            removed += 1
+
+        # Partial files whose session record is gone
+        stale_before = time.time() - UPLOAD_TTL.total_seconds()
+        for path in await run_in_threadpool(_stale_partials, self.partial_dir,
+                                            stale_before):
+            if not await db.upload_sessions.find_one({"uploadId": path.name},
+                                                     {"_id": 1}):
+                await run_in_threadpool(discard, path)
+                removed += 1
+        if removed:
+            logger.info(f"Removed {removed} stale resumable uploads")
+        return removed
+
+    async def _run_gc(self, db):
+        while True:
+            try:
+                await self.collect_garbage(db)
+            except Exception as e:
+                logger.error(f"Resumable upload GC failed: {e}")
+            await asyncio.sleep(GC_INTERVAL_SECONDS)
+
+    def start_gc(self, db):
+        if self._gc_task is None:
+            self._gc_task = asyncio.create_task(self._run_gc(db))
+
+    def stop_gc(self):
+        if self._gc_task:
+            self._gc_task.cancel()
+            self._gc_task = None
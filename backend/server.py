@@ -1,4 +1,4 @@
-from fastapi import FastAPI, APIRouter, HTTPException, UploadFile, File
+from fastapi import FastAPI, APIRouter, HTTPException, UploadFile, File, Query
 from fastapi.responses import JSONResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
@@ -11,9 +11,11 @@ from typing import List, Optional, Dict, Any
 import uuid
 from datetime import datetime, timedelta
 from bson import ObjectId
+from pymongo.errors import BulkWriteError
 import bcrypt
 import secrets
 import hashlib
+import re
 from fastapi import Request, Response, Cookie
 
 ROOT_DIR = Path(__file__).parent
@@ -164,6 +166,7 @@ class InquiryCreate(BaseModel):
     eventType: str
     eventDate: Optional[str] = None
     message: str = ""
+    sessionId: Optional[str] = None  # analytics session, for funnel reports
 
 
 # ===== AUTHENTICATION & ADMIN SETUP =====
@@ -357,16 +360,68 @@ async def get_me(request: Request):
     return {"success": True, "user": user}
 
 
+# ===== ADMIN LIST PAGINATION =====
+# Admin lists are read in keyset pages with filters on indexed fields only
+# (see pagination.py)
+from pagination import (ListSpec, list_page, ensure_list_indexes,
+                        DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
+
+USER_LIST = ListSpec(
+    sort_fields={"createdAt": "createdAt", "lastLogin": "lastLogin",
+                 "email": "email", "name": "name"},
+    filter_fields={"role": "role", "isActive": "isActive"},
+    default_sort="createdAt")
+BLOG_LIST = ListSpec(
+    sort_fields={"createdAt": "createdAt", "updatedAt": "updatedAt",
+                 "publishedAt": "publishedAt", "title": "title"},
+    filter_fields={"category": "category", "isPublished": "isPublished"},
+    default_sort="createdAt")
+VIDEO_LIST = ListSpec(
+    sort_fields={"order": "order", "createdAt": "createdAt",
+                 "title": "title"},
+    filter_fields={"category": "category", "isActive": "isActive"},
+    default_sort="order",
+    default_order="asc")
+OFFER_LIST = ListSpec(
+    sort_fields={"createdAt": "createdAt", "validFrom": "validFrom",
+                 "validUntil": "validUntil"},
+    filter_fields={"isActive": "isActive"},
+    default_sort="createdAt")
+PAGE_LIST = ListSpec(
+    sort_fields={"createdAt": "createdAt", "updatedAt": "updatedAt",
+                 "title": "title"},
+    filter_fields={"isPublished": "isPublished", "template": "template"},
+    default_sort="createdAt")
+INQUIRY_LIST = ListSpec(
+    sort_fields={"createdAt": "createdAt"},
+    filter_fields={"status": "status", "eventType": "eventType"},
+    default_sort="createdAt")
+LIST_INDEXES = (("users", USER_LIST), ("blog", BLOG_LIST),
+                ("videos", VIDEO_LIST), ("offers", OFFER_LIST),
+                ("pages", PAGE_LIST), ("inquiries", INQUIRY_LIST))
+
+
 # ===== ADMIN USER MANAGEMENT =====
 
 
 @api_router.get("/admin/users")
-async def get_all_users(request: Request):
+async def get_all_users(request: Request,
+                        role: Optional[str] = None,
+                        isActive: Optional[bool] = None,
+                        sort: Optional[str] = None,
+                        order: Optional[str] = None,
+                        limit: int = Query(DEFAULT_PAGE_SIZE,
+                                           ge=1,
+                                           le=MAX_PAGE_SIZE),
+                        cursor: Optional[str] = None):
     user = await get_current_user(request)
     if not has_permission(user["role"], "manage_users"):
         raise HTTPException(status_code=403, detail="Permission denied")
-    users = await db.users.find().to_list(1000)
-    return {"success": True, "users": serialize_doc(users)}
+    users, page = await list_page(db.users, USER_LIST, {
+        "role": role,
+        "isActive": isActive
+    }, sort, order, limit, cursor)
+    return {"success": True, "users": serialize_doc(users), **page}
 
 
 @api_router.post("/admin/users")
@@ -399,10 +454,21 @@ async def create_admin_user(data: dict, request: Request):
 
 
 @api_router.get("/admin/blog")
-async def get_all_blogs(request: Request):
+async def get_all_blogs(request: Request,
+                        category: Optional[str] = None,
+                        isPublished: Optional[bool] = None,
+                        sort: Optional[str] = None,
+                        order: Optional[str] = None,
+                        limit: int = Query(DEFAULT_PAGE_SIZE,
+                                           ge=1,
+                                           le=MAX_PAGE_SIZE),
+                        cursor: Optional[str] = None):
     user = await get_current_user(request)
-    blogs = await db.blog.find().sort("createdAt", -1).to_list(1000)
-    return {"success": True, "blogs": serialize_doc(blogs)}
+    blogs, page = await list_page(db.blog, BLOG_LIST, {
+        "category": category,
+        "isPublished": isPublished
+    }, sort, order, limit, cursor)
+    return {"success": True, "blogs": serialize_doc(blogs), **page}
 
 
 @api_router.post("/admin/blog")
@@ -456,10 +522,21 @@ async def delete_blog(blog_id: str, request: Request):
 
 
 @api_router.get("/admin/videos")
-async def get_all_videos(request: Request):
+async def get_all_videos(request: Request,
+                         category: Optional[str] = None,
+                         isActive: Optional[bool] = None,
+                         sort: Optional[str] = None,
+                         order: Optional[str] = None,
+                         limit: int = Query(DEFAULT_PAGE_SIZE,
+                                            ge=1,
+                                            le=MAX_PAGE_SIZE),
+                         cursor: Optional[str] = None):
     user = await get_current_user(request)
-    videos = await db.videos.find().sort("order", 1).to_list(1000)
-    return {"success": True, "videos": serialize_doc(videos)}
+    videos, page = await list_page(db.videos, VIDEO_LIST, {
+        "category": category,
+        "isActive": isActive
+    }, sort, order, limit, cursor)
+    return {"success": True, "videos": serialize_doc(videos), **page}
 
 
 @api_router.post("/admin/videos")
@@ -474,6 +551,7 @@ async def create_video(data: dict, request: Request):
         "updatedAt": datetime.utcnow()
     }
     await db.videos.insert_one(video_data)
+    await link_video_upload(video_data)
     await log_activity(user["userId"], "create", "video",
                        video_data["videoId"])
     return {
@@ -490,9 +568,27 @@ async def update_video(video_id: str, data: dict, request: Request):
         raise HTTPException(status_code=403, detail="Permission denied")
 
     data["updatedAt"] = datetime.utcnow()
-    result = await db.videos.update_one({"videoId": video_id}, {"$set": data})
+    update = {"$set": data}
+    if "videoUrl" in data:
+        video = await db.videos.find_one({"videoId": video_id})
+        if not video:
+            raise HTTPException(status_code=404, detail="Video not found")
+        # Derivatives of the previous file no longer apply, nor do the
+        # thumbnail and duration filled in from them
+        blob = await video_blob({"videoUrl": data["videoUrl"]})
+        data["blobId"] = blob["_id"] if blob else None
+        stale = list(VIDEO_DOCUMENT_FIELDS)
+        if video.get("poster") and video.get("thumbnail") == video["poster"]:
+            stale.append("thumbnail")
+        if video.get("durationSeconds") and video.get(
+                "duration") == format_duration(video["durationSeconds"]):
+            stale.append("duration")
+        update["$unset"] = {field: "" for field in stale if field not in data}
+    result = await db.videos.update_one({"videoId": video_id}, update)
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Video not found")
+    if data.get("blobId"):
+        await link_video_upload(data)
     await log_activity(user["userId"], "update", "video", video_id)
     return {"success": True, "message": "Video updated"}
 
@@ -514,10 +610,19 @@ async def delete_video(video_id: str, request: Request):
 
 
 @api_router.get("/admin/offers")
-async def get_all_offers(request: Request):
+async def get_all_offers(request: Request,
+                         isActive: Optional[bool] = None,
+                         sort: Optional[str] = None,
+                         order: Optional[str] = None,
+                         limit: int = Query(DEFAULT_PAGE_SIZE,
+                                            ge=1,
+                                            le=MAX_PAGE_SIZE),
+                         cursor: Optional[str] = None):
     user = await get_current_user(request)
-    offers = await db.offers.find().sort("createdAt", -1).to_list(1000)
-    return {"success": True, "offers": serialize_doc(offers)}
+    offers, page = await list_page(db.offers, OFFER_LIST,
+                                   {"isActive": isActive}, sort, order, limit,
+                                   cursor)
+    return {"success": True, "offers": serialize_doc(offers), **page}
 
 
 @api_router.post("/admin/offers")
@@ -545,10 +650,21 @@ async def create_offer(data: dict, request: Request):
 
 
 @api_router.get("/admin/pages")
-async def get_all_pages(request: Request):
+async def get_all_pages(request: Request,
+                        isPublished: Optional[bool] = None,
+                        template: Optional[str] = None,
+                        sort: Optional[str] = None,
+                        order: Optional[str] = None,
+                        limit: int = Query(DEFAULT_PAGE_SIZE,
+                                           ge=1,
+                                           le=MAX_PAGE_SIZE),
+                        cursor: Optional[str] = None):
     user = await get_current_user(request)
-    pages = await db.pages.find().to_list(1000)
-    return {"success": True, "pages": serialize_doc(pages)}
+    pages, page = await list_page(db.pages, PAGE_LIST, {
+        "isPublished": isPublished,
+        "template": template
+    }, sort, order, limit, cursor)
+    return {"success": True, "pages": serialize_doc(pages), **page}
 
 
 @api_router.post("/admin/pages")
@@ -574,11 +690,74 @@ async def create_page(data: dict, request: Request):
 # ===== ADMIN MEDIA ROUTES =====
 
 
+# Filters are built below (type prefixes, ranges); indexes live with the
+# media analysis (see image_analysis.ensure_media_indexes)
+MEDIA_LIST = ListSpec(
+    sort_fields={"createdAt": "createdAt", "capturedAt": "metadata.capturedAt",
+                 "size": "size", "width": "width"},
+    filter_fields={},
+    default_sort="createdAt")
+
+
 @api_router.get("/admin/media")
-async def get_all_media(request: Request):
+async def get_all_media(request: Request,
+                        media_type: Optional[str] = Query(None, alias="type"),
+                        camera: Optional[str] = None,
+                        lens: Optional[str] = None,
+                        orientation: Optional[str] = None,
+                        color: Optional[str] = None,
+                        capturedFrom: Optional[datetime] = None,
+                        capturedTo: Optional[datetime] = None,
+                        minWidth: Optional[int] = None,
+                        sort: Optional[str] = None,
+                        order: Optional[str] = None,
+                        limit: int = Query(DEFAULT_PAGE_SIZE,
+                                           ge=1,
+                                           le=MAX_PAGE_SIZE),
+                        cursor: Optional[str] = None):
+    """Media library, filtered and sorted server-side on indexed fields"""
+    user = await get_current_user(request)
+    query = {}
+    if media_type:
+        # "image" matches every image/* type, "image/png" only PNGs
+        query["type"] = media_type if "/" in media_type else {
+            "$regex": f"^{re.escape(media_type)}/"
+        }
+    for field, value in (("metadata.camera", camera), ("metadata.lens", lens),
+                         ("metadata.orientation", orientation),
+                         ("metadata.colorFamily", color)):
+        if value:
+            query[field] = value
+    if capturedFrom or capturedTo:
+        query["metadata.capturedAt"] = {
+            **({"$gte": capturedFrom} if capturedFrom else {}),
+            **({"$lte": capturedTo} if capturedTo else {})
+        }
+    if minWidth:
+        query["width"] = {"$gte": minWidth}
+
+    media, page = await list_page(db.media,
+                                  MEDIA_LIST,
+                                  sort=sort,
+                                  order=order,
+                                  limit=limit,
+                                  cursor=cursor,
+                                  query=query)
+    return {"success": True, "media": serialize_doc(media), **page}
+
+
+@api_router.get("/admin/media/facets")
+async def get_media_facets(request: Request):
+    """Distinct values for the media library filters"""
     user = await get_current_user(request)
-    media = await db.media.find().sort("createdAt", -1).to_list(1000)
-    return {"success": True, "media": serialize_doc(media)}
+    facets = {}
+    for name, field in (("cameras", "metadata.camera"),
+                        ("lenses", "metadata.lens"),
+                        ("orientations", "metadata.orientation"),
+                        ("colors", "metadata.colorFamily")):
+        values = await db.media.distinct(field)
+        facets[name] = sorted(v for v in values if v)
+    return {"success": True, **facets}
 
 
 @api_router.post("/admin/media")
@@ -602,9 +781,10 @@ async def upload_media(data: dict, request: Request):
 @api_router.delete("/admin/media/{media_id}")
 async def delete_media(media_id: str, request: Request):
     user = await get_current_user(request)
-    result = await db.media.delete_one({"mediaId": media_id})
-    if result.deleted_count == 0:
+    deleted = await db.media.find_one_and_delete({"mediaId": media_id})
+    if not deleted:
         raise HTTPException(status_code=404, detail="Media not found")
+    await blob_store.release(db, deleted.get("blobId"))
     await log_activity(user["userId"], "delete", "media", media_id)
     return {"success": True, "message": "Media deleted"}
 
@@ -674,32 +854,205 @@ async def admin_upload_gallery_image(file: UploadFile = File(...), request: Requ
     if request:
         user = await get_current_user(request)
     try:
-        filename = f"{uuid.uuid4()}_{file.filename}"
-        file_path = UPLOAD_DIR / filename
-        
-        content = await file.read()
-        with open(file_path, "wb") as f:
-            f.write(content)
-        
-        gallery_item = {
-            "title": filename,
-            "category": "general",
-            "image": f"/uploads/{filename}",
-            "description": "",
-            "order": 0,
-            "isActive": True,
-            "createdAt": datetime.utcnow(),
-            "updatedAt": datetime.utcnow()
-        }
+        blob, created = await blob_store.store_upload(db, file)
+        gallery_item = build_gallery_item(Path(file.filename).name, blob,
+                                          cached_image_fields(blob))
         
         result = await db.portfolio.insert_one(gallery_item)
         created_item = await db.portfolio.find_one({"_id": result.inserted_id})
+        job_id = await schedule_image_processing(blob)
+        if job_id is None and "perceptualHash" in created_item:
+            # Already analyzed (duplicate upload): flag right away
+            created_item["nearDuplicates"] = await near_duplicates.flag(
+                db, created_item)
         
-        return serialize_doc(created_item)
+        return {**serialize_doc(created_item), "jobId": job_id}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# Bulk gallery upload
+import json
+import asyncio
+from fastapi.responses import StreamingResponse
+from starlette.datastructures import UploadFile as FormFile
+
+BULK_UPLOAD_CONCURRENCY = int(os.environ.get("BULK_UPLOAD_CONCURRENCY", "4"))
+BULK_UPLOAD_MAX_FILES = int(os.environ.get("BULK_UPLOAD_MAX_FILES", "1000"))
+_bulk_uploads = set()
+
+
+async def run_bulk_gallery_upload(form, files: list, category: str,
+                                  events: asyncio.Queue):
+    """Store and process every file, then insert all portfolio items at once"""
+    semaphore = asyncio.Semaphore(BULK_UPLOAD_CONCURRENCY)
+    completed = 0
+
+    async def process(index: int, file):
+        nonlocal completed
+        async with semaphore:
+            try:
+                blob, created = await blob_store.store_upload(db, file)
+                image_fields = await blob_image_fields(blob)
+                item = build_gallery_item(Path(file.filename).name, blob,
+                                          image_fields)
+                item.update({"category": category, "order": index})
+                event = {"status": "processed", "deduplicated": not created}
+            except Exception as e:
+                item = blob = None
+                detail = e.detail if isinstance(e, HTTPException) else str(e)
+                event = {"status": "failed", "error": detail}
+            completed += 1
+            await events.put({
+                "type": "file",
+                "index": index,
+                "filename": file.filename,
+                "completed": completed,
+                "total": len(files),
+                **event
+            })
+            return item, blob
+
+    try:
+        results = await asyncio.gather(*(process(index, file)
+                                         for index, file in enumerate(files)))
+        stored = [(item, blob) for item, blob in results if item]
+        try:
+            if stored:
+                await db.portfolio.insert_many([item for item, _ in stored],
+                                               ordered=False)
+        except BulkWriteError as e:
+            # The other documents were inserted and keep their blobs
+            rejected = {error["index"] for error in e.details["writeErrors"]}
+            for index in sorted(rejected):
+                item, blob = stored[index]
+                await blob_store.release(db, blob["_id"])
+                await events.put({
+                    "type": "file",
+                    "index": item["order"],
+                    "filename": item["title"],
+                    "status": "failed",
+                    "error": "Could not be saved"
+                })
+            stored = [
+                entry for index, entry in enumerate(stored)
+                if index not in rejected
+            ]
+        except Exception:
+            for _, blob in stored:
+                await blob_store.release(db, blob["_id"])
+            raise
+        items = [item for item, _ in stored]
+        for _, blob in stored:
+            if await schedule_image_processing(blob) is None:
+                await flag_near_duplicates(blob["_id"])
+        await events.put({
+            "type": "done",
+            "uploaded": len(items),
+            "failed": len(files) - len(items),
+            "items": serialize_doc(items)
+        })
+    except Exception as e:
+        logger.error(f"Bulk gallery upload failed: {e}")
+        await events.put({"type": "done", "error": str(e)})
+    finally:
+        await form.close()
+
+
+@api_router.post("/admin/gallery/upload/bulk")
+async def admin_bulk_upload_gallery(request: Request):
+    """
+    Upload many gallery images in one multipart request (field "files",
+    optional "category"). The response is NDJSON: one line per file as it
+    finishes, then a summary line with the created items. Processing keeps
+    going if the client disconnects.
+    """
+    user = await get_current_user(request)
+    form = await request.form(max_files=BULK_UPLOAD_MAX_FILES)
+    files = [f for f in form.getlist("files") if isinstance(f, FormFile)]
+    if not files:
+        await form.close()
+        raise HTTPException(status_code=400, detail="No files uploaded")
+    category = form.get("category") or "general"
+
+    events: asyncio.Queue = asyncio.Queue()
+    # The form (and its spooled files) is closed by the task, not by FastAPI,
+    # because the work outlives this handler
+    task = asyncio.create_task(
+        run_bulk_gallery_upload(form, files, category, events))
+    _bulk_uploads.add(task)
+    task.add_done_callback(_bulk_uploads.discard)
+
+    async def progress():
+        while True:
+            event = await events.get()
+            yield json.dumps(event, default=str) + "\n"
+            if event["type"] == "done":
+                break
+
+    return StreamingResponse(progress(), media_type="application/x-ndjson")
+
+
+# Near-duplicate detection and "similar photos"
+from image_hashes import (NearDuplicateIndex, NEAR_DUPLICATE_DISTANCE,
+                          ACTIVE_PORTFOLIO)
+from image_features import SimilarityIndex
+
+near_duplicates = NearDuplicateIndex()
+similar_images = SimilarityIndex()
+
+
+@api_router.get("/admin/gallery/duplicates")
+async def admin_gallery_duplicates(request: Request,
+                                   maxDistance: int = NEAR_DUPLICATE_DISTANCE):
+    """
+    Near-duplicate report over the active portfolio: groups of items whose
+    pHashes are within maxDistance bits of each other, largest group first.
+    Within a group the highest-resolution, oldest item comes first as the
+    suggested one to keep.
+    """
+    user = await get_current_user(request)
+    if not 0 <= maxDistance <= 32:
+        raise HTTPException(status_code=400, detail="Invalid maxDistance")
+    groups = await near_duplicates.groups(db, maxDistance)
+    ids = [ObjectId(member["id"]) for group in groups for member in group]
+    items = {}
+    async for item in db.portfolio.find({"_id": {
+            "$in": ids
+    }}, {
+            "title": 1,
+            "category": 1,
+            "image": 1,
+            "placeholder": 1,
+            "width": 1,
+            "height": 1,
+            "size": 1,
+            "createdAt": 1
+    }):
+        items[str(item["_id"])] = item
+
+    report = []
+    for group in groups:
+        members = [{
+            **serialize_doc(items[member["id"]]), "closestDistance":
+            member["closest"]
+        } for member in group if member["id"] in items]
+        members.sort(key=lambda item: (-(item.get("width") or 0) *
+                                       (item.get("height") or 0),
+                                       item.get("createdAt") or datetime.min))
+        if len(members) > 1:
+            report.append(members)
+    report.sort(key=len, reverse=True)
+    return {
+        "success": True,
+        "maxDistance": maxDistance,
+        "groups": report,
+        "duplicates": sum(len(group) - 1 for group in report)
+    }
+
+
 @api_router.delete("/admin/gallery/{gallery_id}")
 async def admin_delete_gallery_image(gallery_id: str, request: Request):
     user = await get_current_user(request)
@@ -714,6 +1067,8 @@ async def admin_delete_gallery_image(gallery_id: str, request: Request):
         
         if result.matched_count == 0:
             raise HTTPException(status_code=404, detail="Gallery item not found")
+        near_duplicates.discard(gallery_id)
+        similar_images.discard(gallery_id)
         
         return {"message": "Gallery item deleted successfully"}
     except Exception as e:
@@ -721,16 +1076,56 @@ async def admin_delete_gallery_image(gallery_id: str, request: Request):
 
 
 # ===== ADMIN ANALYTICS ROUTES =====
+from analytics_funnel import (FUNNEL_STEPS, ensure_funnel_indexes,
+                              record_funnel_step, get_funnel_report)
+from analytics_heatmap import heatmap_aggregator, get_heatmap, list_heatmaps
+from analytics_vitals import ensure_vitals_indexes, record_vital, get_vitals_report
+from analytics_filter import classify_event, session_weight
+from analytics_enrich import enrich_event, geoip
 
 
 @api_router.post("/analytics/track")
-async def track_event(data: dict):
+async def track_event(data: dict, request: Request):
     """Track analytics event"""
+    event_type = data.get("eventType")
+    user_agent = request.headers.get("user-agent") or data.get("userAgent")
+    decision = classify_event(event_type, user_agent, data.get("sessionId"))
+    if not decision.keep:
+        return {"success": True, "message": "Event filtered"}
+
+    # Web vitals go straight into quantile sketches, raw samples are not kept
+    if event_type == "web_vital":
+        if decision.is_bot:
+            return {"success": True, "message": "Event filtered"}
+        recorded = await record_vital(db, data.get("page"), data.get("data"),
+                                      decision.weight)
+        if not recorded:
+            raise HTTPException(status_code=400, detail="Invalid web vital")
+        return {"success": True, "message": "Event tracked"}
+
     event_data = {
-        **data, "eventId": str(uuid.uuid4()),
+        **data,
+        **enrich_event(request, user_agent), "eventId": str(uuid.uuid4()),
+        "weight": decision.weight,
         "timestamp": datetime.utcnow()
     }
+    if decision.is_bot:
+        event_data["isBot"] = True
     await db.analytics_events.insert_one(event_data)
+
+    # Tagged bot traffic is stored but kept out of every rollup
+    if decision.is_bot:
+        return {"success": True, "message": "Event tracked"}
+
+    # Inquiries enter the funnel from create_inquiry, not from the client
+    if event_type in ("page_view", "click"):
+        weight = session_weight(data.get("sessionId"), FUNNEL_STEPS)
+        if weight:
+            await record_funnel_step(db, data.get("sessionId"), event_type,
+                                     data.get("page"), weight)
+    if event_type == "click":
+        heatmap_aggregator.add_click(data.get("page"), data.get("data"),
+                                     decision.weight)
     return {"success": True, "message": "Event tracked"}
 
 
@@ -740,29 +1135,40 @@ async def get_analytics_stats(request: Request):
     if not has_permission(user["role"], "manage_analytics"):
         raise HTTPException(status_code=403, detail="Permission denied")
 
-    # Get statistics
-    total_views = await db.analytics_events.count_documents(
-        {"eventType": "page_view"})
-    total_clicks = await db.analytics_events.count_documents(
-        {"eventType": "click"})
+    # Get statistics (sampled events count for 1 / sample rate)
+    human = {"isBot": {"$ne": True}}
+    weight = {"$sum": {"$ifNull": ["$weight", 1]}}
+    totals = await db.analytics_events.aggregate([{
+        "$match": {
+            **human, "eventType": {
+                "$in": ["page_view", "click"]
+            }
+        }
+    }, {
+        "$group": {
+            "_id": "$eventType",
+            "count": weight
+        }
+    }]).to_list(10)
+    totals = {item["_id"]: round(item["count"]) for item in totals}
+    total_views = totals.get("page_view", 0)
+    total_clicks = totals.get("click", 0)
     total_inquiries = await db.inquiries.count_documents({})
 
     # Get recent page views
     recent_views = await db.analytics_events.find({
-        "eventType": "page_view"
+        **human, "eventType": "page_view"
     }).sort("timestamp", -1).limit(100).to_list(100)
 
     # Top pages
     pipeline = [{
         "$match": {
-            "eventType": "page_view"
+            **human, "eventType": "page_view"
         }
     }, {
         "$group": {
             "_id": "$page",
-            "count": {
-                "$sum": 1
-            }
+            "count": weight
         }
     }, {
         "$sort": {
@@ -785,6 +1191,54 @@ async def get_analytics_stats(request: Request):
     }
 
 
+@api_router.get("/admin/analytics/funnel")
+async def get_analytics_funnel(request: Request,
+                               days: int = 30,
+                               entryPage: Optional[str] = None):
+    user = await get_current_user(request)
+    if not has_permission(user["role"], "manage_analytics"):
+        raise HTTPException(status_code=403, detail="Permission denied")
+
+    funnel = await get_funnel_report(db, days=days, entry_page=entryPage)
+    return {"success": True, "funnel": funnel}
+
+
+@api_router.get("/admin/analytics/heatmaps")
+async def get_analytics_heatmaps(request: Request):
+    user = await get_current_user(request)
+    if not has_permission(user["role"], "manage_analytics"):
+        raise HTTPException(status_code=403, detail="Permission denied")
+
+    heatmaps = await list_heatmaps(db)
+    return {"success": True, "heatmaps": heatmaps}
+
+
+@api_router.get("/admin/analytics/heatmap")
+async def get_analytics_heatmap(request: Request,
+                                page: str,
+                                viewport: str = "desktop"):
+    user = await get_current_user(request)
+    if not has_permission(user["role"], "manage_analytics"):
+        raise HTTPException(status_code=403, detail="Permission denied")
+
+    heatmap = await get_heatmap(db, page, viewport)
+    if not heatmap:
+        raise HTTPException(status_code=404, detail="Heatmap not found")
+    return {"success": True, "heatmap": heatmap}
+
+
+@api_router.get("/admin/analytics/vitals")
+async def get_analytics_vitals(request: Request,
+                               days: int = 7,
+                               page: Optional[str] = None):
+    user = await get_current_user(request)
+    if not has_permission(user["role"], "manage_analytics"):
+        raise HTTPException(status_code=403, detail="Permission denied")
+
+    vitals = await get_vitals_report(db, days=days, page=page)
+    return {"success": True, "vitals": vitals}
+
+
 # ===== ADMIN MARKETING SCRIPTS ROUTES =====
 
 # ===== EMERGENCY ADMIN RESET ENDPOINT =====
@@ -925,44 +1379,65 @@ async def get_activity_log(request: Request, limit: int = 100):
 from ai_service import ai_service
 
 
+
+async def run_ai_task(task: str, data: dict):
+    """Dispatch one AI generation request (inline or from a job)"""
+    if task == "caption":
+        return await ai_service.generate_caption(
+            image_description=data.get("description", ""),
+            style=data.get("style", "professional"))
+    if task == "ad_copy":
+        return await ai_service.generate_ad_copy(
+            service=data.get("service", ""),
+            target_audience=data.get("targetAudience", ""),
+            tone=data.get("tone", "professional"))
+    if task == "content":
+        return await ai_service.enhance_content(
+            original_content=data.get("content", ""),
+            enhancement_type=data.get("type", "improve"))
+    if task == "seo":
+        return await ai_service.generate_seo_metadata(
+            page_title=data.get("title", ""),
+            page_content=data.get("content", ""))
+    raise ValueError(f"Unknown AI task: {task}")
+
+
+async def handle_ai_request(task: str, action: str, data: dict,
+                            request: Request):
+    """Run inline, or queue as a job when the body sets "async": true"""
+    user = await get_current_user(request)
+    if not data.get("async"):
+        result = await run_ai_task(task, data)
+        await log_activity(user["userId"], action, task)
+        return result
+    job = await job_queue.enqueue(db,
+                                  "ai.generate", {
+                                      "task": task,
+                                      "data": data
+                                  },
+                                  created_by=user["userId"])
+    await log_activity(user["userId"], action, task)
+    return {"success": True, "jobId": job["jobId"], "status": job["status"]}
+
+
 @api_router.post("/admin/ai/generate-caption")
 async def generate_caption(data: dict, request: Request):
-    user = await get_current_user(request)
-    result = await ai_service.generate_caption(
-        image_description=data.get("description", ""),
-        style=data.get("style", "professional"))
-    await log_activity(user["userId"], "ai_generate", "caption")
-    return result
+    return await handle_ai_request("caption", "ai_generate", data, request)
 
 
 @api_router.post("/admin/ai/generate-ad-copy")
 async def generate_ad_copy(data: dict, request: Request):
-    user = await get_current_user(request)
-    result = await ai_service.generate_ad_copy(
-        service=data.get("service", ""),
-        target_audience=data.get("targetAudience", ""),
-        tone=data.get("tone", "professional"))
-    await log_activity(user["userId"], "ai_generate", "ad_copy")
-    return result
+    return await handle_ai_request("ad_copy", "ai_generate", data, request)
 
 
 @api_router.post("/admin/ai/enhance-content")
 async def enhance_content(data: dict, request: Request):
-    user = await get_current_user(request)
-    result = await ai_service.enhance_content(
-        original_content=data.get("content", ""),
-        enhancement_type=data.get("type", "improve"))
-    await log_activity(user["userId"], "ai_enhance", "content")
-    return result
+    return await handle_ai_request("content", "ai_enhance", data, request)
 
 
 @api_router.post("/admin/ai/generate-seo")
 async def generate_seo(data: dict, request: Request):
-    user = await get_current_user(request)
-    result = await ai_service.generate_seo_metadata(
-        page_title=data.get("title", ""), page_content=data.get("content", ""))
-    await log_activity(user["userId"], "ai_generate", "seo")
-    return result
+    return await handle_ai_request("seo", "ai_generate", data, request)
 
 
 # ===== ADMIN SETTINGS ROUTES =====
@@ -988,6 +1463,7 @@ async def get_settings(request: Request):
             "enableGoogleAnalytics": False,
             "enableGoogleTagManager": False
         }
+    settings.setdefault("watermark", WATERMARK_DEFAULTS)
     return {"success": True, "settings": serialize_doc(settings)}
 
 
@@ -1002,6 +1478,9 @@ async def update_settings(data: dict, request: Request):
         ai_service.update_api_keys(groq_key=data.get("groqApiKey"),
                                    gemini_key=data.get("geminiApiKey"))
 
+    if "watermark" in data:
+        data["watermark"] = normalize_watermark(data["watermark"])
+
     data["updatedAt"] = datetime.utcnow()
     data["type"] = "system"
 
@@ -1009,15 +1488,35 @@ async def update_settings(data: dict, request: Request):
     await db.settings.update_one({"type": "system"}, {"$set": data},
                                  upsert=True)
 
+    if "watermark" in data:
+        # New config hash: re-render the gallery in the background
+        watermarker.invalidate()
+        await job_queue.enqueue(db,
+                                "image.watermark",
+                                priority=PRIORITY_LOW,
+                                dedupe_key=config_hash(data["watermark"]),
+                                created_by=user["userId"])
+
     await log_activity(user["userId"], "update", "settings")
     return {"success": True, "message": "Settings updated"}
 
 
 # ===== FILE UPLOAD ROUTES =====
 # ===== FILE UPLOAD ROUTES (SAFE FOR RENDER & LOCAL) =====
-import shutil
 from pathlib import Path
 import os
+from storage import get_storage, key_from_url
+from blob_store import BlobStore
+from image_variants import create_variants, shutdown_pool
+from image_analysis import (is_analyzed, process_blob,
+                            backfill as backfill_image_analysis,
+                            ensure_media_indexes)
+from job_queue import job_queue, job_status, PRIORITY_HIGH, PRIORITY_LOW
+from video_processing import (VideoProcessor, VideoProcessingError,
+                              ffmpeg_available, HLS_HEIGHTS,
+                              DEFAULT_HLS_HEIGHTS, MIN_HLS_HEIGHT,
+                              MAX_HLS_HEIGHT, VIDEO_DOCUMENT_FIELDS,
+                              format_duration, valid_hls_heights)
 
 # 🗂️ Determine safe upload directory
 # Prefer env var -> else fallback to /tmp/uploads (Render safe)
@@ -1038,6 +1537,127 @@ except Exception as e:
 
 print(f"📂 Using UPLOAD_DIR: {UPLOAD_DIR.resolve()}")
 
+# Local disk by default; STORAGE_BACKEND=s3 keeps uploads across deploys
+storage = get_storage(UPLOAD_DIR)
+blob_store = BlobStore(storage, UPLOAD_DIR)
+video_processor = VideoProcessor(blob_store)
+IMAGE_FIELDS = ("width", "height", "variants", "srcset", "placeholder",
+                "metadata", "perceptualHash")
+
+
+async def blob_image_fields(blob: dict) -> dict:
+    """Variant/dimension fields for an image blob, rendered once per blob"""
+    if "variants" in blob:
+        return {k: blob[k] for k in IMAGE_FIELDS if k in blob}
+    if not (blob.get("contentType") or "").startswith("image/"):
+        return {}
+    prefix = f"variants/{blob['_id']}"
+    try:
+        async with blob_store.local_copy(blob) as src, \
+                blob_store.scratch_dir() as out_dir:
+            fields = await create_variants(src, out_dir, f"/uploads/{prefix}")
+            if not fields:
+                return {}
+            await storage.put_directory(prefix, out_dir)
+    except FileNotFoundError:
+        return {}
+    await blob_store.save_metadata(db, blob["_id"], fields)
+    return fields
+
+
+def cached_image_fields(blob: dict) -> dict:
+    """Derived image fields already stored on the blob"""
+    return {k: blob[k] for k in IMAGE_FIELDS if k in blob}
+
+
+async def schedule_image_processing(blob: dict,
+                                    created_by: str = None) -> Optional[str]:
+    """Queue variants + analysis for an image blob; returns the jobId"""
+    if not (blob.get("contentType") or "").startswith("image/"):
+        return None
+    if "analysisFailed" in blob or ("variants" in blob and is_analyzed(blob)):
+        return None
+    job = await job_queue.enqueue(db,
+                                  "image.process", {"blobId": blob["_id"]},
+                                  priority=PRIORITY_HIGH,
+                                  dedupe_key=blob["_id"],
+                                  created_by=created_by)
+    return job["jobId"]
+
+
+async def schedule_video_processing(blob: dict,
+                                    created_by: str = None) -> Optional[str]:
+    """Queue poster/preview rendering for a video blob; returns the jobId"""
+    if not (blob.get("contentType") or "").startswith("video/"):
+        return None
+    if "video" in blob:
+        # Rendered for an earlier upload of the same file
+        await video_processor.publish(db, blob)
+        return None
+    if "videoFailed" in blob or not ffmpeg_available():
+        return None
+    job = await job_queue.enqueue(db,
+                                  "video.process", {"blobId": blob["_id"]},
+                                  priority=PRIORITY_HIGH,
+                                  dedupe_key=f"video:{blob['_id']}",
+                                  created_by=created_by)
+    return job["jobId"]
+
+
+async def flag_near_duplicates(blob_id: str) -> int:
+    """Flag near duplicates of the gallery items showing this blob"""
+    flagged = 0
+    async for item in db.portfolio.find({
+            **ACTIVE_PORTFOLIO, "blobId": blob_id,
+            "perceptualHash": {
+                "$exists": True
+            },
+            "nearDuplicates": {
+                "$exists": False
+            }
+    }):
+        if await near_duplicates.flag(db, item):
+            flagged += 1
+    return flagged
+
+
+def build_gallery_item(filename: str, blob: dict, image_fields: dict) -> dict:
+    return {
+        "title": filename,
+        "category": "general",
+        "image": blob_store.url(blob),
+        "description": "",
+        "blobId": blob["_id"],
+        "size": blob["size"],
+        "sha256": blob["_id"],
+        "order": 0,
+        "isActive": True,
+        "createdAt": datetime.utcnow(),
+        "updatedAt": datetime.utcnow(),
+        **image_fields,
+        # Rendered for an earlier upload of the same file
+        **({
+            "watermarked": blob["watermarked"]
+        } if "watermarked" in blob else {})
+    }
+
+
+def build_media_record(filename: str, content_type: Optional[str], blob: dict,
+                       image_fields: dict, uploaded_by: str) -> dict:
+    return {
+        "mediaId": str(uuid.uuid4()),
+        "filename": filename,
+        "uniqueFilename": blob["key"],
+        "url": blob_store.url(blob),
+        "type": content_type or blob.get("contentType"),
+        "size": blob["size"],
+        "sha256": blob["_id"],
+        "blobId": blob["_id"],
+        "uploadedBy": uploaded_by,
+        "createdAt": datetime.utcnow(),
+        **image_fields
+    }
+
 
 @api_router.post("/admin/upload")
 async def upload_file(file: UploadFile = File(...), request: Request = None):
@@ -1045,30 +1665,17 @@ async def upload_file(file: UploadFile = File(...), request: Request = None):
         user = await get_current_user(request)
 
     try:
-        # Generate unique filename
-        file_extension = file.filename.split(
-            ".")[-1] if "." in file.filename else ""
-        unique_filename = f"{uuid.uuid4()}.{file_extension}"
-        file_path = UPLOAD_DIR / unique_filename
-
-        # Save file
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-
-        # Save metadata to database
-        file_url = f"/uploads/{unique_filename}"
-        media_data = {
-            "mediaId": str(uuid.uuid4()),
-            "filename": file.filename,
-            "uniqueFilename": unique_filename,
-            "url": file_url,
-            "type": file.content_type,
-            "size": file_path.stat().st_size,
-            "uploadedBy": user["userId"] if request else "system",
-            "createdAt": datetime.utcnow()
-        }
+        # Save file (chunked, off the event loop, deduplicated by SHA-256)
+        blob, created = await blob_store.store_upload(db, file)
+
+        # Save metadata to database; derivatives are rendered by a job
+        media_data = build_media_record(file.filename, file.content_type,
+                                        blob, cached_image_fields(blob),
+                                        user["userId"] if request else "system")
 
         await db.media.insert_one(media_data)
+        job_id = await schedule_image_processing(
+            blob) or await schedule_video_processing(blob)
 
         if request:
             await log_activity(user["userId"], "upload", "file",
@@ -1077,13 +1684,722 @@ async def upload_file(file: UploadFile = File(...), request: Request = None):
         return {
             "success": True,
             "message": "File uploaded successfully",
-            "file": serialize_doc(media_data)
+            "deduplicated": not created,
+            "file": serialize_doc(media_data),
+            "jobId": job_id
         }
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"File upload error: {e}")
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
 
+@api_router.post("/admin/upload/by-hash")
+async def upload_by_hash(data: dict, request: Request):
+    """
+    Complete an upload without sending the bytes when they are already stored
+    Body: { "sha256", "filename", "contentType"?, "target": "media"|"gallery" }
+    Returns 404 if the content is unknown; the client then uploads normally.
+    """
+    user = await get_current_user(request)
+    target = data.get("target", "media")
+    if target not in ("media", "gallery"):
+        raise HTTPException(status_code=400, detail="Invalid target")
+
+    blob = await blob_store.acquire(db, (data.get("sha256") or "").lower())
+    if not blob:
+        raise HTTPException(status_code=404, detail="Content not found")
+
+    filename = Path(data.get("filename") or blob["key"]).name
+    image_fields = cached_image_fields(blob)
+    if target == "gallery":
+        gallery_item = build_gallery_item(filename, blob, image_fields)
+        await db.portfolio.insert_one(gallery_item)
+        job_id = await schedule_image_processing(blob)
+        if job_id is None and "perceptualHash" in gallery_item:
+            gallery_item["nearDuplicates"] = await near_duplicates.flag(
+                db, gallery_item)
+        return {**serialize_doc(gallery_item), "jobId": job_id}
+
+    media_data = build_media_record(filename, data.get("contentType"), blob,
+                                    image_fields, user["userId"])
+    await db.media.insert_one(media_data)
+    job_id = await schedule_image_processing(
+        blob) or await schedule_video_processing(blob, user["userId"])
+    await log_activity(user["userId"], "upload", "file", media_data["mediaId"])
+    return {
+        "success": True,
+        "message": "File uploaded successfully",
+        "deduplicated": True,
+        "file": serialize_doc(media_data),
+        "jobId": job_id
+    }
+
+
+# ===== RESUMABLE UPLOADS (large videos, flaky connections) =====
+from resumable_uploads import ResumableUploads, RECOMMENDED_CHUNK_SIZE
+
+resumable_uploads = ResumableUploads(UPLOAD_DIR, blob_store)
+
+
+@api_router.post("/admin/uploads/resumable")
+async def create_resumable_upload(data: dict, request: Request,
+                                  response: Response):
+    """
+    Start a resumable upload
+    Body: { "filename", "size", "contentType"?, "videoId"? }
+    """
+    user = await get_current_user(request)
+    session = await resumable_uploads.create(db, data, user["userId"])
+    response.headers["Location"] = \
+        f"/api/admin/uploads/resumable/{session['uploadId']}"
+    return {
+        "success": True,
+        "uploadId": session["uploadId"],
+        "offset": session["offset"],
+        "size": session["size"],
+        "chunkSize": RECOMMENDED_CHUNK_SIZE
+    }
+
+
+@api_router.head("/admin/uploads/resumable/{upload_id}")
+async def head_resumable_upload(upload_id: str, request: Request):
+    user = await get_current_user(request)
+    session = await resumable_uploads.get_session(db, upload_id)
+    return Response(status_code=200,
+                    headers={
+                        "Upload-Offset": str(session["offset"]),
+                        "Upload-Length": str(session["size"]),
+                        "Cache-Control": "no-store"
+                    })
+
+
+@api_router.get("/admin/uploads/resumable/{upload_id}")
+async def get_resumable_upload(upload_id: str, request: Request):
+    user = await get_current_user(request)
+    session = await resumable_uploads.get_session(db, upload_id)
+    return {
+        "success": True,
+        "uploadId": upload_id,
+        "offset": session["offset"],
+        "size": session["size"]
+    }
+
+
+@api_router.patch("/admin/uploads/resumable/{upload_id}")
+async def append_resumable_upload(upload_id: str, request: Request):
+    """Append the request body at the offset given in Upload-Offset"""
+    user = await get_current_user(request)
+    try:
+        offset = int(request.headers.get("upload-offset"))
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400,
+                            detail="Upload-Offset header is required")
+
+    new_offset = await resumable_uploads.append(db, upload_id, offset,
+                                                request.stream())
+    return Response(status_code=204,
+                    headers={"Upload-Offset": str(new_offset)})
+
+
+@api_router.post("/admin/uploads/resumable/{upload_id}/finalize")
+async def finalize_resumable_upload(upload_id: str, request: Request):
+    user = await get_current_user(request)
+    blob, created, session = await resumable_uploads.finalize(db, upload_id)
+
+    media_data = build_media_record(session["filename"],
+                                    session["contentType"], blob,
+                                    cached_image_fields(blob), user["userId"])
+    await db.media.insert_one(media_data)
+
+    if session.get("videoId"):
+        await db.videos.update_one({"videoId": session["videoId"]}, {
+            "$set": {
+                "videoUrl": media_data["url"],
+                "blobId": blob["_id"],
+                "updatedAt": datetime.utcnow()
+            }
+        })
+    # After linking, so derivatives reach the video document too
+    job_id = await schedule_image_processing(
+        blob) or await schedule_video_processing(blob, user["userId"])
+
+    await log_activity(user["userId"], "upload", "file", media_data["mediaId"])
+    return {
+        "success": True,
+        "message": "File uploaded successfully",
+        "deduplicated": not created,
+        "file": serialize_doc(media_data),
+        "jobId": job_id
+    }
+
+
+@api_router.delete("/admin/uploads/resumable/{upload_id}")
+async def abort_resumable_upload(upload_id: str, request: Request):
+    user = await get_current_user(request)
+    await resumable_uploads.abort(db, upload_id)
+    return {"success": True, "message": "Upload aborted"}
+
+
+# Orphaned upload cleanup
+from upload_gc import UploadGC, UPLOAD_GC_GRACE, blob_id_of
+
+upload_gc = UploadGC(storage)
+
+
+@api_router.post("/admin/maintenance/upload-gc")
+async def run_upload_gc(request: Request, data: dict = None):
+    """Queue an orphan collection; dry run unless dryRun is false"""
+    user = await get_current_user(request)
+    if not has_permission(user["role"], "manage_settings"):
+        raise HTTPException(status_code=403, detail="Permission denied")
+    data = data or {}
+    try:
+        grace = timedelta(hours=float(data["graceHours"])) \
+            if data.get("graceHours") is not None else UPLOAD_GC_GRACE
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid graceHours")
+
+    job = await job_queue.enqueue(db,
+                                  "maintenance.upload_gc", {
+                                      "dryRun":
+                                      data.get("dryRun", True) is not False,
+                                      "graceHours":
+                                      grace.total_seconds() / 3600
+                                  },
+                                  dedupe_key="upload_gc",
+                                  created_by=user["userId"])
+    await log_activity(user["userId"], "run", "upload_gc")
+    return {
+        "success": True,
+        "jobId": job["jobId"],
+        "job": serialize_doc(job_status(job))
+    }
+
+
+@api_router.get("/admin/maintenance/upload-gc")
+async def get_upload_gc_reports(request: Request):
+    user = await get_current_user(request)
+    if not has_permission(user["role"], "manage_settings"):
+        raise HTTPException(status_code=403, detail="Permission denied")
+    reports = await db.maintenance_reports.find({
+        "type": "upload_gc"
+    }).sort("startedAt", -1).to_list(10)
+    return {"success": True, "reports": serialize_doc(reports)}
+
+
+# Lossless re-optimization of stored JPEG/PNG uploads (see image_optimize.py)
+from image_optimize import UploadOptimizer
+
+upload_optimizer = UploadOptimizer(blob_store)
+
+
+@api_router.post("/admin/maintenance/optimize-uploads")
+async def run_upload_optimization(request: Request, data: dict = None):
+    """
+    Queue a lossless recompression of stored images
+    Body: { "stripMetadata"?: bool (default false), "dryRun"?: bool
+    (default true) }. Resumes where an interrupted run stopped.
+    """
+    user = await get_current_user(request)
+    if not has_permission(user["role"], "manage_settings"):
+        raise HTTPException(status_code=403, detail="Permission denied")
+    data = data or {}
+    options = {
+        "stripMetadata": data.get("stripMetadata") is True,
+        "dryRun": data.get("dryRun", True) is not False
+    }
+    job = await job_queue.enqueue(db,
+                                  "maintenance.optimize_uploads",
+                                  options,
+                                  priority=PRIORITY_LOW,
+                                  dedupe_key="optimize_uploads",
+                                  created_by=user["userId"])
+    if job["payload"] != options:
+        # Runs share the resume state, so only one may be active at a time
+        raise HTTPException(
+            status_code=409,
+            detail=f"Optimization job {job['jobId']} with other options is "
+            f"already {job['status']}")
+    await log_activity(user["userId"], "run", "optimize_uploads")
+    return {
+        "success": True,
+        "jobId": job["jobId"],
+        "job": serialize_doc(job_status(job))
+    }
+
+
+@api_router.get("/admin/maintenance/optimize-uploads")
+async def get_upload_optimization_reports(request: Request):
+    """Recent runs with their per-file before/after sizes"""
+    user = await get_current_user(request)
+    if not has_permission(user["role"], "manage_settings"):
+        raise HTTPException(status_code=403, detail="Permission denied")
+    reports = await db.maintenance_reports.find({
+        "type": "upload_optimize"
+    }).sort("startedAt", -1).to_list(10)
+    return {"success": True, "reports": serialize_doc(reports)}
+
+
+# ===== BACKGROUND JOBS =====
+
+
+async def process_image_job(db, payload: dict):
+    blob = await db.blobs.find_one({"_id": payload["blobId"]})
+    if not blob:
+        return {"blobId": payload["blobId"], "skipped": "missing"}
+    await process_blob(db, blob_store, blob)
+    blob = await db.blobs.find_one({"_id": blob["_id"]})
+    fields = await blob_image_fields(blob)
+    pending = {"blobId": blob["_id"], "variants": {"$exists": False}}
+    await db.portfolio.update_many(pending, {"$set": fields})
+    await db.media.update_many(pending, {"$set": fields})
+    await similar_images.add_blob(db, blob)
+    return {
+        "blobId": blob["_id"],
+        "variants": len(fields.get("variants", [])),
+        "watermarked": await watermark_blobs(db, [blob["_id"]]),
+        "nearDuplicates": await flag_near_duplicates(blob["_id"])
+    }
+
+
+async def backfill_images_job(db, payload: dict):
+    return {"processed": await backfill_image_analysis(db, blob_store)}
+
+
+async def upload_gc_job(db, payload: dict):
+    report = await upload_gc.run(
+        db,
+        dry_run=payload.get("dryRun", True),
+        grace=timedelta(hours=payload.get("graceHours",
+                                          UPLOAD_GC_GRACE.total_seconds() /
+                                          3600)))
+    if report is None:
+        raise RuntimeError("Upload GC is already running")
+    report.pop("_id", None)
+    return report
+
+
+async def optimize_uploads_job(db, payload: dict):
+    return await upload_optimizer.run(db,
+                                      strip=payload.get("stripMetadata", False),
+                                      dry_run=payload.get("dryRun", False))
+
+
+async def ai_generate_job(db, payload: dict):
+    return await run_ai_task(payload["task"], payload.get("data", {}))
+
+
+# Watermarked derivatives for the public gallery (see watermark.py)
+from watermark import (Watermarker, normalize_watermark, config_hash,
+                       DEFAULTS as WATERMARK_DEFAULTS)
+
+watermarker = Watermarker(blob_store)
+
+
+async def watermark_blobs(db, blob_ids: Optional[list] = None) -> int:
+    """Render the current watermark for portfolio images still missing it"""
+    state = await watermarker.current(db)
+    if not state:
+        return 0
+    query = {
+        "blobId": {
+            "$exists": True
+        },
+        "watermarked.hash": {
+            "$ne": state["hash"]
+        }
+    }
+    if blob_ids is not None:
+        query["blobId"] = {"$in": blob_ids}
+    rendered = 0
+    for blob_id in await db.portfolio.distinct("blobId", query):
+        blob = await db.blobs.find_one({"_id": blob_id})
+        if not blob or not (blob.get("contentType")
+                            or "").startswith("image/"):
+            continue
+        watermarked = await watermarker.render(db, blob, state)
+        if watermarked:
+            await db.portfolio.update_many(
+                {"blobId": blob_id}, {"$set": {"watermarked": watermarked}})
+            rendered += 1
+    return rendered
+
+
+async def watermark_job(db, payload: dict):
+    # Settings may have changed on another worker moments ago
+    watermarker.invalidate()
+    return {"rendered": await watermark_blobs(db, payload.get("blobIds"))}
+
+
+async def public_portfolio(items: list) -> list:
+    """Portfolio documents as served publicly (watermarked when enabled)"""
+    state = await watermarker.current(db)
+    views = (watermarker.public_view(item, state) for item in items)
+    return [view for view in views if view is not None]
+
+
+# Video posters, preview loops and HLS ladders (see video_processing.py)
+async def video_blob(video: dict) -> Optional[dict]:
+    """Blob behind a video document's uploaded file, if any"""
+    blob_id = video.get("blobId") or blob_id_of(
+        key_from_url(video.get("videoUrl")) or "")
+    return await db.blobs.find_one({"_id": blob_id}) if blob_id else None
+
+
+async def link_video_upload(video: dict):
+    """Derive (or copy) poster and preview for a video's uploaded file"""
+    blob = await video_blob(video)
+    if blob:
+        await schedule_video_processing(blob)
+
+
+async def process_video_job(db, payload: dict):
+    blob = await db.blobs.find_one({"_id": payload["blobId"]})
+    if not blob:
+        return {"blobId": payload["blobId"], "skipped": "missing"}
+    if not ffmpeg_available():
+        return {"blobId": blob["_id"], "skipped": "ffmpeg not installed"}
+    try:
+        blob["video"] = await video_processor.derive(db, blob)
+    except VideoProcessingError as e:
+        # Not a video ffmpeg can read; retrying will not help
+        await blob_store.save_metadata(db, blob["_id"],
+                                       {"videoFailed": str(e)})
+        return {"blobId": blob["_id"], "failed": str(e)}
+    published = await video_processor.publish(db, blob)
+    hls_job = None
+    if HLS_HEIGHTS and not blob["video"].get("hls"):
+        hls_job = (await job_queue.enqueue(db,
+                                           "video.hls", {
+                                               "blobId": blob["_id"],
+                                               "heights": HLS_HEIGHTS
+                                           },
+                                           priority=PRIORITY_LOW,
+                                           dedupe_key=f"hls:{blob['_id']}")
+                   )["jobId"]
+    return {
+        "blobId": blob["_id"],
+        "duration": blob["video"]["duration"],
+        "videos": published,
+        "hlsJobId": hls_job
+    }
+
+
+async def hls_video_job(db, payload: dict):
+    blob = await db.blobs.find_one({"_id": payload["blobId"]})
+    if not blob:
+        return {"blobId": payload["blobId"], "skipped": "missing"}
+    if not ffmpeg_available():
+        return {"blobId": blob["_id"], "skipped": "ffmpeg not installed"}
+    if "video" not in blob:
+        blob["video"] = await video_processor.derive(db, blob)
+    blob["video"] = await video_processor.transcode_hls(
+        db, blob, payload.get("heights") or DEFAULT_HLS_HEIGHTS)
+    return {
+        "blobId": blob["_id"],
+        "renditions": [r["height"] for r in blob["video"]["hlsRenditions"]],
+        "videos": await video_processor.publish(db, blob)
+    }
+
+
+@api_router.post("/admin/videos/{video_id}/process")
+async def process_video(video_id: str, request: Request, data: dict = None):
+    """
+    Re-render a video's poster and preview, or its HLS ladder
+    Body: { "hls"?: bool, "heights"?: [360, 720, ...] }
+    """
+    user = await get_current_user(request)
+    if not has_permission(user["role"], "manage_videos"):
+        raise HTTPException(status_code=403, detail="Permission denied")
+    data = data or {}
+    video = await db.videos.find_one({"videoId": video_id})
+    if not video:
+        raise HTTPException(status_code=404, detail="Video not found")
+    blob = await video_blob(video)
+    if not blob:
+        raise HTTPException(status_code=400,
+                            detail="Video file is not an upload")
+    if not ffmpeg_available():
+        raise HTTPException(status_code=503,
+                            detail="ffmpeg is not installed on the server")
+
+    if data.get("hls"):
+        heights = data.get("heights") or HLS_HEIGHTS or DEFAULT_HLS_HEIGHTS
+        if not valid_hls_heights(heights):
+            raise HTTPException(
+                status_code=400,
+                detail=f"heights must be even numbers from {MIN_HLS_HEIGHT} "
+                f"to {MAX_HLS_HEIGHT}")
+        job = await job_queue.enqueue(db,
+                                      "video.hls", {
+                                          "blobId": blob["_id"],
+                                          "heights": sorted(set(heights))
+                                      },
+                                      priority=PRIORITY_LOW,
+                                      dedupe_key=f"hls:{blob['_id']}",
+                                      created_by=user["userId"])
+    else:
+        await db.blobs.update_one({"_id": blob["_id"]},
+                                  {"$unset": {
+                                      "videoFailed": ""
+                                  }})
+        job = await job_queue.enqueue(db,
+                                      "video.process", {"blobId": blob["_id"]},
+                                      priority=PRIORITY_HIGH,
+                                      dedupe_key=f"video:{blob['_id']}",
+                                      created_by=user["userId"])
+    await log_activity(user["userId"], "process", "video", video_id)
+    return {
+        "success": True,
+        "jobId": job["jobId"],
+        "job": serialize_doc(job_status(job))
+    }
+
+
+job_queue.register("image.process", process_image_job, timeout=600)
+job_queue.register("image.watermark", watermark_job)
+job_queue.register("image.backfill", backfill_images_job, max_attempts=1)
+job_queue.register("maintenance.upload_gc", upload_gc_job, max_attempts=1)
+job_queue.register("ai.generate", ai_generate_job, timeout=120)
+job_queue.register("video.process", process_video_job, timeout=1800)
+job_queue.register("video.hls", hls_video_job, max_attempts=2)
+job_queue.register("maintenance.optimize_uploads",
+                   optimize_uploads_job,
+                   max_attempts=5)
+
+
+@api_router.get("/admin/jobs")
+async def list_jobs(request: Request,
+                    status: Optional[str] = None,
+                    type: Optional[str] = None,
+                    limit: int = 50):
+    user = await get_current_user(request)
+    if not has_permission(user["role"], "manage_settings"):
+        raise HTTPException(status_code=403, detail="Permission denied")
+    query = {}
+    if status:
+        query["status"] = status
+    if type:
+        query["type"] = type
+    limit = max(1, min(limit, 200))
+    jobs = await db.jobs.find(query).sort("createdAt",
+                                          -1).limit(limit).to_list(limit)
+    return {
+        "success": True,
+        "jobs": serialize_doc([job_status(job) for job in jobs])
+    }
+
+
+@api_router.get("/admin/jobs/{job_id}")
+async def get_job(job_id: str, request: Request):
+    """Poll the status (and result, once finished) of a background job"""
+    user = await get_current_user(request)
+    job = await job_queue.get(db, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    # Uploaders may poll the jobs their own requests queued
+    if not has_permission(user["role"], "manage_settings") and job.get(
+            "createdBy") != user["userId"]:
+        raise HTTPException(status_code=403, detail="Permission denied")
+    return {"success": True, "job": serialize_doc(job_status(job))}
+
+
+@api_router.post("/admin/jobs/{job_id}/retry")
+async def retry_job(job_id: str, request: Request):
+    user = await get_current_user(request)
+    if not has_permission(user["role"], "manage_settings"):
+        raise HTTPException(status_code=403, detail="Permission denied")
+    if not await job_queue.retry(db, job_id):
+        raise HTTPException(
+            status_code=409,
+            detail="Only failed or cancelled jobs can be retried, and not "
+            "while an identical job is queued or running")
+    await log_activity(user["userId"], "retry", "job", job_id)
+    return {"success": True, "message": "Job queued"}
+
+
+@api_router.delete("/admin/jobs/{job_id}")
+async def cancel_job(job_id: str, request: Request):
+    user = await get_current_user(request)
+    if not has_permission(user["role"], "manage_settings"):
+        raise HTTPException(status_code=403, detail="Permission denied")
+    if not await job_queue.cancel(db, job_id):
+        raise HTTPException(status_code=409,
+                            detail="Only queued jobs can be cancelled")
+    await log_activity(user["userId"], "cancel", "job", job_id)
+    return {"success": True, "message": "Job cancelled"}
+
+
+# ===== CLIENT GALLERY DOWNLOADS =====
+# A download link names a fixed list of files; GET streams them as one ZIP
+# (see zip_stream.py)
+import zlib
+from zip_stream import ZipEntry, ZipStream, archive_name, zip_response
+
+DOWNLOAD_LINK_TTL = timedelta(
+    days=int(os.environ.get("DOWNLOAD_LINK_DAYS", "7")))
+DOWNLOAD_MAX_FILES = 10000
+
+
+async def checksum_blobs_job(db, payload: dict):
+    """Cache the CRC-32 of blobs so their archives can be resumed"""
+    computed = 0
+    async for blob in db.blobs.find({
+            "_id": {
+                "$in": payload["blobIds"]
+            },
+            "crc32": {
+                "$exists": False
+            }
+    }):
+        crc = 0
+        if blob["size"]:
+            async for chunk in storage.read_range(blob["key"], 0,
+                                                  blob["size"] - 1):
+                crc = zlib.crc32(chunk, crc)
+        await blob_store.save_metadata(db, blob["_id"], {"crc32": crc})
+        computed += 1
+    return {"computed": computed}
+
+
+job_queue.register("blob.checksum", checksum_blobs_job, max_attempts=5)
+
+
+async def download_stream(download: dict) -> ZipStream:
+    blob_ids = [entry["blobId"] for entry in download["entries"]]
+    blobs = {}
+    async for blob in db.blobs.find({"_id": {
+            "$in": blob_ids
+    }}, {
+            "key": 1,
+            "size": 1,
+            "crc32": 1
+    }):
+        blobs[blob["_id"]] = blob
+    entries = [
+        ZipEntry(entry["name"],
+                 blobs[entry["blobId"]]["key"],
+                 blobs[entry["blobId"]]["size"],
+                 modified=entry.get("modified"),
+                 crc=blobs[entry["blobId"]].get("crc32"),
+                 blob_id=entry["blobId"])
+        for entry in download["entries"] if entry["blobId"] in blobs
+    ]
+
+    async def save_checksum(entry: ZipEntry):
+        await blob_store.save_metadata(db, entry.blob_id, {"crc32": entry.crc})
+
+    return ZipStream(storage, entries, on_checksum=save_checksum)
+
+
+@api_router.post("/admin/downloads")
+async def create_download(data: dict, request: Request):
+    """
+    Create a shareable ZIP download of portfolio items and/or media files:
+    {"portfolioIds": [...], "mediaIds": [...], "category": "...", "name": "..."}
+    ("category" selects every active portfolio item of that category)
+    """
+    user = await get_current_user(request)
+    portfolio_query = []
+    if data.get("portfolioIds"):
+        ids = [ObjectId(i) for i in data["portfolioIds"] if ObjectId.is_valid(i)]
+        portfolio_query.append({"_id": {"$in": ids}})
+    if data.get("category"):
+        portfolio_query.append({
+            "category": data["category"],
+            "isActive": True
+        })
+
+    sources = []
+    if portfolio_query:
+        async for item in db.portfolio.find({
+                "$or": portfolio_query
+        }).sort([("order", 1), ("_id", 1)]):
+            sources.append((item.get("title"), item))
+    if data.get("mediaIds"):
+        async for item in db.media.find({
+                "mediaId": {
+                    "$in": data["mediaIds"]
+                }
+        }).sort("createdAt", 1):
+            sources.append((item.get("filename"), item))
+
+    entries, taken, skipped = [], set(), 0
+    for title, item in sources:
+        if not item.get("blobId"):
+            # Only content-addressed uploads can be streamed
+            skipped += 1
+            continue
+        entries.append({
+            "blobId": item["blobId"],
+            "name": archive_name(title, item.get("image") or item.get("url")
+                                 or "", taken),
+            "modified": item.get("createdAt")
+        })
+    if not entries:
+        raise HTTPException(status_code=400, detail="No downloadable files")
+    if len(entries) > DOWNLOAD_MAX_FILES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {DOWNLOAD_MAX_FILES} files per download")
+
+    name = archive_name(data.get("name") or data.get("category") or "gallery",
+                        "download.zip", set())
+    download = {
+        "downloadId": secrets.token_urlsafe(24),
+        "name": name,
+        "entries": entries,
+        "createdBy": user["userId"],
+        "createdAt": datetime.utcnow(),
+        "expiresAt": datetime.utcnow() + DOWNLOAD_LINK_TTL
+    }
+    await db.downloads.insert_one(download)
+
+    stream = await download_stream(download)
+    job_id = None
+    if not stream.resumable:
+        job = await job_queue.enqueue(
+            db,
+            "blob.checksum", {
+                "blobIds": [entry["blobId"] for entry in entries]
+            },
+            priority=PRIORITY_LOW,
+            dedupe_key=download["downloadId"],
+            created_by=user["userId"])
+        job_id = job["jobId"]
+    await log_activity(user["userId"], "create", "download",
+                       download["downloadId"])
+    return {
+        "success": True,
+        "downloadId": download["downloadId"],
+        "url": f"/api/downloads/{download['downloadId']}",
+        "name": name,
+        "files": len(entries),
+        "skipped": skipped,
+        "size": stream.size,
+        "resumable": stream.resumable,
+        "expiresAt": download["expiresAt"],
+        "jobId": job_id
+    }
+
+
+@api_router.api_route("/downloads/{download_id}", methods=["GET", "HEAD"])
+async def get_download(download_id: str, request: Request):
+    """Stream a download link's files as one ZIP (public, by unguessable id)"""
+    download = await db.downloads.find_one({
+        "downloadId": download_id,
+        "expiresAt": {
+            "$gt": datetime.utcnow()
+        }
+    })
+    if not download:
+        raise HTTPException(status_code=404, detail="Download not found")
+    return zip_response(request, await download_stream(download),
+                        download["name"])
+
+
 # Basic route
 @api_router.get("/")
 async def root():
@@ -1344,11 +2660,38 @@ async def get_portfolio():
         portfolio = await db.portfolio.find({
             "isActive": True
         }).sort("order", 1).to_list(1000)
-        return serialize_doc(portfolio)
+        return serialize_doc(await public_portfolio(portfolio))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@api_router.get("/portfolio/{portfolio_id}/similar")
+async def get_similar_portfolio_items(portfolio_id: str, limit: int = 6):
+    """Active portfolio items that look most alike (color and texture)"""
+    if not ObjectId.is_valid(portfolio_id):
+        raise HTTPException(status_code=404, detail="Portfolio item not found")
+    item = await db.portfolio.find_one({
+        "_id": ObjectId(portfolio_id),
+        "isActive": True
+    }, {"_id": 1})
+    if not item:
+        raise HTTPException(status_code=404, detail="Portfolio item not found")
+
+    matches = await similar_images.similar(db, portfolio_id,
+                                           max(1, min(limit, 24)))
+    scores = dict(matches)
+    items = await db.portfolio.find({
+        "_id": {
+            "$in": [ObjectId(item_id) for item_id in scores]
+        },
+        "isActive": True
+    }).to_list(len(scores))
+    items.sort(key=lambda doc: scores[str(doc["_id"])], reverse=True)
+    for doc in items:
+        doc["similarity"] = scores[str(doc["_id"])]
+    return serialize_doc(await public_portfolio(items))
+
+
 @api_router.get("/portfolio/{category}")
 async def get_portfolio_by_category(category: str):
     try:
@@ -1356,7 +2699,7 @@ async def get_portfolio_by_category(category: str):
             "category": category,
             "isActive": True
         }).sort("order", 1).to_list(1000)
-        return serialize_doc(portfolio)
+        return serialize_doc(await public_portfolio(portfolio))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -1409,6 +2752,8 @@ async def delete_portfolio_item(portfolio_id: str):
         if result.matched_count == 0:
             raise HTTPException(status_code=404,
                                 detail="Portfolio item not found")
+        near_duplicates.discard(portfolio_id)
+        similar_images.discard(portfolio_id)
 
         return {"message": "Portfolio item deleted successfully"}
     except Exception as e:
@@ -1512,11 +2857,28 @@ async def delete_testimonial(testimonial_id: str):
 
 # Inquiries APIs
 @api_router.get("/inquiries")
-async def get_inquiries():
+async def get_inquiries(response: Response,
+                        status: Optional[str] = None,
+                        eventType: Optional[str] = None,
+                        order: Optional[str] = None,
+                        limit: int = Query(DEFAULT_PAGE_SIZE,
+                                           ge=1,
+                                           le=MAX_PAGE_SIZE),
+                        cursor: Optional[str] = None):
+    """Newest first; the body stays a plain list, paging is in headers"""
     try:
-        inquiries = await db.inquiries.find().sort("createdAt",
-                                                   -1).to_list(1000)
+        inquiries, page = await list_page(db.inquiries, INQUIRY_LIST, {
+            "status": status,
+            "eventType": eventType
+        }, None, order, limit, cursor)
+        if page["nextCursor"]:
+            response.headers["X-Next-Cursor"] = page["nextCursor"]
+        response.headers["X-Total-Count"] = str(page["total"])
+        response.headers["X-Total-Estimated"] = str(
+            page["totalEstimated"]).lower()
         return serialize_doc(inquiries)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -1532,6 +2894,15 @@ async def create_inquiry(inquiry: InquiryCreate):
         result = await db.inquiries.insert_one(inquiry_dict)
         created_inquiry = await db.inquiries.find_one(
             {"_id": result.inserted_id})
+
+        try:
+            weight = session_weight(inquiry.sessionId, FUNNEL_STEPS)
+            if weight:
+                await record_funnel_step(db, inquiry.sessionId, "inquiry",
+                                         weight=weight)
+        except Exception as e:
+            logger.warning(f"Funnel update failed for inquiry: {e}")
+
         return serialize_doc(created_inquiry)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1576,7 +2947,8 @@ async def health_check():
         "status": "ok",
         "service": "DSP Photography API",
         "timestamp": datetime.utcnow().isoformat(),
-        "upload_dir": UPLOAD_DIR
+        "upload_dir": UPLOAD_DIR,
+        "storage": storage.name
     }
 
 
@@ -1597,7 +2969,10 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS", "PATCH"],
     allow_headers=["*"],
-    expose_headers=["*"],
+    # "*" is not honored on credentialed requests; name the paging headers
+    expose_headers=[
+        "*", "X-Next-Cursor", "X-Total-Count", "X-Total-Estimated"
+    ],
 )
 
 
@@ -1614,6 +2989,81 @@ async def root():
     }
 
 
+# Serve uploaded files (local: Range, ETag, immutable caching; s3: redirect)
+
+@app.api_route("/uploads/{file_path:path}", methods=["GET", "HEAD"])
+async def serve_upload(file_path: str, request: Request):
+    return await storage.serve(request, file_path)
+
+
+# Resized images on demand, cached on local disk
+from image_resize import ImageResizer
+
+image_resizer = ImageResizer(blob_store, UPLOAD_DIR)
+
+
+# Admin gallery contact sheets (see contact_sheets.py)
+from contact_sheets import ContactSheets
+
+contact_sheets = ContactSheets(storage, UPLOAD_DIR)
+
+
+@api_router.get("/admin/gallery/contact-sheet")
+async def admin_gallery_contact_sheet(request: Request,
+                                      page: int = 1,
+                                      limit: int = 100,
+                                      category: Optional[str] = None,
+                                      size: int = 96,
+                                      fmt: str = "webp"):
+    """
+    One page of the gallery grid as sprite sheets of `size`px thumbnails:
+    `items` are the portfolio documents in grid order and `tiles` give each
+    item's sheet and x/y offset (use as a CSS background-position).
+    """
+    user = await get_current_user(request)
+    ContactSheets.validate(size, fmt)
+    page = max(page, 1)
+    limit = max(1, min(limit, 200))
+    query = {"isActive": True}
+    if category:
+        query["category"] = category
+    total = await db.portfolio.count_documents(query)
+    items = await db.portfolio.find(query).sort([
+        ("order", 1), ("_id", 1)
+    ]).skip((page - 1) * limit).limit(limit).to_list(limit)
+    sheet = await contact_sheets.build(items, size, fmt)
+    return {
+        "success": True,
+        "page": page,
+        "limit": limit,
+        "total": total,
+        **sheet, "items": serialize_doc(items)
+    }
+
+
+@app.api_route("/img/sheets/{name}", methods=["GET", "HEAD"])
+async def contact_sheet_image(name: str, request: Request):
+    return await contact_sheets.response(request, name)
+
+
+@app.api_route("/img/{blob_id}", methods=["GET", "HEAD"])
+async def resized_image(blob_id: str,
+                        request: Request,
+                        w: Optional[int] = None,
+                        h: Optional[int] = None,
+                        fit: str = "contain",
+                        fmt: str = "webp"):
+    private = await watermarker.protects(db, blob_id)
+    if private:
+        # Resizes are clean copies; the public gallery is watermarked
+        try:
+            await get_current_user(request)
+        except HTTPException:
+            raise HTTPException(status_code=404, detail="Image not found")
+    return await image_resizer.response(request, db, blob_id, w, h, fit, fmt,
+                                        private)
+
+
 # Include main API router (with /api prefix)
 app.include_router(api_router)
 
@@ -1637,8 +3087,61 @@ async def health_check():
     return {"status": "ok", "service": "backend"}
 
 
+# Startup event
+@app.on_event("startup")
+async def create_indexes():
+    try:
+        await ensure_funnel_indexes(db)
+        await ensure_vitals_indexes(db)
+        await blob_store.ensure_indexes(db)
+        await resumable_uploads.ensure_indexes(db)
+        await ensure_media_indexes(db)
+        await job_queue.ensure_indexes(db)
+        for collection, spec in LIST_INDEXES:
+            await ensure_list_indexes(db[collection], spec)
+        await db.downloads.create_index("downloadId", unique=True)
+        await db.downloads.create_index("expiresAt", expireAfterSeconds=0)
+    except Exception as e:
+        logger.warning(f"⚠️  Index creation failed: {e}")
+
+
+@app.on_event("startup")
+async def start_background_workers():
+    try:
+        await heatmap_aggregator.start(db)
+    except Exception as e:
+        logger.warning(f"⚠️  Heatmap aggregator NOT started: {e}")
+    resumable_uploads.start_gc(db)
+    upload_gc.start(db)
+    job_queue.start(db)
+    try:
+        await job_queue.enqueue(db,
+                                "image.backfill",
+                                priority=PRIORITY_LOW,
+                                dedupe_key="all")
+    except Exception as e:
+        logger.warning(f"⚠️  Image backfill NOT queued: {e}")
+    try:
+        state = await watermarker.current(db)
+        if state:
+            # Picks up images added while no worker ran, and RENDER_VERSION
+            # bumps
+            await job_queue.enqueue(db,
+                                    "image.watermark",
+                                    priority=PRIORITY_LOW,
+                                    dedupe_key=state["hash"])
+    except Exception as e:
+        logger.warning(f"⚠️  Watermark rendering NOT queued: {e}")
+
+
 # Shutdown event
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await heatmap_aggregator.stop()
+    resumable_uploads.stop_gc()
+    upload_gc.stop()
+    job_queue.stop()
+    geoip.close()
+    shutdown_pool()
     client.close()
     logger.info("Database connection closed")
@@ -0,0 +1,459 @@
+"""
+Storage backends for uploaded files
+Objects are addressed by key, a relative path such as
+"blobs/ab/cd/<sha256>.jpg", and are served publicly as /uploads/<key>.
+
+  local  files under UPLOAD_DIR (default; lost on redeploy on ephemeral disks)
+  s3     any S3-compatible service (AWS S3, MinIO, R2, ...) through one pooled
+         client, with parallel multipart transfers for large files
+
+Config (env):
+  STORAGE_BACKEND         local | s3 (default local)
+  S3_BUCKET               bucket name (required for s3)
+  S3_ENDPOINT_URL         custom endpoint, e.g. http://localhost:9000 for MinIO
+  S3_REGION               region name
+  S3_ACCESS_KEY_ID        credentials (default: the standard AWS chain)
+  S3_SECRET_ACCESS_KEY
+  S3_PREFIX               key prefix inside the bucket
+  S3_PUBLIC_URL           public/CDN base URL; otherwise presigned URLs are used
+  S3_MAX_CONNECTIONS      HTTP connection pool size (default 32)
+  S3_MULTIPART_CHUNK_MB   multipart part size (default 8)
+  S3_UPLOAD_CONCURRENCY   parts transferred in parallel per file (default 8)
+  S3_PRESIGN_SECONDS      lifetime of presigned download URLs (default 3600)
+"""
+
+import os
+import uuid
+import asyncio
+import logging
+import mimetypes
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+from itertools import islice
+from pathlib import Path
+from typing import Optional, AsyncIterator, Iterator, List, NamedTuple
+
+from fastapi import HTTPException, Request
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import Response, RedirectResponse
+
+from uploads import discard
+from upload_serving import CACHE_CONTROL, STREAM_CHUNK_SIZE, upload_response
+
+try:
+    import boto3
+    from boto3.s3.transfer import TransferConfig
+    from botocore.config import Config
+    from botocore.exceptions import ClientError
+except ImportError:  # pragma: no cover - boto3 is only needed for s3
+    boto3 = None
+
+logger = logging.getLogger(__name__)
+
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "local").lower()
+STAGING_DIR = ".staging"
+LIST_BATCH_SIZE = 1000
+
+
+class StoredObject(NamedTuple):
+    key: str
+    size: int
+    modified: float  # epoch seconds
+
+
+def _discard_all(paths: List[Path]):
+    for path in paths:
+        discard(path)
+
+
+def _move_into_place(src: Path, dest: Path):
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    os.replace(src, dest)
+
+
+def _walk(root: Path) -> Iterator[StoredObject]:
+    """Files below `root`, skipping hidden (scratch) directories"""
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            entries = os.scandir(directory)
+        except FileNotFoundError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(Path(entry.path))
+                elif entry.is_file(follow_symlinks=False):
+                    stat = entry.stat(follow_symlinks=False)
+                    yield StoredObject(
+                        Path(entry.path).relative_to(root).as_posix(),
+                        stat.st_size, stat.st_mtime)
+
+
+def _next_batch(iterator: Iterator, size: int) -> list:
+    return list(islice(iterator, size))
+
+
+def validate_key(key: str) -> str:
+    """Reject keys that are absolute, escape the root or hit hidden dirs"""
+    parts = key.split("/")
+    if not key or key.startswith("/") or any(
+            not part or part.startswith(".") for part in parts):
+        raise HTTPException(status_code=404, detail="File not found")
+    return key
+
+
+def key_from_url(url: Optional[str]) -> Optional[str]:
+    """Storage key of a /uploads/ URL, or None for other or unsafe URLs"""
+    if not url or not url.startswith("/uploads/"):
+        return None
+    key = url[len("/uploads/"):]
+    if any(not part or part.startswith(".") for part in key.split("/")):
+        return None
+    return key
+
+
+class Storage(ABC):
+    """Interface shared by the storage backends"""
+
+    name = ""
+
+    @abstractmethod
+    async def put_file(self,
+                       key: str,
+                       src: Path,
+                       content_type: Optional[str] = None):
+        """Store a local file under `key`; the local file is consumed"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete(self, key: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete_many(self, keys: List[str]):
+        raise NotImplementedError
+
+    @abstractmethod
+    def list_objects(self) -> AsyncIterator[StoredObject]:
+        """Stream every stored object (async generator)"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def move(self, src_key: str, dest_key: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    def local_copy(self, key: str) -> AsyncIterator[Path]:
+        """
+        Async context manager yielding a readable local path for `key`
+        (for image processing). Raises FileNotFoundError if it is missing.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def read_range(self, key: str, start: int,
+                   end: int) -> AsyncIterator[bytes]:
+        """
+        Stream bytes [start, end] of `key` in chunks (async generator).
+        Raises FileNotFoundError if it is missing.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def serve(self, request: Request, key: str) -> Response:
+        """Response for GET/HEAD /uploads/<key>"""
+        raise NotImplementedError
+
+    async def put_directory(self, prefix: str, directory: Path):
+        """Store every file of a local directory under `prefix/`"""
+        names = await run_in_threadpool(os.listdir, directory)
+        await asyncio.gather(*(self.put_file(
+            f"{prefix}/{name}", directory / name,
+            mimetypes.guess_type(name)[0]) for name in names))
+
+
+class LocalStorage(Storage):
+    name = "local"
+
+    def __init__(self, root: Path):
+        self.root = root
+
+    def path(self, key: str) -> Path:
+        return self.root / validate_key(key)
+
+    async def put_file(self,
+                       key: str,
+                       src: Path,
+                       content_type: Optional[str] = None):
+        await run_in_threadpool(_move_into_place, src, self.path(key))
+
+    async def exists(self, key: str) -> bool:
+        return await run_in_threadpool(self.path(key).is_file)
+
+    async def delete(self, key: str):
+        await run_in_threadpool(discard, self.path(key))
+
+    async def delete_many(self, keys: List[str]):
+        await run_in_threadpool(_discard_all,
+                                [self.path(key) for key in keys])
+
+    async def list_objects(self) -> AsyncIterator[StoredObject]:
+        # The walk runs in the threadpool a batch at a time
+        iterator = _walk(self.root)
+        while True:
+            batch = await run_in_threadpool(_next_batch, iterator,
+                                            LIST_BATCH_SIZE)
+            if not batch:
+                return
+            for stored in batch:
+                yield stored
+
+    async def move(self, src_key: str, dest_key: str):
+        await run_in_threadpool(_move_into_place, self.path(src_key),
+                                self.path(dest_key))
+
+    @asynccontextmanager
+    async def local_copy(self, key: str) -> AsyncIterator[Path]:
+        # The stored file itself; callers only read it
+        path = self.path(key)
+        if not await run_in_threadpool(path.is_file):
+            raise FileNotFoundError(key)
+        yield path
+
+    async def read_range(self, key: str, start: int,
+                         end: int) -> AsyncIterator[bytes]:
+        fd = await run_in_threadpool(os.open, self.path(key), os.O_RDONLY)
+        try:
+            offset = start
+            while offset <= end:
+                chunk = await run_in_threadpool(
+                    os.pread, fd, min(STREAM_CHUNK_SIZE, end - offset + 1),
+                    offset)
+                if not chunk:
+                    break
+                offset += len(chunk)
+                yield chunk
+        finally:
+            await run_in_threadpool(os.close, fd)
+
+    async def serve(self, request: Request, key: str) -> Response:
+        return await upload_response(request, self.root, key)
+
+
+class S3Storage(Storage):
+    name = "s3"
+
+    def __init__(self,
+                 bucket: str,
+                 staging_root: Path,
+                 prefix: str = "",
+                 endpoint_url: Optional[str] = None,
+                 region: Optional[str] = None,
+                 access_key: Optional[str] = None,
+                 secret_key: Optional[str] = None,
+                 public_url: Optional[str] = None,
+                 max_connections: int = 32,
+                 chunk_size: int = 8 * 1024 * 1024,
+                 concurrency: int = 8,
+                 presign_seconds: int = 3600):
+        if boto3 is None:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires boto3")
+        self.bucket = bucket
+        self.staging_root = staging_root
+        self.prefix = prefix.strip("/")
+        self.public_url = public_url.rstrip("/") if public_url else None
+        self.presign_seconds = presign_seconds
+        # One client for the whole process: boto3 clients are thread-safe and
+        # keep a pool of connections sized for the transfer threads below
+        self.client = boto3.session.Session().client(
+            "s3",
+            endpoint_url=endpoint_url,
+            region_name=region,
+            aws_access_key_id=access_key,
+            aws_secret_access_key=secret_key,
+            config=Config(max_pool_connections=max_connections,
+                          retries={
+                              "max_attempts": 5,
+                              "mode": "standard"
+                          },
+                          s3={
+                              "addressing_style":
+                              "path" if endpoint_url else "auto"
+                          }))
+        self.transfer_config = TransferConfig(
+            multipart_threshold=chunk_size,
+            multipart_chunksize=chunk_size,
+            max_concurrency=concurrency,
+            use_threads=True)
+
+    def object_key(self, key: str) -> str:
+        key = validate_key(key)
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    async def put_file(self,
+                       key: str,
+                       src: Path,
+                       content_type: Optional[str] = None):
+        extra = {"CacheControl": CACHE_CONTROL}
+        if content_type:
+            extra["ContentType"] = content_type
+        await run_in_threadpool(self.client.upload_file,
+                                str(src),
+                                self.bucket,
+                                self.object_key(key),
+                                ExtraArgs=extra,
+                                Config=self.transfer_config)
+        await run_in_threadpool(discard, src)
+
+    async def exists(self, key: str) -> bool:
+        try:
+            await run_in_threadpool(self.client.head_object,
+                                    Bucket=self.bucket,
+                                    Key=self.object_key(key))
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey",
+                                                           "NotFound"):
+                return False
+            raise
+        return True
+
+    async def delete(self, key: str):
+        await run_in_threadpool(self.client.delete_object,
+                                Bucket=self.bucket,
+                                Key=self.object_key(key))
+
+    async def delete_many(self, keys: List[str]):
+        # DeleteObjects takes up to 1000 keys per request
+        for start in range(0, len(keys), 1000):
+            objects = [{
+                "Key": self.object_key(key)
+            } for key in keys[start:start + 1000]]
+            await run_in_threadpool(self.client.delete_objects,
+                                    Bucket=self.bucket,
+                                    Delete={
+                                        "Objects": objects,
+                                        "Quiet": True
+                                    })
+
+    async def list_objects(self) -> AsyncIterator[StoredObject]:
+        prefix = f"{self.prefix}/" if self.prefix else ""
+        pages = iter(
+            self.client.get_paginator("list_objects_v2").paginate(
+                Bucket=self.bucket, Prefix=prefix))
+        while True:
+            page = await run_in_threadpool(next, pages, None)
+            if page is None:
+                return
+            for item in page.get("Contents", []):
+                yield StoredObject(item["Key"][len(prefix):], item["Size"],
+                                   item["LastModified"].timestamp())
+
+    async def move(self, src_key: str, dest_key: str):
+        # Managed copy: server-side, multipart for large objects
+        await run_in_threadpool(self.client.copy, {
+            "Bucket": self.bucket,
+            "Key": self.object_key(src_key)
+        },
+                                self.bucket,
+                                self.object_key(dest_key),
+                                Config=self.transfer_config)
+        await self.delete(src_key)
+
+    @asynccontextmanager
+    async def local_copy(self, key: str) -> AsyncIterator[Path]:
+        staging = self.staging_root / STAGING_DIR
+        await run_in_threadpool(staging.mkdir, parents=True, exist_ok=True)
+        path = staging / uuid.uuid4().hex
+        try:
+            try:
+                await run_in_threadpool(self.client.download_file,
+                                        self.bucket,
+                                        self.object_key(key),
+                                        str(path),
+                                        Config=self.transfer_config)
+            except ClientError as e:
+                if e.response.get("Error", {}).get("Code") in ("404",
+                                                               "NoSuchKey"):
+                    raise FileNotFoundError(key)
+                raise
+            yield path
+        finally:
+            await run_in_threadpool(discard, path)
+
+    async def read_range(self, key: str, start: int,
+                         end: int) -> AsyncIterator[bytes]:
+        try:
+            response = await run_in_threadpool(self.client.get_object,
+                                               Bucket=self.bucket,
+                                               Key=self.object_key(key),
+                                               Range=f"bytes={start}-{end}")
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey"):
+                raise FileNotFoundError(key)
+            raise
+        body = response["Body"]
+        try:
+            while True:
+                chunk = await run_in_threadpool(body.read, STREAM_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            await run_in_threadpool(body.close)
+
+    async def serve(self, request: Request, key: str) -> Response:
+        object_key = self.object_key(key)
+        if self.public_url:
+            return RedirectResponse(f"{self.public_url}/{object_key}",
+                                    status_code=301,
+                                    headers={"cache-control": CACHE_CONTROL})
+        url = self.client.generate_presigned_url(
+            "get_object",
+            Params={
+                "Bucket": self.bucket,
+                "Key": object_key
+            },
+            ExpiresIn=self.presign_seconds)
+        # Only cache the redirect while the signature is still valid
+        return RedirectResponse(url,
+                                status_code=307,
+                                headers={
+                                    "cache-control":
+                                    f"private, max-age="
+                                    f"{self.presign_seconds // 2}"
+                                })
+
+
+def get_storage(upload_dir: Path) -> Storage:
+    """Build the backend selected by STORAGE_BACKEND"""
+    if STORAGE_BACKEND == "s3":
+        bucket = os.environ.get("S3_BUCKET")
+        if not bucket:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires S3_BUCKET")
+        storage = S3Storage(
+            bucket,
+            staging_root=upload_dir,
+            prefix=os.environ.get("S3_PREFIX", ""),
+            endpoint_url=os.environ.get("S3_ENDPOINT_URL") or None,
+            region=os.environ.get("S3_REGION") or None,
+            access_key=os.environ.get("S3_ACCESS_KEY_ID") or None,
+            secret_key=os.environ.get("S3_SECRET_ACCESS_KEY") or None,
+            public_url=os.environ.get("S3_PUBLIC_URL") or None,
+            max_connections=int(os.environ.get("S3_MAX_CONNECTIONS", "32")),
+            chunk_size=int(os.environ.get("S3_MULTIPART_CHUNK_MB", "8")) *
+            1024 * 1024,
+            concurrency=int(os.environ.get("S3_UPLOAD_CONCURRENCY", "8")),
+            presign_seconds=int(os.environ.get("S3_PRESIGN_SECONDS", "3600")))
+        logger.info(f"Storing uploads in s3://{bucket}")
+        return storage
+    if STORAGE_BACKEND != "local":
+        raise RuntimeError(f"Unknown STORAGE_BACKEND: {STORAGE_BACKEND}")
+    return LocalStorage(upload_dir)
@@ -0,0 +1,251 @@
+"""
+Garbage collection of unreferenced upload files
+Deleting media or gallery items only drops references, so stored files can
+outlive every document that pointed at them. The collector:
+
+  1. builds the set of referenced keys: every /uploads/... URL found anywhere
+     in the content collections (including HTML bodies) plus every blob with
+     refCount > 0 and its variants; of a blob's video outputs only the
+     directories its `video` record points at count (older renderings are
+     left behind under other directories, see video_processing.py)
+  2. streams the storage listing and treats everything else older than the
+     grace period as an orphan
+  3. deletes orphans in small throttled batches (or only reports them in
+     dry-run mode) and drops the records of deleted blobs
+
+Every run stores a report in `maintenance_reports`.
+
+Config (env):
+  UPLOAD_GC_MODE            off | report | delete for the periodic run
+                            (default report, i.e. a scheduled dry run)
+  UPLOAD_GC_INTERVAL_HOURS  hours between periodic runs (default 24)
+  UPLOAD_GC_GRACE_HOURS     files younger than this are kept (default 72)
+"""
+
+import os
+import re
+import time
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, Set, List, Tuple
+
+from blob_store import BLOB_DIR, SHA256_PATTERN
+from locks import acquire_lock, release_lock
+from video_processing import VIDEO_DIR, video_dirs
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_GC_MODE = os.environ.get("UPLOAD_GC_MODE", "report").lower()
+UPLOAD_GC_INTERVAL = timedelta(
+    hours=float(os.environ.get("UPLOAD_GC_INTERVAL_HOURS", "24")))
+UPLOAD_GC_GRACE = timedelta(
+    hours=float(os.environ.get("UPLOAD_GC_GRACE_HOURS", "72")))
+
+# Collections whose documents may contain /uploads/ URLs
+REFERENCE_COLLECTIONS = ("media", "portfolio", "blog", "videos", "packages",
+                         "services", "testimonials", "site_content",
+                         "settings", "pages", "offers")
+UPLOAD_URL_PATTERN = re.compile(r"/uploads/([^\s\"'()<>?#\\]+)")
+DELETE_BATCH_SIZE = 200
+DELETE_BATCH_PAUSE_SECONDS = 0.5
+REPORT_SAMPLE_SIZE = 100
+GC_LOCK = timedelta(hours=2)
+
+
+def collect_upload_keys(value, keys: Set[str]):
+    """Add the storage key of every /uploads/ URL inside a document"""
+    if isinstance(value, str):
+        if "/uploads/" in value:
+            keys.update(UPLOAD_URL_PATTERN.findall(value))
+    elif isinstance(value, dict):
+        for item in value.values():
+            collect_upload_keys(item, keys)
+    elif isinstance(value, list):
+        for item in value:
+            collect_upload_keys(item, keys)
+
+
+def blob_id_of(key: str) -> Optional[str]:
+    """Blob id for a key under blobs/ or variants/<sha>/, else None"""
+    parts = key.split("/")
+    if parts[0] == BLOB_DIR:
+        candidate = parts[-1].split(".")[0]
+    elif parts[0] == "variants" and len(parts) > 2:
+        candidate = parts[1]
+    else:
+        return None
+    return candidate if SHA256_PATTERN.fullmatch(candidate) else None
+
+
+def video_dir_of(key: str) -> Optional[str]:
+    """Directory of a video output under variants/<sha>/video/, else None"""
+    parts = key.split("/")
+    if len(parts) > 3 and parts[0] == "variants" and parts[2] == VIDEO_DIR:
+        return key.rsplit("/", 1)[0]
+    return None
+
+
+class UploadGC:
+
+    def __init__(self, storage):
+        self.storage = storage
+        self._task: Optional[asyncio.Task] = None
+
+    async def referenced_keys(self,
+                              db) -> Tuple[Set[str], Set[str], Set[str]]:
+        """
+        (keys referenced by documents, ids of blobs still in use, current
+        video output directories of those blobs)
+        """
+        keys: Set[str] = set()
+        live_blobs: Set[str] = set()
+        live_video_dirs: Set[str] = set()
+        async for blob in db.blobs.find({"refCount": {
+                "$gt": 0
+        }}, {"key": 1, "video": 1}):
+            live_blobs.add(blob["_id"])
+            keys.add(blob["key"])
+            live_video_dirs |= video_dirs(blob.get("video"))
+        for name in REFERENCE_COLLECTIONS:
+            async for doc in db[name].find({}).batch_size(500):
+                collect_upload_keys(doc, keys)
+        return keys, live_blobs, live_video_dirs
+
+    async def run(self,
+                  db,
+                  dry_run: bool = True,
+                  grace: timedelta = UPLOAD_GC_GRACE) -> Optional[Dict[str, Any]]:
+        """One collection pass; returns its report, or None if already running"""
+        if not await acquire_lock(db, "upload_gc", GC_LOCK):
+            return None
+        try:
+            report = await self._collect(db, dry_run, grace)
+        finally:
+            await release_lock(db, "upload_gc")
+        await db.maintenance_reports.insert_one({
+            "type": "upload_gc",
+            **report
+        })
+        logger.info(f"Upload GC: {report['orphans']} orphans "
+                    f"({report['orphanBytes']} bytes), "
+                    f"{report['deleted']} deleted")
+        return report
+
+    async def _collect(self, db, dry_run: bool,
+                       grace: timedelta) -> Dict[str, Any]:
+        started = datetime.utcnow()
+        keys, live_blobs, live_video_dirs = await self.referenced_keys(db)
+        cutoff = time.time() - grace.total_seconds()
+        report = {
+            "dryRun": dry_run,
+            "graceHours": grace.total_seconds() / 3600,
+            "startedAt": started,
+            "referenced": len(keys),
+            "scanned": 0,
+            "scannedBytes": 0,
+            "recent": 0,
+            "orphans": 0,
+            "orphanBytes": 0,
+            "deleted": 0,
+            "deletedBytes": 0,
+            "revived": 0,
+            "blobRecordsRemoved": 0,
+            "sample": []
+        }
+
+        batch = []
+        async for stored in self.storage.list_objects():
+            report["scanned"] += 1
+            report["scannedBytes"] += stored.size
+            video_dir = video_dir_of(stored.key)
+            if stored.key in keys or (
+                    video_dir in live_video_dirs if video_dir else
+                    blob_id_of(stored.key) in live_blobs):
+                continue
+            if stored.modified > cutoff:
+                report["recent"] += 1
+                continue
+            report["orphans"] += 1
+            report["orphanBytes"] += stored.size
+            if len(report["sample"]) < REPORT_SAMPLE_SIZE:
+                report["sample"].append(stored.key)
+            if dry_run:
+                continue
+            batch.append(stored)
+            if len(batch) >= DELETE_BATCH_SIZE:
+                await self._delete_batch(db, batch, started - grace, report)
+                batch = []
+                # Throttle so a large sweep doesn't starve the disk/bucket
+                await asyncio.sleep(DELETE_BATCH_PAUSE_SECONDS)
+        if batch:
+            await self._delete_batch(db, batch, started - grace, report)
+
+        report["finishedAt"] = datetime.utcnow()
+        return report
+
+    async def _delete_batch(self, db, batch: List, cutoff: datetime,
+                            report: Dict[str, Any]):
+        # A blob may have been referenced again since the key set was built
+        blob_ids = {blob_id_of(stored.key) for stored in batch} - {None}
+        # blob id -> its current video output directories
+        revived: Dict[str, Set[str]] = {}
+        if blob_ids:
+            async for blob in db.blobs.find(
+                {
+                    "_id": {
+                        "$in": list(blob_ids)
+                    },
+                    "$or": [{
+                        "refCount": {
+                            "$gt": 0
+                        }
+                    }, {
+                        "lastReferencedAt": {
+                            "$gte": cutoff
+                        }
+                    }]
+                }, {"_id": 1, "video": 1}):
+                revived[blob["_id"]] = video_dirs(blob.get("video"))
+
+        doomed = []
+        for stored in batch:
+            blob_id = blob_id_of(stored.key)
+            video_dir = video_dir_of(stored.key)
+            if blob_id in revived and (video_dir is None
+                                       or video_dir in revived[blob_id]):
+                continue
+            doomed.append(stored)
+        await self.storage.delete_many([stored.key for stored in doomed])
+        report["revived"] += len(batch) - len(doomed)
+        report["deleted"] += len(doomed)
+        report["deletedBytes"] += sum(stored.size for stored in doomed)
+
+        removed = blob_ids - set(revived)
+        if removed:
+            result = await db.blobs.delete_many({
+                "_id": {
+                    "$in": list(removed)
+                },
+                "refCount": {
+                    "$lte": 0
+                }
+            })
+            report["blobRecordsRemoved"] += result.deleted_count
+
+    async def _run_periodically(self, db):
+        while True:
+            await asyncio.sleep(UPLOAD_GC_INTERVAL.total_seconds())
+            try:
+                await self.run(db, dry_run=UPLOAD_GC_MODE != "delete")
+            except Exception as e:
+                logger.error(f"Upload GC failed: {e}")
+
+    def start(self, db):
+        if UPLOAD_GC_MODE in ("report", "delete") and self._task is None:
+            self._task = asyncio.create_task(self._run_periodically(db))
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
@@ -0,0 +1,255 @@
+"""
+Serving for files under UPLOAD_DIR
+Handles GET/HEAD with single byte ranges (video scrubbing), strong ETags
+derived from the SHA-256 of the content, If-None-Match/If-Range and long-lived
+immutable caching (upload filenames are never reused). Responses that depend
+on who is asking are sent with PRIVATE_CACHE_CONTROL instead, so shared caches
+never hand them to anyone else.
+
+The body is sent with the ASGI zero-copy extension (sendfile) when the server
+offers it, otherwise it is read with pread in the threadpool in fixed chunks.
+"""
+
+import os
+import hashlib
+import logging
+import mimetypes
+from collections import OrderedDict
+from email.utils import formatdate
+from pathlib import Path
+from typing import Optional, Tuple
+
+from fastapi import HTTPException, Request
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import Response
+
+from blob_store import is_blob_path
+
+logger = logging.getLogger(__name__)
+
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+PRIVATE_CACHE_CONTROL = "private, no-store"
+STREAM_CHUNK_SIZE = 256 * 1024
+ETAG_CACHE_SIZE = 10000
+HASH_CHUNK_SIZE = 1024 * 1024
+
+mimetypes.add_type("image/webp", ".webp")
+mimetypes.add_type("image/avif", ".avif")
+# HLS playlists and segments (see video_processing.py)
+mimetypes.add_type("application/vnd.apple.mpegurl", ".m3u8")
+mimetypes.add_type("video/mp2t", ".ts")
+
+# (path, size, mtime_ns) -> quoted ETag
+_etag_cache: "OrderedDict[tuple, str]" = OrderedDict()
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def _sha256_file(path: Path) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+async def content_etag(path: Path, stat: os.stat_result) -> str:
+    """Strong ETag from the file's SHA-256, cached per (path, size, mtime)"""
+    if is_blob_path(path):
+        # Content-addressed files are named after the hash of the uploaded
+        # bytes; the size tells a losslessly re-optimized copy apart
+        # (see image_optimize.py)
+        return f'"{path.name.split(".")[0]}-{stat.st_size}"'
+
+    key = (str(path), stat.st_size, stat.st_mtime_ns)
+    etag = _etag_cache.get(key)
+    if etag is not None:
+        _etag_cache.move_to_end(key)
+        return etag
+
+    etag = f'"{await run_in_threadpool(_sha256_file, path)}"'
+    _etag_cache[key] = etag
+    if len(_etag_cache) > ETAG_CACHE_SIZE:
+        _etag_cache.popitem(last=False)
+    return etag
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a Range header into an inclusive (start, end) pair
+    Returns None when the header should be ignored (malformed or several
+    ranges, which are answered with the full body). Raises RangeNotSatisfiable
+    for ranges that start past the end of the file.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, sep, last = spec.strip().partition("-")
+    if not sep:
+        return None
+    try:
+        if first == "":
+            # Suffix range: the last N bytes
+            length = int(last)
+            if length <= 0:
+                raise RangeNotSatisfiable()
+            return max(size - length, 0), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable()
+    if start > end:
+        return None
+    return start, min(end, size - 1)
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in header.split(",")]
+    return etag in candidates or f"W/{etag}" in candidates
+
+
+class FileRangeResponse(Response):
+    """Sends bytes [start, end] of a file without buffering it in memory"""
+
+    def __init__(self,
+                 path: Path,
+                 start: int,
+                 end: int,
+                 status_code: int = 200,
+                 headers: Optional[dict] = None,
+                 media_type: Optional[str] = None,
+                 send_body: bool = True):
+        self.path = path
+        self.start = start
+        self.count = end - start + 1
+        self.send_body = send_body
+        super().__init__(content=None,
+                         status_code=status_code,
+                         headers={
+                             **(headers or {}), "content-length":
+                             str(self.count)
+                         },
+                         media_type=media_type)
+
+    async def __call__(self, scope, receive, send):
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": self.raw_headers
+        })
+        if not self.send_body or self.count <= 0:
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        handle = await run_in_threadpool(open, self.path, "rb")
+        try:
+            if "http.response.zerocopysend" in scope.get("extensions", {}):
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": handle,
+                    "offset": self.start,
+                    "count": self.count,
+                    "more_body": False
+                })
+                return
+
+            fd = handle.fileno()
+            offset = self.start
+            remaining = self.count
+            while remaining > 0:
+                chunk = await run_in_threadpool(
+                    os.pread, fd, min(STREAM_CHUNK_SIZE, remaining), offset)
+                if not chunk:
+                    break
+                offset += len(chunk)
+                remaining -= len(chunk)
+                await send({
+                    "type": "http.response.body",
+                    "body": chunk,
+                    "more_body": remaining > 0
+                })
+            if remaining > 0:
+                # File shrank underneath us; end the body cleanly
+                await send({"type": "http.response.body", "body": b""})
+        finally:
+            await run_in_threadpool(handle.close)
+
+
+def resolve_upload_path(root: Path, file_path: str) -> Path:
+    """Map a URL path onto a file inside `root`, refusing anything outside"""
+    root = root.resolve()
+    target = (root / file_path).resolve()
+    if root not in target.parents or any(
+            part.startswith(".") for part in target.relative_to(root).parts):
+        raise HTTPException(status_code=404, detail="File not found")
+    return target
+
+
+async def upload_response(request: Request,
+                          root: Path,
+                          file_path: str,
+                          cache_control: str = CACHE_CONTROL) -> Response:
+    """Build the response for GET/HEAD /uploads/{file_path}"""
+    path = resolve_upload_path(root, file_path)
+    try:
+        stat = await run_in_threadpool(os.stat, path)
+    except (FileNotFoundError, NotADirectoryError):
+        raise HTTPException(status_code=404, detail="File not found")
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="File not found")
+
+    size = stat.st_size
+    etag = await content_etag(path, stat)
+    headers = {
+        "etag": etag,
+        "cache-control": cache_control,
+        "accept-ranges": "bytes",
+        "last-modified": formatdate(stat.st_mtime, usegmt=True)
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    media_type = mimetypes.guess_type(path.name)[0] or \
+        "application/octet-stream"
+    send_body = request.method != "HEAD"
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range.strip() == etag):
+        try:
+            byte_range = parse_range(range_header, size)
+        except RangeNotSatisfiable:
+            return Response(status_code=416,
+                            headers={
+                                **headers, "content-range": f"bytes */{size}"
+                            })
+        if byte_range:
+            start, end = byte_range
+            return FileRangeResponse(path,
+                                     start,
+                                     end,
+                                     status_code=206,
+                                     headers={
+                                         **headers, "content-range":
+                                         f"bytes {start}-{end}/{size}"
+                                     },
+                                     media_type=media_type,
+                                     send_body=send_body)
+
+    return FileRangeResponse(path,
+                             0,
+                             size - 1,
+                             headers=headers,
+                             media_type=media_type,
+                             send_body=send_body)
@@ -0,0 +1,75 @@
+"""
+Streaming upload helpers
+Copies an UploadFile to disk in fixed-size chunks with the blocking file I/O
+and hashing offloaded to the threadpool, so a large upload neither blocks the
+event loop nor needs more memory than one chunk. The SHA-256 and the size
+limit are computed/enforced while streaming.
+
+Config (env):
+  MAX_UPLOAD_MB  largest accepted upload in megabytes (default 200)
+"""
+
+import os
+import uuid
+import hashlib
+import logging
+from pathlib import Path
+from typing import Dict, Any, Optional
+
+from fastapi import HTTPException, UploadFile
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1 MiB
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_MB", "200")) * 1024 * 1024
+
+
+def _write_chunk(handle, hasher, chunk: bytes):
+    hasher.update(chunk)
+    handle.write(chunk)
+
+
+def discard(path: Path):
+    """Delete `path` if it exists"""
+    try:
+        path.unlink()
+    except FileNotFoundError:
+        pass
+
+
+async def stream_upload(file: UploadFile,
+                        dest: Path,
+                        max_bytes: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Stream `file` to `dest` and return {"size": int, "sha256": str}
+    Data goes to a temporary sibling first and is renamed into place only when
+    complete, so readers never see partial files. Raises 413 as soon as the
+    stream exceeds `max_bytes`.
+    """
+    max_bytes = MAX_UPLOAD_BYTES if max_bytes is None else max_bytes
+    tmp_path = dest.with_name(f".{dest.name}.{uuid.uuid4().hex}.part")
+    hasher = hashlib.sha256()
+    size = 0
+
+    handle = await run_in_threadpool(open, tmp_path, "wb")
+    try:
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"File exceeds {max_bytes // (1024 * 1024)}MB limit"
+                )
+            await run_in_threadpool(_write_chunk, handle, hasher, chunk)
+        await run_in_threadpool(handle.close)
+        await run_in_threadpool(os.replace, tmp_path, dest)
+    except BaseException:
+        await run_in_threadpool(handle.close)
+        await run_in_threadpool(discard, tmp_path)
+        raise
+
+    return {"size": size, "sha256": hasher.hexdigest()}
@@ -0,0 +1,351 @@
+"""
+Video derivatives with a local ffmpeg
+Uploaded videos get, in background jobs (see the handlers in server.py):
+
+  poster   a representative JPEG frame (ffmpeg's thumbnail filter picks the
+           least "average" of a few dozen frames, so no black fades)
+  preview  a short, muted, 360p H.264 loop for hover/autoplay previews
+  hls      optionally, a small adaptive HLS ladder (H.264/AAC, MPEG-TS
+           segments) with a master playlist
+
+Everything is written under variants/<sha256>/video/ of the storage backend,
+so it lives and dies with the blob like the image variants. Each rendering
+goes to its own directory named by a hash of its settings (output_id): the
+files are served as immutable, so a re-render with other heights or settings
+gets new URLs instead of overwriting ones clients and CDNs have cached, and
+the upload GC removes directories the blob no longer points at. Playlists use
+absolute /uploads/ URLs, so each segment goes through the same serving path
+(and gets its own presigned redirect on private S3 buckets).
+
+Results are cached on the blob (`video`) and copied onto the media and
+videos documents pointing at it; an empty `thumbnail`/`duration` on a video
+is filled in from the poster and the probed length. Without ffmpeg/ffprobe
+on PATH the jobs are skipped and uploads work as before.
+
+Config (env):
+  VIDEO_PREVIEW_SECONDS  length of the preview loop (default 4)
+  VIDEO_HLS_HEIGHTS      comma-separated rendition heights transcoded after
+                         upload, e.g. 360,720 (default empty: HLS only on
+                         request)
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import asyncio
+import logging
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Set
+
+from starlette.concurrency import run_in_threadpool
+
+from storage import key_from_url
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_SECONDS = float(os.environ.get("VIDEO_PREVIEW_SECONDS", "4"))
+# Rounded down to even: libx264 with yuv420p needs even dimensions
+HLS_HEIGHTS = sorted(
+    int(h) // 2 * 2
+    for h in os.environ.get("VIDEO_HLS_HEIGHTS", "").split(",") if h.strip())
+DEFAULT_HLS_HEIGHTS = [360, 720]
+MIN_HLS_HEIGHT = 144
+MAX_HLS_HEIGHT = 2160
+VIDEO_DIR = "video"
+POSTER_MAX_WIDTH = 1280
+PREVIEW_HEIGHT = 360
+HLS_SEGMENT_SECONDS = 6
+AUDIO_KBPS = 128
+PROBE_TIMEOUT = 60
+FRAME_TIMEOUT = 300
+# Copied onto media/videos documents (see VideoProcessor.document_fields)
+VIDEO_DOCUMENT_FIELDS = ("poster", "previewUrl", "hlsUrl", "durationSeconds",
+                         "width", "height")
+# Per rendition; HLS timeouts scale with the duration
+HLS_TIMEOUT_FACTOR = 4
+# Bump when the ffmpeg arguments change so outputs get new directories
+RENDER_VERSION = 1
+
+
+class VideoProcessingError(Exception):
+    pass
+
+
+def ffmpeg_available() -> bool:
+    return bool(shutil.which("ffmpeg") and shutil.which("ffprobe"))
+
+
+def video_kbps(height: int) -> int:
+    """H.264 bitrate for a rendition (5 Mbps at 1080p, ~1 Mbps at 360p)"""
+    return round(5000 * (height / 1080)**1.5)
+
+
+def valid_hls_heights(heights: Any) -> bool:
+    """A non-empty list of even rendition heights within the supported range"""
+    return isinstance(heights, list) and bool(heights) and all(
+        isinstance(height, int) and not isinstance(height, bool)
+        and MIN_HLS_HEIGHT <= height <= MAX_HLS_HEIGHT and height % 2 == 0
+        for height in heights)
+
+
+def format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(round(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes}:{seconds:02d}"
+
+
+async def _run(args: List[str], timeout: float) -> bytes:
+    process = await asyncio.create_subprocess_exec(
+        *args,
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE)
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(),
+                                                timeout)
+    except BaseException:
+        # Timed out or the job was cancelled: don't leave ffmpeg running
+        process.kill()
+        await process.wait()
+        raise
+    if process.returncode != 0:
+        message = stderr.decode("utf-8", errors="replace").strip()
+        raise VideoProcessingError(message[-500:] or
+                                   f"{Path(args[0]).name} failed")
+    return stdout
+
+
+async def probe(src: Path) -> Dict[str, Any]:
+    """Duration, display size and audio presence of a video file"""
+    output = await _run([
+        "ffprobe", "-v", "error", "-print_format", "json", "-show_format",
+        "-show_streams",
+        str(src)
+    ], PROBE_TIMEOUT)
+    info = json.loads(output or b"{}")
+    streams = info.get("streams") or []
+    video = next((stream for stream in streams
+                  if stream.get("codec_type") == "video" and not (
+                      stream.get("disposition") or {}).get("attached_pic")),
+                 None)
+    if video is None:
+        raise VideoProcessingError("No video stream")
+    width, height = int(video["width"]), int(video["height"])
+    rotation = int((video.get("tags") or {}).get("rotate", 0))
+    for side_data in video.get("side_data_list") or []:
+        rotation = int(side_data.get("rotation", rotation))
+    if rotation % 180:
+        # ffmpeg applies the rotation when transcoding
+        width, height = height, width
+    try:
+        duration = float((info.get("format") or {}).get("duration"))
+    except (TypeError, ValueError):
+        duration = 0.0
+    return {
+        "duration": round(duration, 2),
+        "width": width,
+        "height": height,
+        "hasAudio": any(
+            stream.get("codec_type") == "audio" for stream in streams)
+    }
+
+
+def _even(value: float) -> int:
+    return max(2, int(value) // 2 * 2)
+
+
+def output_id(settings: Dict[str, Any]) -> str:
+    """Directory name for a rendering with these settings"""
+    content = json.dumps({**settings, "version": RENDER_VERSION},
+                         sort_keys=True)
+    return hashlib.sha256(content.encode()).hexdigest()[:16]
+
+
+def video_dirs(video: Optional[Dict[str, Any]]) -> Set[str]:
+    """Storage directories holding the current outputs of a blob's video"""
+    video = video or {}
+    urls = [video.get("poster"), video.get("preview"), video.get("hls")]
+    urls += [rendition.get("url") for rendition in video.get("hlsRenditions")
+             or []]
+    keys = (key_from_url(url) for url in urls)
+    return {key.rsplit("/", 1)[0] for key in keys if key and "/" in key}
+
+
+class VideoProcessor:
+
+    def __init__(self, blob_store):
+        self.blob_store = blob_store
+
+    @staticmethod
+    def prefix(blob: Dict[str, Any], output: str) -> str:
+        return f"variants/{blob['_id']}/{VIDEO_DIR}/{output}"
+
+    async def derive(self, db, blob: Dict[str, Any]) -> Dict[str, Any]:
+        """Probe the video and render its poster and preview loop"""
+        prefix = self.prefix(
+            blob,
+            output_id({
+                "previewSeconds": PREVIEW_SECONDS,
+                "posterWidth": POSTER_MAX_WIDTH,
+                "previewHeight": PREVIEW_HEIGHT
+            }))
+        async with self.blob_store.local_copy(blob) as src, \
+                self.blob_store.scratch_dir() as out_dir:
+            await run_in_threadpool(out_dir.mkdir, parents=True, exist_ok=True)
+            info = await probe(src)
+            # Skip intros and fades, but stay inside short clips
+            start = min(info["duration"] * 0.1, 5.0)
+            await _run([
+                "ffmpeg", "-v", "error", "-y", "-ss", f"{start:.2f}", "-i",
+                str(src), "-vf",
+                f"thumbnail=60,scale='min({POSTER_MAX_WIDTH},iw)':-2",
+                "-frames:v", "1", "-q:v", "3",
+                str(out_dir / "poster.jpg")
+            ], FRAME_TIMEOUT)
+            await _run([
+                "ffmpeg", "-v", "error", "-y", "-ss", f"{start:.2f}", "-t",
+                str(PREVIEW_SECONDS), "-i",
+                str(src), "-an", "-vf",
+                f"fps=24,scale=-2:'trunc(min({PREVIEW_HEIGHT},ih)/2)*2'",
+                "-c:v", "libx264", "-preset", "veryfast", "-crf", "28",
+                "-pix_fmt", "yuv420p", "-movflags", "+faststart",
+                str(out_dir / "preview.mp4")
+            ], FRAME_TIMEOUT)
+            await self.blob_store.storage.put_directory(prefix, out_dir)
+
+        video = {
+            # An HLS ladder of the same bytes stays valid
+            **(blob.get("video") or {}),
+            **info,
+            "poster": f"/uploads/{prefix}/poster.jpg",
+            "preview": f"/uploads/{prefix}/preview.mp4"
+        }
+        await self.blob_store.save_metadata(db, blob["_id"], {"video": video})
+        return video
+
+    async def transcode_hls(self, db, blob: Dict[str, Any],
+                            heights: List[int]) -> Dict[str, Any]:
+        """Render an HLS ladder (renditions no taller than the source)"""
+        video = blob["video"]
+        ladder = [height for height in heights if height <= video["height"]
+                  ] or [_even(min(video["height"], min(heights)))]
+        prefix = self.prefix(
+            blob, "hls-" + output_id({
+                "heights": ladder,
+                "segmentSeconds": HLS_SEGMENT_SECONDS,
+                "audioKbps": AUDIO_KBPS
+            }))
+        base_url = f"/uploads/{prefix}/"
+        renditions = []
+        async with self.blob_store.local_copy(blob) as src, \
+                self.blob_store.scratch_dir() as out_dir:
+            await run_in_threadpool(out_dir.mkdir, parents=True, exist_ok=True)
+            for height in ladder:
+                name = f"hls-{height}p"
+                kbps = video_kbps(height)
+                audio = [
+                    "-map", "0:a:0", "-c:a", "aac", "-b:a", f"{AUDIO_KBPS}k",
+                    "-ac", "2"
+                ] if video["hasAudio"] else ["-an"]
+                await _run(
+                    [
+                        "ffmpeg", "-v", "error", "-y", "-i",
+                        str(src), "-map", "0:v:0", *audio, "-vf",
+                        f"scale=-2:{height}", "-c:v", "libx264", "-preset",
+                        "veryfast", "-profile:v", "main", "-pix_fmt",
+                        "yuv420p", "-b:v", f"{kbps}k", "-maxrate",
+                        f"{round(kbps * 1.07)}k", "-bufsize", f"{kbps * 2}k",
+                        # Keyframes on segment boundaries so players can switch
+                        "-force_key_frames",
+                        f"expr:gte(t,n_forced*{HLS_SEGMENT_SECONDS})",
+                        "-sc_threshold", "0", "-f", "hls", "-hls_time",
+                        str(HLS_SEGMENT_SECONDS), "-hls_playlist_type", "vod",
+                        "-hls_base_url", base_url, "-hls_segment_filename",
+                        str(out_dir / f"{name}-%04d.ts"),
+                        str(out_dir / f"{name}.m3u8")
+                    ],
+                    max(FRAME_TIMEOUT, video["duration"] * HLS_TIMEOUT_FACTOR))
+                renditions.append({
+                    "height": height,
+                    "width": _even(video["width"] * height / video["height"]),
+                    "bandwidth":
+                    (round(kbps * 1.07) +
+                     (AUDIO_KBPS if video["hasAudio"] else 0)) * 1000,
+                    "url": f"{base_url}{name}.m3u8"
+                })
+
+            master = ["#EXTM3U", "#EXT-X-VERSION:3"]
+            for rendition in renditions:
+                master += [
+                    f"#EXT-X-STREAM-INF:BANDWIDTH={rendition['bandwidth']},"
+                    f"RESOLUTION={rendition['width']}x{rendition['height']}",
+                    rendition["url"]
+                ]
+            await run_in_threadpool((out_dir / "master.m3u8").write_text,
+                                    "\n".join(master) + "\n")
+            await self.blob_store.storage.put_directory(prefix, out_dir)
+
+        video = {
+            **video, "hls": f"{base_url}master.m3u8",
+            "hlsRenditions": renditions
+        }
+        await self.blob_store.save_metadata(db, blob["_id"], {"video": video})
+        return video
+
+    @staticmethod
+    def document_fields(video: Dict[str, Any]) -> Dict[str, Any]:
+        fields = {
+            "poster": video["poster"],
+            "previewUrl": video["preview"],
+            "durationSeconds": video["duration"],
+            "width": video["width"],
+            "height": video["height"]
+        }
+        if video.get("hls"):
+            fields["hlsUrl"] = video["hls"]
+        return fields
+
+    async def publish(self, db, blob: Dict[str, Any]) -> int:
+        """Copy the derivatives onto the documents showing this video"""
+        video = blob["video"]
+        fields = self.document_fields(video)
+        url = self.blob_store.url(blob)
+        await db.media.update_many({"blobId": blob["_id"]}, {"$set": fields})
+        showing = {"$or": [{"blobId": blob["_id"]}, {"videoUrl": url}]}
+        result = await db.videos.update_many(
+            showing, {"$set": {
+                **fields, "blobId": blob["_id"]
+            }})
+        # Only fill in what the editor left empty, or a poster rendered before
+        await db.videos.update_many(
+            {
+                "$and": [
+                    showing, {
+                        "$or": [{
+                            "thumbnail": {
+                                "$in": [None, ""]
+                            }
+                        }, {
+                            "thumbnail": {
+                                "$regex":
+                                f"^/uploads/{self.prefix(blob, '')}"
+                            }
+                        }]
+                    }
+                ]
+            }, {"$set": {
+                "thumbnail": video["poster"]
+            }})
+        if video["duration"]:
+            await db.videos.update_many(
+                {
+                    **showing, "duration": {
+                        "$in": [None, ""]
+                    }
+                }, {"$set": {
+                    "duration": format_duration(video["duration"])
+                }})
+        return result.modified_count
@@ -0,0 +1,217 @@
+"""
+Watermarked derivatives for the public gallery
+When the watermark is enabled, every portfolio image gets a second set of
+responsive derivatives (same widths and formats as its variants) with the
+studio watermark composited on, rendered once in the image process pool (see
+watermark_overlay.py). Public portfolio responses then point at those instead
+of the clean files; admin responses keep the originals. While the watermark
+is enabled, public documents carry no blob hash and no clean URL, images still
+waiting for their rendering are left out, and /img/ serves portfolio blobs
+only to signed-in admins, marked private so no shared cache keeps them (see
+public_view, protects and the /img/ route in server.py).
+
+Outputs are stored under watermarked/<config hash>/<render id>/, where the
+render id is a hash of the config hash and the blob sha256 (so the clean
+file's path can't be derived from it), and recorded on the blob and its
+portfolio documents (`watermarked`), so they are cached by (image hash,
+watermark config hash). Editing anything else never re-renders;
+changing the watermark settings yields a new config hash, a background job
+re-renders the gallery, and the files of the previous config are left to the
+upload GC once no document points at them.
+
+Settings (system settings, key "watermark"):
+  enabled   bool
+  text      text line, drawn under the logo
+  logoUrl   /uploads/ URL of the logo image
+  position  top-left | top-right | bottom-left | bottom-right | center | tile
+  opacity   0.05-1 (default 0.5)
+  scale     logo width as a fraction of the image width (default 0.18)
+  margin    distance from the edges as a fraction of the width (default 0.03)
+  color     text color (default #ffffff)
+"""
+
+import json
+import time
+import hashlib
+import logging
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, Any, AsyncIterator
+
+from fastapi import HTTPException
+from PIL import ImageColor
+
+from image_variants import create_variants
+from storage import key_from_url
+
+logger = logging.getLogger(__name__)
+
+WATERMARK_DIR = "watermarked"
+POSITIONS = ("top-left", "top-right", "bottom-left", "bottom-right", "center",
+             "tile")
+DEFAULTS = {
+    "enabled": False,
+    "text": "",
+    "logoUrl": "",
+    "position": "bottom-right",
+    "opacity": 0.5,
+    "scale": 0.18,
+    "margin": 0.03,
+    "color": "#ffffff"
+}
+# (min, max) of the numeric settings
+RANGES = {"opacity": (0.05, 1.0), "scale": (0.02, 0.8), "margin": (0.0, 0.2)}
+SETTINGS_TTL = 30
+# Bump when the drawing changes so every image is rendered again
+RENDER_VERSION = 2
+
+
+def normalize_watermark(data: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Validated watermark settings with defaults filled in (400 if invalid)"""
+    config = {**DEFAULTS, **{k: v for k, v in (data or {}).items()
+                             if k in DEFAULTS}}
+    config["enabled"] = bool(config["enabled"])
+    config["text"] = str(config["text"] or "").strip()[:120]
+    config["logoUrl"] = str(config["logoUrl"] or "").strip()
+    if config["position"] not in POSITIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"position must be one of {', '.join(POSITIONS)}")
+    for field, (low, high) in RANGES.items():
+        try:
+            config[field] = min(max(float(config[field]), low), high)
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400,
+                                detail=f"Invalid watermark {field}")
+    try:
+        ImageColor.getrgb(config["color"])
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid watermark color")
+    if config["logoUrl"] and key_from_url(config["logoUrl"]) is None:
+        raise HTTPException(status_code=400,
+                            detail="logoUrl must be an uploaded file")
+    return config
+
+
+def config_hash(config: Dict[str, Any]) -> str:
+    content = json.dumps({**config, "version": RENDER_VERSION}, sort_keys=True)
+    return hashlib.sha256(content.encode()).hexdigest()[:16]
+
+
+def render_id(state_hash: str, blob_id: str) -> str:
+    return hashlib.sha256(f"{state_hash}:{blob_id}".encode()).hexdigest()[:32]
+
+
+class Watermarker:
+
+    def __init__(self, blob_store):
+        self.blob_store = blob_store
+        self._state: Optional[Dict[str, Any]] = None
+        self._loaded_at = 0.0
+
+    def invalidate(self):
+        self._loaded_at = 0.0
+
+    async def current(self, db) -> Optional[Dict[str, Any]]:
+        """{"config", "hash"} of the active watermark, or None if disabled"""
+        if time.monotonic() - self._loaded_at < SETTINGS_TTL:
+            return self._state
+        settings = await db.settings.find_one({"type": "system"},
+                                              {"watermark": 1}) or {}
+        try:
+            config = normalize_watermark(settings.get("watermark"))
+        except HTTPException:
+            config = None
+        if config and config["enabled"] and (config["text"]
+                                             or config["logoUrl"]):
+            self._state = {"config": config, "hash": config_hash(config)}
+        else:
+            self._state = None
+        self._loaded_at = time.monotonic()
+        return self._state
+
+    async def protects(self, db, blob_id: str) -> bool:
+        """Whether clean copies of a blob are for admins only right now"""
+        return bool(await self.current(db) and await db.portfolio.find_one(
+            {"blobId": blob_id}, {"_id": 1}))
+
+    @asynccontextmanager
+    async def _logo_copy(self, config: Dict[str, Any]) -> AsyncIterator[Optional[str]]:
+        key = key_from_url(config["logoUrl"])
+        if key is None:
+            yield None
+            return
+        try:
+            async with self.blob_store.storage.local_copy(key) as path:
+                yield str(path)
+        except FileNotFoundError:
+            logger.warning(f"Watermark logo {key} is missing; text only")
+            yield None
+
+    async def render(self, db, blob: Dict[str, Any],
+                     state: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Watermarked derivatives of a blob for `state`, rendered once"""
+        cached = blob.get("watermarked")
+        if cached and cached["hash"] == state["hash"]:
+            return cached
+        rid = render_id(state["hash"], blob["_id"])
+        prefix = f"{WATERMARK_DIR}/{state['hash']}/{rid}"
+        try:
+            async with self.blob_store.local_copy(blob) as src, \
+                    self.blob_store.scratch_dir() as out_dir, \
+                    self._logo_copy(state["config"]) as logo:
+                if logo is None and not state["config"]["text"]:
+                    # Nothing to draw; the image stays off the public site
+                    logger.warning("Watermark has no text and its logo is "
+                                   "missing; not rendering")
+                    return None
+                fields = await create_variants(src, out_dir,
+                                               f"/uploads/{prefix}", {
+                                                   "config": state["config"],
+                                                   "logo": logo
+                                               })
+                if not fields or not fields["variants"]:
+                    return None
+                await self.blob_store.storage.put_directory(prefix, out_dir)
+        except FileNotFoundError:
+            return None
+
+        largest = max(fields["variants"],
+                      key=lambda v: (v["format"] == "webp", v["width"]))
+        watermarked = {
+            "hash": state["hash"],
+            "renderId": rid,
+            "image": largest["url"],
+            "variants": fields["variants"],
+            "srcset": fields["srcset"]
+        }
+        await self.blob_store.save_metadata(db, blob["_id"],
+                                            {"watermarked": watermarked})
+        return watermarked
+
+    @staticmethod
+    def public_view(doc: Dict[str, Any],
+                    state: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """
+        A portfolio document as the public site should see it, or None if it
+        can't be shown yet (an upload whose watermarked copy isn't rendered)
+        """
+        watermarked = doc.pop("watermarked", None)
+        if not state:
+            return doc
+        # The blob hash leads to the clean file (/img/, variants/)
+        doc.pop("blobId", None)
+        doc.pop("sha256", None)
+        if watermarked and watermarked.get("renderId"):
+            # A previous config's rendering beats exposing the clean file
+            # while the gallery is being re-rendered (renderings from before
+            # render ids have the blob hash in their paths)
+            doc.update(image=watermarked["image"],
+                       variants=watermarked["variants"],
+                       srcset=watermarked["srcset"])
+            return doc
+        if key_from_url(doc.get("image") or "") is not None:
+            return None
+        # External images are shown as they are
+        doc.pop("variants", None)
+        doc.pop("srcset", None)
+        return doc
@@ -0,0 +1,111 @@
+"""
+Watermark drawing
+Composites the studio watermark (text and/or logo) onto an image. Runs in the
+image process pool as part of rendering the watermarked derivatives (see
+image_variants.render_variants and watermark.py).
+
+The logo is prepared the way the site generator's process_logo prepares
+logo.png: fitted inside 500x200 with LANCZOS, transparency kept. It is then
+scaled relative to each derivative's width, so every size carries a
+proportionally identical mark.
+"""
+
+from typing import Optional, Dict, Any, Tuple
+
+from PIL import Image, ImageDraw, ImageFont, ImageColor
+
+LOGO_BOX = (500, 200)
+TEXT_SIZE = 0.035  # of the image width
+TILE_SPACING = 2.5  # mark sizes between tiled repetitions
+
+
+def prepare_logo(path: str) -> Image.Image:
+    """Same treatment as process_logo's logo.png, as RGBA"""
+    with Image.open(path) as logo:
+        logo = logo.convert("RGBA")
+    logo.thumbnail(LOGO_BOX, Image.LANCZOS)
+    return logo
+
+
+def _text_mark(text: str, width: int, color: str) -> Image.Image:
+    size = max(12, round(width * TEXT_SIZE))
+    font = ImageFont.load_default(size=size)
+    stroke = max(1, size // 16)
+    left, top, right, bottom = font.getbbox(text, stroke_width=stroke)
+    mark = Image.new("RGBA", (right - left, bottom - top), (0, 0, 0, 0))
+    ImageDraw.Draw(mark).text((-left, -top),
+                              text,
+                              font=font,
+                              fill=ImageColor.getrgb(color),
+                              stroke_width=stroke,
+                              stroke_fill=(0, 0, 0))
+    return mark
+
+
+def build_mark(image_width: int, config: Dict[str, Any],
+               logo: Optional[Image.Image]) -> Image.Image:
+    """Logo above text, sized for an image `image_width` px wide"""
+    parts = []
+    if logo is not None:
+        target = max(1, round(image_width * config["scale"]))
+        height = max(1, round(logo.height * target / logo.width))
+        parts.append(logo.resize((target, height), Image.LANCZOS))
+    if config.get("text"):
+        parts.append(_text_mark(config["text"], image_width, config["color"]))
+    if not parts:
+        raise ValueError("Watermark has no text and no logo")
+
+    gap = round(image_width * 0.01) if len(parts) > 1 else 0
+    mark = Image.new("RGBA", (max(part.width for part in parts),
+                              sum(part.height for part in parts) + gap),
+                     (0, 0, 0, 0))
+    y = 0
+    for part in parts:
+        mark.alpha_composite(part, ((mark.width - part.width) // 2, y))
+        y += part.height + gap
+
+    if config["opacity"] < 1:
+        alpha = mark.getchannel("A").point(
+            lambda value: round(value * config["opacity"]))
+        mark.putalpha(alpha)
+    return mark
+
+
+def _positions(size: Tuple[int, int], mark: Image.Image, position: str,
+               margin: int):
+    width, height = size
+    if position == "tile":
+        step_x = round(mark.width * TILE_SPACING)
+        step_y = round(mark.height * TILE_SPACING)
+        for row, y in enumerate(range(margin, height, step_y)):
+            # Stagger alternate rows
+            offset = (step_x // 2) * (row % 2)
+            for x in range(margin - offset, width, step_x):
+                yield x, y
+        return
+    vertical, _, horizontal = position.partition("-")
+    if position == "center":
+        vertical = horizontal = "center"
+    x = {
+        "left": margin,
+        "right": width - mark.width - margin
+    }.get(horizontal, (width - mark.width) // 2)
+    y = {
+        "top": margin,
+        "bottom": height - mark.height - margin
+    }.get(vertical, (height - mark.height) // 2)
+    yield x, y
+
+
+def apply_watermark(image: Image.Image, config: Dict[str, Any],
+                    logo: Optional[Image.Image]) -> Image.Image:
+    """Copy of `image` (RGB/RGBA) with the watermark composited on"""
+    mark = build_mark(image.width, config, logo)
+    margin = round(image.width * config["margin"])
+    overlay = Image.new("RGBA", image.size, (0, 0, 0, 0))
+    for x, y in _positions(image.size, mark, config["position"], margin):
+        # paste clips marks that run off the edge (tiling)
+        overlay.paste(mark, (x, y), mark)
+    result = image.convert("RGBA")
+    result.alpha_composite(overlay)
+    return result if image.mode == "RGBA" else result.convert("RGB")
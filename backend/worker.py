@@ -0,0 +1,39 @@
+"""
+Standalone background job worker
+Runs the job queue beside the web server instead of inside it:
+
+  JOB_WORKERS=0 gunicorn server:app ...   # web processes only enqueue
+  python worker.py                        # one or more of these process jobs
+
+Config (env): same as server.py, plus WORKER_CONCURRENCY (jobs run
+concurrently by this process, default 2). JOB_WORKERS is ignored here, since
+the shared .env usually sets it to 0 for the web processes.
+"""
+
+import asyncio
+import logging
+import os
+
+from server import db, job_queue, shutdown_pool
+
+logger = logging.getLogger(__name__)
+
+
+async def main():
+    await job_queue.ensure_indexes(db)
+    workers = int(os.environ.get("WORKER_CONCURRENCY") or 0) or 2
+    job_queue.start(db, workers=workers)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        job_queue.stop()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        shutdown_pool()
@@ -0,0 +1,271 @@
+"""
+Streaming ZIP archives of stored files
+Archives are produced on the fly straight from storage: no temporary files and
+constant memory whatever the gallery size. Entries use STORE (photos and
+videos are already compressed) and ZIP64 records where sizes, offsets or the
+entry count exceed the classic limits, so multi-GB galleries work.
+
+Every entry carries a data descriptor after its bytes, so the CRC-32 can be
+computed while streaming. Because the sizes are known from the blob records,
+the whole layout and the total length are known up front. Once the CRC of every
+entry is cached on its blob (`crc32`, filled in while streaming and by a
+background job), any byte range can be produced, so downloads can resume with
+Range / If-Range. Until then a full response is sent.
+"""
+
+import re
+import zlib
+import struct
+import hashlib
+import logging
+from datetime import datetime
+from pathlib import PurePosixPath
+from typing import (Optional, List, Set, Callable, Awaitable, AsyncIterator,
+                    Tuple)
+from urllib.parse import quote
+
+from fastapi import Request
+from starlette.responses import Response, StreamingResponse
+
+from upload_serving import parse_range, RangeNotSatisfiable
+
+logger = logging.getLogger(__name__)
+
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP64_COUNT_LIMIT = 0xFFFF
+VERSION_STORE = 20
+VERSION_ZIP64 = 45
+# Data descriptor follows the data; names are UTF-8
+FLAGS = 0x0008 | 0x0800
+EXTERNAL_ATTRIBUTES = (0o100644 << 16)
+VERSION_MADE_BY = (3 << 8) | VERSION_ZIP64  # Unix
+UNSAFE_NAME_CHARS = re.compile(r'[\x00-\x1f/\\:*?"<>|]+')
+
+
+class ZipEntry:
+    """One archive member: `name` inside the archive, bytes from `key`"""
+
+    __slots__ = ("name", "key", "size", "modified", "crc", "blob_id", "offset")
+
+    def __init__(self,
+                 name: str,
+                 key: str,
+                 size: int,
+                 modified: Optional[datetime] = None,
+                 crc: Optional[int] = None,
+                 blob_id: Optional[str] = None):
+        self.name = name
+        self.key = key
+        self.size = size
+        self.modified = modified or datetime(1980, 1, 1)
+        # Nothing to read for empty files
+        self.crc = 0 if size == 0 else crc
+        self.blob_id = blob_id
+        self.offset = 0
+
+    @property
+    def zip64(self) -> bool:
+        return self.size >= ZIP64_LIMIT
+
+
+def archive_name(title: Optional[str], key: str, taken: Set[str]) -> str:
+    """Safe, unique member name from a title, keeping the file's extension"""
+    suffix = PurePosixPath(key).suffix.lower()
+    stem = UNSAFE_NAME_CHARS.sub("_", title or "").strip(" .") or "file"
+    if stem.lower().endswith(suffix):
+        stem = stem[:-len(suffix)] if suffix else stem
+    name, counter = f"{stem}{suffix}", 2
+    while name.lower() in taken:
+        name = f"{stem} ({counter}){suffix}"
+        counter += 1
+    taken.add(name.lower())
+    return name
+
+
+def _dos_datetime(value: datetime) -> Tuple[int, int]:
+    value = max(value, datetime(1980, 1, 1))
+    date = ((value.year - 1980) << 9) | (value.month << 5) | value.day
+    time = (value.hour << 11) | (value.minute << 5) | (value.second // 2)
+    return date, time
+
+
+def _local_header(entry: ZipEntry) -> bytes:
+    name = entry.name.encode("utf-8")
+    date, time = _dos_datetime(entry.modified)
+    if entry.zip64:
+        extra = struct.pack("<HHQQ", 0x0001, 16, entry.size, entry.size)
+        size = ZIP64_LIMIT
+    else:
+        extra = b""
+        size = entry.size
+    return struct.pack("<IHHHHHIIIHH", 0x04034b50,
+                       VERSION_ZIP64 if entry.zip64 else VERSION_STORE, FLAGS,
+                       0, time, date, 0, size, size, len(name),
+                       len(extra)) + name + extra
+
+
+def _descriptor(entry: ZipEntry) -> bytes:
+    if entry.zip64:
+        return struct.pack("<IIQQ", 0x08074b50, entry.crc or 0, entry.size,
+                           entry.size)
+    return struct.pack("<IIII", 0x08074b50, entry.crc or 0, entry.size,
+                       entry.size)
+
+
+def _central_header(entry: ZipEntry) -> bytes:
+    name = entry.name.encode("utf-8")
+    date, time = _dos_datetime(entry.modified)
+    fields = []
+    size = entry.size
+    offset = entry.offset
+    if entry.zip64:
+        fields += [entry.size, entry.size]
+        size = ZIP64_LIMIT
+    if entry.offset >= ZIP64_LIMIT:
+        fields.append(entry.offset)
+        offset = ZIP64_LIMIT
+    extra = struct.pack(f"<HH{len(fields)}Q", 0x0001, 8 * len(fields), *
+                        fields) if fields else b""
+    needed = VERSION_ZIP64 if fields else VERSION_STORE
+    return struct.pack("<IHHHHHHIIIHHHHHII", 0x02014b50, VERSION_MADE_BY,
+                       needed, FLAGS, 0, time, date, entry.crc or 0, size,
+                       size, len(name), len(extra), 0, 0, 0,
+                       EXTERNAL_ATTRIBUTES, offset) + name + extra
+
+
+class ZipStream:
+    """Byte layout of an archive; produces any range of it on demand"""
+
+    def __init__(self,
+                 storage,
+                 entries: List[ZipEntry],
+                 on_checksum: Optional[Callable[[ZipEntry],
+                                                Awaitable[None]]] = None):
+        self.storage = storage
+        self.entries = entries
+        self.on_checksum = on_checksum
+        # (offset, length, kind, entry)
+        self._segments = []
+        offset = 0
+        for entry in entries:
+            entry.offset = offset
+            for kind, length in (("header", len(_local_header(entry))),
+                                 ("data", entry.size),
+                                 ("descriptor", len(_descriptor(entry)))):
+                self._segments.append((offset, length, kind, entry))
+                offset += length
+        self._directory_offset = offset
+        trailer_length = len(self._trailer())
+        self._segments.append((offset, trailer_length, "trailer", None))
+        self.size = offset + trailer_length
+
+    @property
+    def resumable(self) -> bool:
+        """Every CRC is known, so any byte range can be produced"""
+        return all(entry.crc is not None for entry in self.entries)
+
+    def etag(self) -> str:
+        hasher = hashlib.sha256()
+        for entry in self.entries:
+            hasher.update(
+                f"{entry.name}\0{entry.key}\0{entry.size}\0".encode("utf-8"))
+        return f'"{hasher.hexdigest()[:32]}"'
+
+    def _trailer(self) -> bytes:
+        directory = b"".join(_central_header(entry) for entry in self.entries)
+        count = len(self.entries)
+        offset = self._directory_offset
+        trailer = directory
+        if (count >= ZIP64_COUNT_LIMIT or offset >= ZIP64_LIMIT
+                or len(directory) >= ZIP64_LIMIT):
+            zip64_end = offset + len(directory)
+            trailer += struct.pack("<IQHHIIQQQQ", 0x06064b50, 44,
+                                   VERSION_MADE_BY, VERSION_ZIP64, 0, 0, count,
+                                   count, len(directory), offset)
+            trailer += struct.pack("<IIQI", 0x07064b50, 0, zip64_end, 1)
+        trailer += struct.pack("<IHHHHIIH", 0x06054b50, 0, 0,
+                               min(count, ZIP64_COUNT_LIMIT),
+                               min(count, ZIP64_COUNT_LIMIT),
+                               min(len(directory), ZIP64_LIMIT),
+                               min(offset, ZIP64_LIMIT), 0)
+        return trailer
+
+    async def iter_range(self, start: int, end: int) -> AsyncIterator[bytes]:
+        """Bytes [start, end] of the archive"""
+        for offset, length, kind, entry in self._segments:
+            if offset + length <= start or length == 0:
+                continue
+            if offset > end:
+                return
+            first = max(start - offset, 0)
+            last = min(end - offset, length - 1)
+            if kind == "data":
+                async for chunk in self._entry_data(entry, first, last):
+                    yield chunk
+                continue
+            if kind == "header":
+                data = _local_header(entry)
+            elif kind == "descriptor":
+                data = _descriptor(entry)
+            else:
+                data = self._trailer()
+            yield data[first:last + 1]
+
+    async def _entry_data(self, entry: ZipEntry, first: int,
+                          last: int) -> AsyncIterator[bytes]:
+        whole = first == 0 and last == entry.size - 1
+        crc = 0
+        sent = 0
+        async for chunk in self.storage.read_range(entry.key, first, last):
+            if whole and entry.crc is None:
+                crc = zlib.crc32(chunk, crc)
+            sent += len(chunk)
+            yield chunk
+        if sent != last - first + 1:
+            # The layout is already on the wire; abort rather than corrupt
+            raise IOError(f"{entry.key} changed size while zipping")
+        if whole and entry.crc is None:
+            entry.crc = crc
+            if self.on_checksum:
+                await self.on_checksum(entry)
+
+
+def zip_response(request: Request, stream: ZipStream,
+                 filename: str) -> Response:
+    """GET/HEAD response for an archive, with Range once it is resumable"""
+    etag = stream.etag()
+    headers = {
+        "etag": etag,
+        "cache-control": "private, no-cache",
+        "accept-ranges": "bytes" if stream.resumable else "none",
+        "content-disposition":
+        f"attachment; filename*=UTF-8''{quote(filename)}"
+    }
+    start, end, status = 0, stream.size - 1, 200
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and stream.resumable and (not if_range
+                                              or if_range.strip() == etag):
+        try:
+            byte_range = parse_range(range_header, stream.size)
+        except RangeNotSatisfiable:
+            return Response(status_code=416,
+                            headers={
+                                **headers, "content-range":
+                                f"bytes */{stream.size}"
+                            })
+        if byte_range:
+            start, end = byte_range
+            status = 206
+            headers["content-range"] = f"bytes {start}-{end}/{stream.size}"
+
+    headers["content-length"] = str(end - start + 1)
+    if request.method == "HEAD":
+        return Response(status_code=status,
+                        headers=headers,
+                        media_type="application/zip")
+    return StreamingResponse(stream.iter_range(start, end),
+                             status_code=status,
+                             headers=headers,
+                             media_type="application/zip")
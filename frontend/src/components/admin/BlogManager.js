@@ -1,23 +1,16 @@
-import React, { useState, useEffect } from 'react';
-import axios from 'axios';
+import React, { useState } from 'react';
 import { Plus } from 'lucide-react';
+import { usePagedList } from '../../hooks/use-paged-list';
 
-const BlogManager = ({ user }) => {
-  const [blogs, setBlogs] = useState([]);
-  const API_URL = process.env.REACT_APP_BACKEND_URL || import.meta.env.REACT_APP_BACKEND_URL;
-
-  useEffect(() => {
-    fetchBlogs();
-  }, []);
+const SELECT_CLASS = "px-4 py-2 bg-white/10 border border-white/20 rounded-lg text-white focus:outline-none focus:ring-2 focus:ring-purple-500";
 
-  const fetchBlogs = async () => {
-    try {
-      const response = await axios.get(`${API_URL}/api/admin/blog`, { withCredentials: true });
-      setBlogs(response.data.blogs || []);
-    } catch (error) {
-      console.error('Error fetching blogs:', error);
-    }
-  };
+const BlogManager = ({ user }) => {
+  // Filtered and sorted server-side; pages load on demand
+  const [isPublished, setIsPublished] = useState('');
+  const [sort, setSort] = useState('createdAt');
+  const [order, setOrder] = useState('desc');
+  const { items: blogs, total, totalEstimated, hasMore, loading, loadMore } =
+    usePagedList('/admin/blog', 'blogs', { isPublished, sort, order });
 
   return (
     <div>
@@ -28,11 +21,43 @@ const BlogManager = ({ user }) => {
           New Post
         </button>
       </div>
+      <div className="flex flex-wrap gap-4 mb-6">
+        <select value={isPublished} onChange={(e) => setIsPublished(e.target.value)} className={SELECT_CLASS}>
+          <option value="" className="bg-gray-900">All posts</option>
+          <option value="true" className="bg-gray-900">Published</option>
+          <option value="false" className="bg-gray-900">Drafts</option>
+        </select>
+        <select value={sort} onChange={(e) => setSort(e.target.value)} className={SELECT_CLASS}>
+          <option value="createdAt" className="bg-gray-900">Created</option>
+          <option value="updatedAt" className="bg-gray-900">Updated</option>
+          <option value="publishedAt" className="bg-gray-900">Published</option>
+          <option value="title" className="bg-gray-900">Title</option>
+        </select>
+        <select value={order} onChange={(e) => setOrder(e.target.value)} className={SELECT_CLASS}>
+          <option value="desc" className="bg-gray-900">Descending</option>
+          <option value="asc" className="bg-gray-900">Ascending</option>
+        </select>
+      </div>
       <div className="bg-white/10 backdrop-blur-xl rounded-xl p-6 border border-white/20 text-white">
-        <p>Blog management interface. Currently {blogs.length} posts.</p>
+        <p className="mb-4">
+          Blog management interface. Showing {blogs.length} of {totalEstimated ? 'about ' : ''}{total} posts.
+        </p>
+        <ul className="divide-y divide-white/10">
+          {blogs.map((blog) => (
+            <li key={blog.blogId || blog._id} className="py-2 flex justify-between">
+              <span>{blog.title}</span>
+              <span className="text-white/60 text-sm">{blog.isPublished ? 'Published' : 'Draft'}</span>
+            </li>
+          ))}
+        </ul>
+        {hasMore && (
+          <button onClick={loadMore} disabled={loading} className="mt-4 px-4 py-2 bg-white/10 border border-white/20 rounded-lg disabled:opacity-50">
+            {loading ? 'Loading...' : 'Load more'}
+          </button>
+        )}
       </div>
     </div>
   );
 };
 
-export default BlogManager;
\ No newline at end of file
+export default BlogManager;
@@ -1,23 +1,16 @@
-import React, { useState, useEffect } from 'react';
-import axios from 'axios';
+import React, { useState } from 'react';
 import { Plus } from 'lucide-react';
+import { usePagedList } from '../../hooks/use-paged-list';
 
-const VideoManager = ({ user }) => {
-  const [videos, setVideos] = useState([]);
-  const API_URL = process.env.REACT_APP_BACKEND_URL || import.meta.env.REACT_APP_BACKEND_URL;
-
-  useEffect(() => {
-    fetchVideos();
-  }, []);
+const SELECT_CLASS = "px-4 py-2 bg-white/10 border border-white/20 rounded-lg text-white focus:outline-none focus:ring-2 focus:ring-purple-500";
 
-  const fetchVideos = async () => {
-    try {
-      const response = await axios.get(`${API_URL}/api/admin/videos`, { withCredentials: true });
-      setVideos(response.data.videos || []);
-    } catch (error) {
-      console.error('Error fetching videos:', error);
-    }
-  };
+const VideoManager = ({ user }) => {
+  // Filtered and sorted server-side; pages load on demand
+  const [isActive, setIsActive] = useState('');
+  const [sort, setSort] = useState('order');
+  const [order, setOrder] = useState('asc');
+  const { items: videos, total, totalEstimated, hasMore, loading, loadMore } =
+    usePagedList('/admin/videos', 'videos', { isActive, sort, order });
 
   return (
     <div>
@@ -28,11 +21,42 @@ const VideoManager = ({ user }) => {
           Add Video
         </button>
       </div>
+      <div className="flex flex-wrap gap-4 mb-6">
+        <select value={isActive} onChange={(e) => setIsActive(e.target.value)} className={SELECT_CLASS}>
+          <option value="" className="bg-gray-900">All videos</option>
+          <option value="true" className="bg-gray-900">Active</option>
+          <option value="false" className="bg-gray-900">Hidden</option>
+        </select>
+        <select value={sort} onChange={(e) => setSort(e.target.value)} className={SELECT_CLASS}>
+          <option value="order" className="bg-gray-900">Display order</option>
+          <option value="createdAt" className="bg-gray-900">Created</option>
+          <option value="title" className="bg-gray-900">Title</option>
+        </select>
+        <select value={order} onChange={(e) => setOrder(e.target.value)} className={SELECT_CLASS}>
+          <option value="asc" className="bg-gray-900">Ascending</option>
+          <option value="desc" className="bg-gray-900">Descending</option>
+        </select>
+      </div>
       <div className="bg-white/10 backdrop-blur-xl rounded-xl p-6 border border-white/20 text-white">
-        <p>Video management coming soon. Currently {videos.length} videos.</p>
+        <p className="mb-4">
+          Video management coming soon. Showing {videos.length} of {totalEstimated ? 'about ' : ''}{total} videos.
+        </p>
+        <ul className="divide-y divide-white/10">
+          {videos.map((video) => (
+            <li key={video.videoId || video._id} className="py-2 flex justify-between">
+              <span>{video.title}</span>
+              <span className="text-white/60 text-sm">{video.duration}</span>
+            </li>
+          ))}
+        </ul>
+        {hasMore && (
+          <button onClick={loadMore} disabled={loading} className="mt-4 px-4 py-2 bg-white/10 border border-white/20 rounded-lg disabled:opacity-50">
+            {loading ? 'Loading...' : 'Load more'}
+          </button>
+        )}
       </div>
     </div>
   );
 };
 
-export default VideoManager;
\ No newline at end of file
+export default VideoManager;
@@ -0,0 +1,80 @@
+import { useState, useEffect, useCallback, useRef } from "react"
+import axios from "axios"
+
+const API_URL = process.env.REACT_APP_BACKEND_URL || 'http://localhost:8000'
+
+// One keyset-paged admin list (see backend/pagination.py). The first page
+// loads on mount and again whenever `params` (filters, sort, order) change;
+// later pages only load when loadMore() is called, continuing from the cursor
+// of the last page instead of fetching the whole collection up front.
+export function usePagedList(path, key, params = {}, pageSize = 50) {
+  const [items, setItems] = useState([])
+  const [total, setTotal] = useState(0)
+  const [totalEstimated, setTotalEstimated] = useState(false)
+  const [cursor, setCursor] = useState(null)
+  const [loading, setLoading] = useState(false)
+  const [error, setError] = useState(null)
+  // Responses to an older query are dropped once the params change
+  const generation = useRef(0)
+  const query = JSON.stringify(params)
+
+  const fetchPage = useCallback(async (after, append) => {
+    const current = generation.current
+    setLoading(true)
+    setError(null)
+    try {
+      const cleaned = Object.fromEntries(
+        Object.entries(JSON.parse(query)).filter(
+          ([, value]) => value !== '' && value !== null && value !== undefined))
+      const response = await axios.get(`${API_URL}/api${path}`, {
+        params: { ...cleaned, limit: pageSize, ...(after ? { cursor: after } : {}) },
+        withCredentials: true
+      })
+      if (current !== generation.current) {
+        return
+      }
+      const rows = response.data[key] || []
+      setItems((previous) => (append ? [...previous, ...rows] : rows))
+      setCursor(response.data.nextCursor || null)
+      setTotal(response.data.total || 0)
+      setTotalEstimated(!!response.data.totalEstimated)
+    } catch (err) {
+      if (current === generation.current) {
+        console.error(`Error fetching ${key}:`, err)
+        setError(err)
+      }
+    } finally {
+      if (current === generation.current) {
+        setLoading(false)
+      }
+    }
+  }, [path, key, query, pageSize])
+
+  useEffect(() => {
+    generation.current += 1
+    setCursor(null)
+    fetchPage(null, false)
+  }, [fetchPage])
+
+  const loadMore = useCallback(() => {
+    if (cursor && !loading) {
+      fetchPage(cursor, true)
+    }
+  }, [cursor, loading, fetchPage])
+
+  const reload = useCallback(() => {
+    generation.current += 1
+    fetchPage(null, false)
+  }, [fetchPage])
+
+  return {
+    items,
+    total,
+    totalEstimated,
+    hasMore: !!cursor,
+    loading,
+    error,
+    loadMore,
+    reload
+  }
+}
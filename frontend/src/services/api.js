@@ -125,7 +125,9 @@ export const testimonialsAPI = {
 
 export const inquiriesAPI = {
   submit: (data) => apiClient.post('/inquiries', data),
-  getAll: () => apiClient.get('/admin/inquiries'),
+  // Paged: pass { status, eventType, limit, cursor }; the next cursor and
+  // totals come back in the X-Next-Cursor / X-Total-Count headers
+  getAll: (params) => apiClient.get('/inquiries', { params }),
   getById: (id) => apiClient.get(`/admin/inquiries/${id}`),
   update: (id, data) => apiClient.put(`/admin/inquiries/${id}`, data),
   delete: (id) => apiClient.delete(`/admin/inquiries/${id}`),
@@ -134,6 +136,8 @@ export const inquiriesAPI = {
 export const blogAPI = {
   getAll: () => apiClient.get('/blog'),
   getById: (id) => apiClient.get(`/blog/${id}`),
+  // Paged admin list: { items in .blogs, nextCursor, total }
+  list: (params) => apiClient.get('/admin/blog', { params }),
   create: (post) => apiClient.post('/admin/blog', post),
   update: (id, post) => apiClient.put(`/admin/blog/${id}`, post),
   delete: (id) => apiClient.delete(`/admin/blog/${id}`),
@@ -141,6 +145,7 @@ export const blogAPI = {
 
 export const videosAPI = {
   getAll: () => apiClient.get('/videos'),
+  list: (params) => apiClient.get('/admin/videos', { params }),
   create: (video) => apiClient.post('/admin/videos', video),
   update: (id, video) => apiClient.put(`/admin/videos/${id}`, video),
   delete: (id) => apiClient.delete(`/admin/videos/${id}`),
@@ -148,6 +153,7 @@ export const videosAPI = {
 
 export const offersAPI = {
   getAll: () => apiClient.get('/offers'),
+  list: (params) => apiClient.get('/admin/offers', { params }),
   create: (offer) => apiClient.post('/admin/offers', offer),
   update: (id, offer) => apiClient.put(`/admin/offers/${id}`, offer),
   delete: (id) => apiClient.delete(`/admin/offers/${id}`),
@@ -0,0 +1,100 @@
+from pathlib import Path
+
+import pytest
+from starlette.requests import Request
+
+from analytics_enrich import GeoIPLookup, client_ip, parse_user_agent
+
+IPHONE = ("Mozilla/5.0 (iPhone; CPU iPhone OS 17_5 like Mac OS X) "
+          "AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.5 Mobile/15E148 "
+          "Safari/604.1")
+IPAD = ("Mozilla/5.0 (iPad; CPU OS 17_5 like Mac OS X) AppleWebKit/605.1.15 "
+        "(KHTML, like Gecko) CriOS/126.0 Mobile/15E148 Safari/604.1")
+ANDROID_PHONE = ("Mozilla/5.0 (Linux; Android 14; Pixel 8) AppleWebKit/537.36 "
+                 "(KHTML, like Gecko) Chrome/126.0 Mobile Safari/537.36")
+ANDROID_TABLET = ("Mozilla/5.0 (Linux; Android 13; SM-X700) "
+                  "AppleWebKit/537.36 (KHTML, like Gecko) "
+                  "SamsungBrowser/25.0 Chrome/121.0 Safari/537.36")
+WINDOWS_EDGE = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+                "(KHTML, like Gecko) Chrome/126.0 Safari/537.36 Edg/126.0")
+MAC_FIREFOX = ("Mozilla/5.0 (Macintosh; Intel Mac OS X 14.5; rv:127.0) "
+               "Gecko/20100101 Firefox/127.0")
+
+
+@pytest.mark.parametrize("user_agent, expected", [
+    (IPHONE, ("mobile", "iOS", "Safari")),
+    (IPAD, ("tablet", "iOS", "Chrome")),
+    (ANDROID_PHONE, ("mobile", "Android", "Chrome")),
+    (ANDROID_TABLET, ("tablet", "Android", "Samsung Internet")),
+    (WINDOWS_EDGE, ("desktop", "Windows", "Edge")),
+    (MAC_FIREFOX, ("desktop", "macOS", "Firefox")),
+    ("SomethingElse/1.0", ("desktop", "other", "other")),
+])
+def test_parse_user_agent(user_agent, expected):
+    device = parse_user_agent(user_agent)
+    assert (device["class"], device["os"], device["browser"]) == expected
+
+
+def request(headers, client=("10.0.0.1", 1234)):
+    return Request({
+        "type": "http",
+        "headers": [(k.encode(), v.encode()) for k, v in headers.items()],
+        "client": client
+    })
+
+
+def test_client_ip_prefers_forwarded_for():
+    assert client_ip(request({"x-forwarded-for": "203.0.113.5, 10.0.0.2"
+                              })) == "203.0.113.5"
+    assert client_ip(request({})) == "10.0.0.1"
+    assert client_ip(request({}, client=None)) is None
+
+
+def test_geoip_without_database_is_disabled(tmp_path):
+    lookup = GeoIPLookup(tmp_path / "missing.mmdb")
+    assert lookup.lookup("8.8.8.8") is None
+    lookup.close()
+
+
+FIXTURE = Path(__file__).parent / "data" / "GeoIP2-City-Test.mmdb"
+
+
+def copy_fixture(tmp_path):
+    # IPv4 City-style test database: 81.2.69.0/24 London, 175.16.199.0/24
+    # Changchun, 2.125.160.0/24 with a country only
+    path = tmp_path / "GeoLite2-City.mmdb"
+    path.write_bytes(FIXTURE.read_bytes())
+    return path
+
+
+def test_geoip_lookup_reads_the_database(tmp_path):
+    lookup = GeoIPLookup(copy_fixture(tmp_path))
+    assert lookup.lookup("81.2.69.160") == {
+        "country": "GB",
+        "countryName": "United Kingdom",
+        "region": "England",
+        "city": "London"
+    }
+    assert lookup.lookup("2.125.160.216") == {
+        "country": "GB",
+        "countryName": "United Kingdom",
+        "region": None,
+        "city": None
+    }
+    assert lookup.lookup("8.8.8.8") is None
+    assert lookup.lookup("10.0.0.1") is None
+    assert lookup.lookup("not an ip") is None
+    lookup.close()
+
+
+def test_geoip_cache_is_per_instance_and_cleared_on_close(tmp_path):
+    path = copy_fixture(tmp_path)
+    lookup = GeoIPLookup(path)
+    other = GeoIPLookup(tmp_path / "missing.mmdb")
+    assert lookup.lookup("81.2.69.160")["city"] == "London"
+    assert other.lookup("81.2.69.160") is None
+
+    # A reloaded database is read again instead of served from the cache
+    lookup.close()
+    path.unlink()
+    assert lookup.lookup("81.2.69.160") is None
@@ -0,0 +1,68 @@
+import pytest
+
+import analytics_filter
+from analytics_filter import (_parse_sample_rates, _sample_point,
+                              classify_event, is_bot, session_weight)
+
+BROWSER = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+           "(KHTML, like Gecko) Chrome/126.0 Safari/537.36")
+
+
+@pytest.fixture
+def rates(monkeypatch):
+    rates = {"page_view": 0.25, "click": 0.5, "scroll": 0.0}
+    monkeypatch.setattr(analytics_filter, "SAMPLE_RATES", rates)
+    return rates
+
+
+def test_parse_sample_rates():
+    assert _parse_sample_rates("page_view=0.25, click=2,bad=x,junk") == {
+        "page_view": 0.25,
+        "click": 1.0
+    }
+
+
+def test_is_bot():
+    assert is_bot(None) and is_bot("")
+    assert is_bot("Mozilla/5.0 (compatible; Googlebot/2.1)")
+    assert is_bot("curl/8.4.0")
+    assert not is_bot(BROWSER)
+
+
+def test_bots_are_dropped_or_tagged(monkeypatch):
+    assert classify_event("page_view", "Googlebot").keep is False
+    monkeypatch.setattr(analytics_filter, "BOT_MODE", "tag")
+    decision = classify_event("page_view", "Googlebot")
+    assert decision.keep and decision.is_bot and decision.weight == 1.0
+
+
+def test_sample_weights(rates):
+    assert classify_event("other", BROWSER, "s").weight == 1.0
+    assert classify_event("scroll", BROWSER, "s").keep is False
+    kept = [
+        classify_event("page_view", BROWSER, f"s{i}") for i in range(4000)
+    ]
+    kept = [decision for decision in kept if decision.keep]
+    assert all(decision.weight == 4.0 for decision in kept)
+    # Weighted total stays close to the real count
+    assert abs(sum(decision.weight for decision in kept) - 4000) < 400
+
+
+def test_sessions_are_sampled_as_a_whole(rates):
+    for i in range(500):
+        session = f"session-{i}"
+        assert _sample_point(session) == _sample_point(session)
+        page_view = classify_event("page_view", BROWSER, session).keep
+        click = classify_event("click", BROWSER, session).keep
+        # Kept at the lower rate implies kept at the higher one
+        assert not page_view or click
+
+
+def test_session_weight_uses_the_lowest_rate(rates):
+    weights = {
+        session_weight(f"s{i}", ["page_view", "click"])
+        for i in range(200)
+    }
+    assert weights == {0.0, 4.0}
+    assert session_weight("s", ["other"]) == 1.0
+    assert session_weight("s", ["click", "scroll"]) == 0.0
@@ -0,0 +1,89 @@
+import asyncio
+
+from mongomock_motor import AsyncMongoMockClient
+
+import analytics_filter
+from analytics_filter import session_weight
+from analytics_funnel import (FUNNEL_STEPS, _step_summary, record_funnel_step,
+                              get_funnel_report)
+
+
+def test_step_summary_conversions():
+    summary = _step_summary({"page_view": 200, "click": 50, "inquiry": 5})
+    assert [step["step"] for step in summary] == FUNNEL_STEPS
+    assert [step["count"] for step in summary] == [200, 50, 5]
+    assert summary[0]["conversionFromPrevious"] is None
+    assert summary[1]["conversionFromPrevious"] == 0.25
+    assert summary[2]["conversionFromPrevious"] == 0.1
+    assert summary[2]["conversionFromStart"] == 0.025
+
+
+def test_step_summary_without_traffic():
+    summary = _step_summary({})
+    assert all(step["count"] == 0 for step in summary)
+    assert all(step["conversionFromStart"] is None for step in summary)
+
+
+def run_sessions(events):
+
+    async def run():
+        db = AsyncMongoMockClient()["test"]
+        for session_id, step, page, weight in events:
+            await record_funnel_step(db, session_id, step, page, weight)
+        return await get_funnel_report(db, days=1)
+
+    return asyncio.run(run())
+
+
+def counts(steps):
+    return {step["step"]: step["count"] for step in steps}
+
+
+def test_sessions_count_once_per_step_and_fill_skipped_steps():
+    report = run_sessions([
+        ("a", "page_view", "/", 1),
+        ("a", "page_view", "/about", 1),  # repeat: not counted again
+        ("a", "click", "/about", 1),
+        ("a", "click", "/", 1),
+        ("b", "page_view", "/pricing", 1),
+        # Straight to an inquiry: counts for the earlier steps too
+        ("c", "inquiry", "/contact", 1),
+        ("c", "page_view", "/", 1),
+        (None, "page_view", "/", 1),
+        ("d", "unknown_step", "/", 1),
+    ])
+    assert counts(report["steps"]) == {"page_view": 3, "click": 2, "inquiry": 1}
+    by_page = {
+        page["entryPage"]: counts(page["steps"])
+        for page in report["byEntryPage"]
+    }
+    # Sessions stay attributed to the page they were first seen on
+    assert by_page["/"] == {"page_view": 1, "click": 1, "inquiry": 0}
+    assert by_page["/contact"] == {"page_view": 1, "click": 1, "inquiry": 1}
+    assert len(report["byDay"]) == 1
+
+
+def test_sampled_sessions_are_weighted():
+    report = run_sessions([("a", "page_view", "/", 4), ("a", "click", "/", 4)])
+    assert counts(report["steps"]) == {"page_view": 4, "click": 4, "inquiry": 0}
+
+
+def test_mixed_sample_rates_keep_the_funnel_narrowing(monkeypatch):
+    monkeypatch.setattr(analytics_filter, "SAMPLE_RATES", {
+        "page_view": 0.5,
+        "click": 1.0
+    })
+    events = []
+    for i in range(400):
+        session = f"s{i}"
+        weight = session_weight(session, FUNNEL_STEPS)
+        if weight:
+            # Every session clicks; a few also send an inquiry
+            events.append((session, "click", "/", weight))
+            if i % 4 == 0:
+                events.append((session, "inquiry", "/", weight))
+    report = run_sessions(events)
+    steps = [step["count"] for step in report["steps"]]
+    assert steps == sorted(steps, reverse=True)
+    assert steps[0] == steps[1]
+    assert abs(steps[0] - 400) < 80
@@ -0,0 +1,79 @@
+import asyncio
+
+import numpy as np
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from analytics_heatmap import (HEATMAP_COLS, HEATMAP_ROWS, MAX_PAGE_LENGTH,
+                               HeatmapAggregator, bin_clicks, viewport_class,
+                               get_heatmap)
+
+
+def test_viewport_class():
+    assert viewport_class(None) == "desktop"
+    assert viewport_class(375) == "mobile"
+    assert viewport_class(768) == "tablet"
+    assert viewport_class(1440) == "desktop"
+
+
+def test_bin_clicks_cells_and_clamping():
+    points = np.array([[0.0, 0.0], [0.999, 0.999], [1.0, 1.0], [0.5, 0.25]])
+    grid = bin_clicks(points, weights=np.array([1.0, 1.0, 2.0, 3.0]))
+    grid = grid.reshape(HEATMAP_ROWS, HEATMAP_COLS)
+    assert grid.dtype == np.uint32 and grid.sum() == 7
+    assert grid[0, 0] == 1
+    # 1.0 lands on the last cell, like 0.999
+    assert grid[-1, -1] == 3
+    assert grid[HEATMAP_ROWS // 4, HEATMAP_COLS // 2] == 3
+
+
+@pytest.mark.parametrize("page, data", [
+    (None, {"x": 0.5, "y": 0.5}),
+    ("", {"x": 0.5, "y": 0.5}),
+    (["/"], {"x": 0.5, "y": 0.5}),
+    ("/" * (MAX_PAGE_LENGTH + 1), {"x": 0.5, "y": 0.5}),
+    ("/", None),
+    ("/", {"x": "left", "y": 0.5}),
+    ("/", {"x": 1.5, "y": 0.5}),
+    ("/", {"x": float("nan"), "y": 0.5}),
+    ("/", {"x": 900, "y": 10, "viewportWidth": 800, "pageHeight": 2000}),
+])
+def test_add_click_rejects_bad_input(page, data):
+    aggregator = HeatmapAggregator()
+    assert aggregator.add_click(page, data) is False
+    assert not aggregator._buffer
+
+
+@pytest.mark.parametrize("viewport, expected", [
+    ("tablet", "tablet"),
+    ("watch", "mobile"),
+    ({"$ne": 1}, "mobile"),
+    (None, "mobile"),
+])
+def test_add_click_viewport_names(viewport, expected):
+    aggregator = HeatmapAggregator()
+    assert aggregator.add_click("/", {
+        "x": 100,
+        "y": 50,
+        "viewportWidth": 400,
+        "pageHeight": 1000,
+        "viewport": viewport
+    })
+    assert list(aggregator._buffer) == [("/", expected)]
+    assert aggregator._buffer[("/", expected)] == [(0.25, 0.05, 1)]
+
+
+def test_flush_merges_into_stored_grid():
+
+    async def run():
+        db = AsyncMongoMockClient()["test"]
+        aggregator = HeatmapAggregator()
+        aggregator._db = db
+        for _ in range(2):
+            aggregator.add_click("/", {"x": 0.1, "y": 0.1}, weight=2)
+            await aggregator.flush()
+        return await get_heatmap(db, "/", "desktop")
+
+    heatmap = asyncio.run(run())
+    assert heatmap["total"] == 4 and heatmap["max"] == 4
+    assert heatmap["counts"][HEATMAP_ROWS // 10][HEATMAP_COLS // 10] == 4
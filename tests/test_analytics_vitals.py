@@ -0,0 +1,74 @@
+import asyncio
+import random
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from analytics_vitals import (DDSketch, RELATIVE_ACCURACY, record_vital,
+                              get_vitals_report)
+
+
+def test_quantiles_within_relative_accuracy():
+    rng = random.Random(7)
+    values = sorted(rng.lognormvariate(7, 1) for _ in range(5000))
+    sketch = DDSketch()
+    for value in values:
+        sketch.add(value)
+    for q in (0.5, 0.75, 0.95):
+        exact = values[int(q * (len(values) - 1))]
+        assert abs(sketch.quantile(q) - exact) <= exact * RELATIVE_ACCURACY
+
+
+def test_zero_bucket_and_empty_sketch():
+    sketch = DDSketch()
+    assert sketch.quantile(0.5) is None
+    for value in (0, 0, 0, 0.25):
+        sketch.add(value)
+    assert sketch.zero_count == 3
+    assert sketch.quantile(0.5) == 0.0
+    assert sketch.quantile(1.0) == pytest.approx(0.25, rel=RELATIVE_ACCURACY)
+
+
+def test_merge_doc_matches_single_sketch():
+    combined, first, second = DDSketch(), DDSketch(), DDSketch()
+    for value in range(0, 200):
+        combined.add(value)
+        (first if value % 2 else second).add(value)
+    merged = DDSketch()
+    for part in (first, second):
+        merged.merge_doc({
+            "bins": {str(k): v for k, v in part.bins.items()},
+            "zeroCount": part.zero_count,
+            "count": part.count
+        })
+    assert merged.count == combined.count
+    for q in (0.1, 0.5, 0.9):
+        assert merged.quantile(q) == combined.quantile(q)
+
+
+@pytest.mark.parametrize("data", [
+    None, "LCP", {"name": "LCP"}, {"name": "LCP", "value": "fast"},
+    {"name": "LCP", "value": -1}, {"name": "LCP", "value": float("nan")},
+    {"name": "LCP", "value": "NaN"}, {"name": "LCP", "value": float("inf")},
+    {"name": "XYZ", "value": 10}
+])
+def test_record_vital_rejects_bad_samples(data):
+    # Rejected before the database is touched
+    assert asyncio.run(record_vital(None, "/", data)) is False
+
+
+def test_recorded_samples_reach_the_report():
+
+    async def run():
+        db = AsyncMongoMockClient()["test"]
+        for value in (100, 200, 300):
+            assert await record_vital(db, "/", {"name": "lcp", "value": value})
+        assert await record_vital(db, "/about", {"name": "CLS", "value": 0})
+        return await get_vitals_report(db, days=1)
+
+    report = asyncio.run(run())
+    lcp = report["metrics"]["LCP"]
+    assert lcp["count"] == 3 and lcp["min"] == 100 and lcp["max"] == 300
+    assert lcp["p50"] == pytest.approx(200, rel=RELATIVE_ACCURACY)
+    assert report["metrics"]["CLS"]["p50"] == 0.0
+    assert [page["page"] for page in report["pages"]] == ["/", "/about"]
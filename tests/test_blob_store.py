@@ -0,0 +1,70 @@
+import asyncio
+import hashlib
+import io
+from pathlib import Path
+
+from fastapi import UploadFile
+from mongomock_motor import AsyncMongoMockClient
+
+from blob_store import BlobStore, blob_key, is_blob_path
+from storage import LocalStorage
+
+SHA = hashlib.sha256(b"photo").hexdigest()
+
+
+def test_blob_key():
+    assert blob_key(SHA, "Photo.JPG") == f"blobs/{SHA[:2]}/{SHA[2:4]}/{SHA}.jpg"
+    # Odd extensions are dropped rather than trusted
+    assert blob_key(SHA, "x.j pg").endswith(f"/{SHA}")
+    assert blob_key(SHA, None).endswith(f"/{SHA}")
+
+
+def test_is_blob_path():
+    assert is_blob_path(Path(f"/u/blobs/ab/cd/{SHA}.jpg"))
+    assert not is_blob_path(Path("/u/blobs/ab/cd/photo.jpg"))
+    assert not is_blob_path(Path(f"/u/variants/{SHA}.jpg"))
+
+
+def test_identical_uploads_share_one_blob(tmp_path):
+
+    async def run():
+        db = AsyncMongoMockClient()["test"]
+        store = BlobStore(LocalStorage(tmp_path), tmp_path)
+        first, created = await store.store_upload(
+            db, UploadFile(io.BytesIO(b"photo"), filename="a.jpg"))
+        assert created
+        second, created = await store.store_upload(
+            db, UploadFile(io.BytesIO(b"photo"), filename="b.png"))
+        assert not created
+        assert second["key"] == first["key"]
+        assert second["refCount"] == 2
+
+        await store.release(db, SHA)
+        assert (await db.blobs.find_one({"_id": SHA}))["refCount"] == 1
+        return first
+
+    blob = asyncio.run(run())
+    assert blob["_id"] == SHA
+    assert (tmp_path / blob["key"]).read_bytes() == b"photo"
+    # The duplicate upload was discarded, nothing left in flight
+    assert list((tmp_path / ".incoming").iterdir()) == []
+
+
+def test_acquire_forgets_blobs_whose_file_is_gone(tmp_path):
+
+    async def run():
+        db = AsyncMongoMockClient()["test"]
+        store = BlobStore(LocalStorage(tmp_path), tmp_path)
+        blob, _ = await store.store_upload(
+            db, UploadFile(io.BytesIO(b"photo"), filename="a.jpg"))
+        (tmp_path / blob["key"]).unlink()
+        assert await store.acquire(db, SHA) is None
+        assert await store.acquire(db, "not-a-hash") is None
+        # A new upload restores the file under the existing record
+        again, created = await store.store_upload(
+            db, UploadFile(io.BytesIO(b"photo"), filename="a.jpg"))
+        return again, created
+
+    blob, created = asyncio.run(run())
+    assert created
+    assert (tmp_path / blob["key"]).read_bytes() == b"photo"
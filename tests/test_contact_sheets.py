@@ -0,0 +1,111 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from PIL import Image
+
+from contact_sheets import (COLUMNS, EMPTY_TILE, ContactSheets, page_hash,
+                            render_contact_sheet, source_key)
+from image_variants import shutdown_pool
+from storage import LocalStorage
+
+
+def item(item_id, image, variants=()):
+    return {"_id": item_id, "image": image, "variants": list(variants)}
+
+
+def variant(name, width, height, fmt="webp"):
+    return {
+        "url": f"/uploads/variants/x/{name}",
+        "width": width,
+        "height": height,
+        "format": fmt
+    }
+
+
+def test_source_key_picks_smallest_variant_that_fills_the_tile():
+    doc = item("a", "/uploads/blobs/x.jpg", [
+        variant("320w.webp", 320, 213),
+        variant("640w.webp", 640, 427),
+        variant("160w.webp", 160, 107),
+        variant("240w.avif", 240, 160, fmt="avif")
+    ])
+    assert source_key(doc, 160) == "variants/x/320w.webp"
+    assert source_key(doc, 96) == "variants/x/160w.webp"
+    assert source_key(item("b", "/uploads/blobs/y.png"), 96) == "blobs/y.png"
+    assert source_key(item("c", "https://example.com/z.jpg"), 96) is None
+
+
+def test_page_hash_changes_with_content_and_order():
+    a = item("a", "/uploads/a.jpg")
+    b = item("b", "/uploads/b.jpg")
+    assert page_hash([a, b], 96, "webp") == page_hash([a, b], 96, "webp")
+    assert page_hash([a, b], 96, "webp") != page_hash([b, a], 96, "webp")
+    assert page_hash([a, b], 96, "webp") != page_hash([a, b], 128, "webp")
+    assert page_hash([a, b], 96, "webp") != page_hash([a, b], 96, "jpeg")
+    edited = item("a", "/uploads/a2.jpg")
+    assert page_hash([a, b], 96, "webp") != page_hash([edited, b], 96, "webp")
+
+
+def test_render_places_tiles_row_major_and_blanks_missing(tmp_path):
+    colors = [(255, 0, 0), (0, 255, 0), (0, 0, 255)]
+    sources = []
+    for index, rgb in enumerate(colors):
+        path = tmp_path / f"{index}.png"
+        Image.new("RGB", (200, 100), rgb).save(path)
+        sources.append(str(path))
+    sources.insert(1, None)
+    sources.append(str(tmp_path / "unreadable.png"))
+    dest = tmp_path / "out" / "sheet.jpeg"
+    render_contact_sheet(sources, str(dest), 32, 2, "jpeg")
+
+    with Image.open(dest) as sheet:
+        assert sheet.size == (64, 96)
+
+        def near(x, y, rgb):
+            return all(
+                abs(a - b) < 30 for a, b in zip(sheet.getpixel((x, y)), rgb))
+
+        assert near(16, 16, colors[0])
+        assert near(48, 16, EMPTY_TILE)
+        assert near(16, 48, colors[1])
+        assert near(48, 48, colors[2])
+        assert near(16, 80, EMPTY_TILE)
+
+
+def test_validate_rejects_unknown_sizes_and_formats():
+    ContactSheets.validate(96, "webp")
+    with pytest.raises(HTTPException):
+        ContactSheets.validate(100, "webp")
+    with pytest.raises(HTTPException):
+        ContactSheets.validate(96, "png")
+
+
+def test_build_maps_tiles_and_reuses_cached_sheets(tmp_path):
+    store = tmp_path / "store"
+    (store / "blobs").mkdir(parents=True)
+    Image.new("RGB", (300, 200), (200, 40, 40)).save(store / "blobs" / "a.png")
+    items = [item(f"id{index}", "/uploads/blobs/a.png") for index in range(12)]
+    items.append(item("ext", "https://example.com/z.jpg"))
+
+    async def run():
+        sheets = ContactSheets(LocalStorage(store), tmp_path / "cache")
+        try:
+            first = await sheets.build(items, 64, "webp")
+            again = await sheets.build(items, 64, "webp")
+        finally:
+            shutdown_pool()
+        return sheets, first, again
+
+    sheets, first, again = asyncio.run(run())
+    assert again == first
+    assert first["sheets"] == [{
+        "url": f"/img/sheets/{first['hash']}-0.webp",
+        "width": COLUMNS * 64,
+        "height": 2 * 64
+    }]
+    tile = first["tiles"][11]
+    assert (tile["id"], tile["x"], tile["y"]) == ("id11", 64, 64)
+    assert first["tiles"][-1]["missing"]
+    assert not tile["missing"]
+    assert (sheets.root / f"{first['hash']}-0.webp").exists()
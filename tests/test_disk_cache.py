@@ -0,0 +1,84 @@
+import asyncio
+import os
+import time
+
+import pytest
+
+from disk_cache import DiskCache, scan_and_evict
+
+
+def test_scan_and_evict_removes_least_recently_used(tmp_path):
+    now = time.time()
+    for index in range(10):
+        path = tmp_path / "ab" / f"{index}.webp"
+        path.parent.mkdir(exist_ok=True)
+        path.write_bytes(b"x" * 100)
+        os.utime(path, (now - 100 + index, now - 100 + index))
+    (tmp_path / "ab" / ".partial").write_bytes(b"x" * 1000)
+
+    assert scan_and_evict(tmp_path, 2000) == 1000
+    # Down to 90% of the budget, oldest first
+    assert scan_and_evict(tmp_path, 500) == 400
+    assert sorted(os.listdir(tmp_path / "ab")) == [
+        ".partial", "6.webp", "7.webp", "8.webp", "9.webp"
+    ]
+
+
+def test_concurrent_requests_share_one_rendering(tmp_path):
+    renders = []
+
+    async def render(dest):
+        renders.append(dest.name)
+        await asyncio.sleep(0.05)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        dest.write_bytes(b"x" * 10)
+
+    async def run():
+        cache = DiskCache(tmp_path, 1000)
+        await asyncio.gather(*(cache.ensure("a.webp", render)
+                               for _ in range(5)))
+        await cache.ensure("a.webp", render)
+        await cache.ensure("b.webp", render)
+
+    asyncio.run(run())
+    assert renders == ["a.webp", "b.webp"]
+
+
+def test_failed_rendering_reaches_every_waiter_and_is_retried(tmp_path):
+    attempts = []
+
+    async def broken(dest):
+        attempts.append(dest.name)
+        await asyncio.sleep(0.01)
+        raise ValueError("bad image")
+
+    async def run():
+        cache = DiskCache(tmp_path, 1000)
+        results = await asyncio.gather(*(cache.ensure("a.webp", broken)
+                                         for _ in range(3)),
+                                       return_exceptions=True)
+        assert all(isinstance(result, ValueError) for result in results)
+        with pytest.raises(ValueError):
+            await cache.ensure("a.webp", broken)
+
+    asyncio.run(run())
+    assert len(attempts) == 2
+
+
+def test_budget_evicts_oldest_entries(tmp_path):
+
+    async def render(dest):
+        dest.write_bytes(b"x" * 100)
+
+    async def run():
+        cache = DiskCache(tmp_path, 250)
+        for index in range(5):
+            await cache.ensure(f"{index}.webp", render)
+            path = tmp_path / f"{index}.webp"
+            os.utime(path, (time.time() - 100 + index, ) * 2)
+        return cache.used
+
+    used = asyncio.run(run())
+    assert used <= 250
+    assert sorted(os.listdir(tmp_path))[-1] == "4.webp"
+    assert "0.webp" not in os.listdir(tmp_path)
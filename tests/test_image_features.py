@@ -0,0 +1,138 @@
+import asyncio
+
+import numpy as np
+from bson import ObjectId
+from mongomock_motor import AsyncMongoMockClient
+from PIL import Image
+
+from image_features import (FEATURE_DIM, SimilarityIndex, decode_vector,
+                            feature_vector)
+from image_hashes import NearDuplicateIndex, perceptual_hash
+
+
+def solid(rgb, size=(120, 80)) -> Image.Image:
+    return Image.new("RGB", size, rgb)
+
+
+def vector(image: Image.Image) -> np.ndarray:
+    return decode_vector(feature_vector(image))
+
+
+def test_vectors_are_unit_length_float32():
+    raw = feature_vector(solid((200, 40, 40)))
+    assert len(raw) == FEATURE_DIM * 4
+    assert abs(np.linalg.norm(vector(solid((200, 40, 40)))) - 1) < 1e-5
+
+
+def test_similar_colors_score_higher():
+    red = vector(solid((200, 40, 40)))
+    darker_red = vector(solid((190, 35, 35), size=(300, 200)))
+    blue = vector(solid((40, 40, 200)))
+    assert red @ darker_red > 0.99
+    assert red @ blue < red @ darker_red
+
+
+def test_decode_vector_rejects_other_layouts():
+    assert decode_vector(None) is None
+    assert decode_vector(b"\0" * 16) is None
+    assert decode_vector("not bytes") is None
+
+
+def test_similar_ranks_items_and_skips_same_blob_and_deleted():
+
+    async def run():
+        db = AsyncMongoMockClient()["test"]
+        colors = {
+            "red": (200, 40, 40),
+            "red2": (190, 35, 35),
+            "orange": (220, 120, 30),
+            "blue": (40, 40, 200)
+        }
+        for name, rgb in colors.items():
+            await db.blobs.insert_one({
+                "_id": name,
+                "features": feature_vector(solid(rgb))
+            })
+        items = {}
+        for name in list(colors) + ["red"]:
+            item_id = ObjectId()
+            items.setdefault(name, []).append(str(item_id))
+            await db.portfolio.insert_one({
+                "_id": item_id,
+                "blobId": name,
+                "isActive": True
+            })
+        await db.portfolio.insert_one({
+            "_id": ObjectId(),
+            "blobId": "blue",
+            "isActive": False
+        })
+
+        index = SimilarityIndex()
+        query = items["red"][0]
+        ranked = await index.similar(db, query, 10)
+        # The second upload of the same file is not a recommendation
+        assert [item_id for item_id, _ in ranked
+                ] == [items["red2"][0], items["orange"][0], items["blue"][0]]
+        assert ranked[0][1] > ranked[-1][1]
+        assert len(await index.similar(db, query, 1)) == 1
+
+        index.discard(items["red2"][0])
+        ranked = await index.similar(db, query, 10)
+        assert items["red2"][0] not in [item_id for item_id, _ in ranked]
+        assert await index.similar(db, "missing", 10) == []
+
+    asyncio.run(run())
+
+
+def test_add_blob_appends_new_items():
+
+    async def run():
+        db = AsyncMongoMockClient()["test"]
+        index = SimilarityIndex()
+        await index.ensure_loaded(db)
+        ids = []
+        for name, rgb in (("a", (200, 40, 40)), ("b", (195, 45, 40))):
+            blob = {"_id": name, "features": feature_vector(solid(rgb))}
+            item_id = ObjectId()
+            ids.append(str(item_id))
+            await db.portfolio.insert_one({
+                "_id": item_id,
+                "blobId": name,
+                "isActive": True
+            })
+            await index.add_blob(db, blob)
+        ranked = await index.similar(db, ids[0], 5)
+        assert [item_id for item_id, _ in ranked] == [ids[1]]
+
+    asyncio.run(run())
+
+
+def test_both_photo_indexes_cover_the_same_items():
+
+    async def run():
+        db = AsyncMongoMockClient()["test"]
+        image = solid((200, 40, 40))
+        await db.blobs.insert_one({
+            "_id": "a",
+            "features": feature_vector(image)
+        })
+        ids = {}
+        for name, active in (("active", {"isActive": True}),
+                             ("unset", {}), ("hidden", {"isActive": False})):
+            item_id = ObjectId()
+            ids[name] = str(item_id)
+            await db.portfolio.insert_one({
+                "_id": item_id,
+                "blobId": "a",
+                "perceptualHash": perceptual_hash(image),
+                **active
+            })
+        duplicates = NearDuplicateIndex()
+        await duplicates.ensure_loaded(db)
+        similar = SimilarityIndex()
+        await similar.ensure_loaded(db)
+        return ids, set(duplicates._hashes), set(similar._rows)
+
+    ids, duplicates, similar = asyncio.run(run())
+    assert duplicates == similar == {ids["active"], ids["unset"]}
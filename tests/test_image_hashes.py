@@ -0,0 +1,92 @@
+import asyncio
+import random
+
+import numpy as np
+from bson import ObjectId
+from mongomock_motor import AsyncMongoMockClient
+from PIL import Image, ImageFilter
+
+from image_hashes import (BKTree, NearDuplicateIndex, hamming,
+                          perceptual_hash)
+
+
+def scene(seed: int, size=(320, 240)) -> Image.Image:
+    rng = np.random.default_rng(seed)
+    coarse = rng.integers(0, 256, (6, 8, 3), dtype=np.uint8)
+    return Image.fromarray(coarse).resize(size, Image.BICUBIC)
+
+
+def distance(a, b) -> int:
+    return hamming(int(a["phash"], 16), int(b["phash"], 16))
+
+
+def test_hashes_are_64_bit_hex():
+    value = perceptual_hash(scene(1))
+    assert set(value) == {"phash", "dhash"}
+    for digest in value.values():
+        assert len(digest) == 16
+        int(digest, 16)
+
+
+def test_phash_survives_resizing_blur_and_reencoding():
+    original = scene(1)
+    base = perceptual_hash(original)
+    edited = original.resize((160, 120)).filter(ImageFilter.GaussianBlur(1))
+    assert distance(base, perceptual_hash(edited)) <= 6
+    assert distance(base, perceptual_hash(scene(2))) > 12
+
+
+def test_bktree_search_matches_brute_force():
+    rng = random.Random(7)
+    values = [rng.getrandbits(64) for _ in range(300)]
+    # Near copies of a few values, and an exact repeat
+    values += [value ^ (1 << rng.randrange(64)) for value in values[:20]]
+    tree = BKTree()
+    for index, value in enumerate(values):
+        tree.add(value, str(index))
+    tree.add(values[0], "repeat")
+
+    for target in values[:10] + [rng.getrandbits(64)]:
+        expected = {(hamming(target, value), str(index))
+                    for index, value in enumerate(values)
+                    if hamming(target, value) <= 12}
+        if hamming(target, values[0]) <= 12:
+            expected.add((hamming(target, values[0]), "repeat"))
+        found = {(dist, item_id)
+                 for dist, _, ids in tree.search(target, 12)
+                 for item_id in ids}
+        assert found == expected
+
+
+def test_empty_tree_finds_nothing():
+    assert BKTree().search(0, 64) == []
+
+
+def test_index_flags_and_groups_near_duplicates():
+
+    async def run():
+        db = AsyncMongoMockClient()["test"]
+        original = perceptual_hash(scene(1))
+        copy = perceptual_hash(scene(1).resize((200, 150)))
+        other = perceptual_hash(scene(2))
+        items = [{
+            "_id": ObjectId(),
+            "perceptualHash": value
+        } for value in (original, copy, other)]
+        await db.portfolio.insert_many(items)
+
+        index = NearDuplicateIndex()
+        await index.ensure_loaded(db)
+        matches = index.lookup(original, exclude={str(items[0]["_id"])})
+        assert [match["id"] for match in matches] == [str(items[1]["_id"])]
+
+        groups = await index.groups(db)
+        assert len(groups) == 1
+        assert {member["id"] for member in groups[0]} == {
+            str(items[0]["_id"]), str(items[1]["_id"])
+        }
+
+        index.discard(str(items[1]["_id"]))
+        assert index.lookup(original, exclude={str(items[0]["_id"])}) == []
+
+    asyncio.run(run())
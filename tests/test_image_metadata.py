@@ -0,0 +1,70 @@
+from datetime import datetime
+
+import pytest
+from PIL import Image
+
+from image_metadata import (TAG_DATETIME_ORIGINAL, TAG_EXIF_IFD, TAG_F_NUMBER,
+                            TAG_ISO, TAG_LENS_MODEL, TAG_MAKE, TAG_MODEL,
+                            TAG_ORIENTATION, camera_name, color_family,
+                            describe_image, layout_orientation, read_exif)
+
+
+def test_camera_name():
+    assert camera_name("Canon", "Canon EOS R5") == "Canon EOS R5"
+    assert camera_name("NIKON CORPORATION", "NIKON Z 6") == "NIKON Z 6"
+    assert camera_name("FUJIFILM", "X-T4") == "FUJIFILM X-T4"
+    assert camera_name(None, None) is None
+
+
+@pytest.mark.parametrize("size, expected", [((1200, 800), "landscape"),
+                                            ((800, 1200), "portrait"),
+                                            ((1000, 990), "square")])
+def test_layout_orientation(size, expected):
+    assert layout_orientation(*size) == expected
+
+
+@pytest.mark.parametrize("rgb, family", [((10, 10, 10), "black"),
+                                         ((240, 240, 240), "white"),
+                                         ((128, 128, 128), "gray"),
+                                         ((220, 30, 30), "red"),
+                                         ((120, 70, 20), "brown"),
+                                         ((30, 160, 40), "green"),
+                                         ((30, 60, 200), "blue")])
+def test_color_family(rgb, family):
+    assert color_family(rgb) == family
+
+
+def test_read_exif(tmp_path):
+    exif = Image.Exif()
+    exif[TAG_MAKE] = "Canon"
+    exif[TAG_MODEL] = "Canon EOS R5\x00"
+    exif[TAG_ORIENTATION] = 6
+    details = exif.get_ifd(TAG_EXIF_IFD)
+    details[TAG_ISO] = 400
+    details[TAG_F_NUMBER] = 2.8
+    details[TAG_LENS_MODEL] = "RF24-70mm F2.8"
+    details[TAG_DATETIME_ORIGINAL] = "2024:05:01 18:30:00"
+    path = tmp_path / "photo.jpg"
+    Image.new("RGB", (60, 40)).save(path, exif=exif)
+    with Image.open(path) as image:
+        fields = read_exif(image)
+    assert fields == {
+        "exifOrientation": 6,
+        "camera": "Canon EOS R5",
+        "lens": "RF24-70mm F2.8",
+        "capturedAt": datetime(2024, 5, 1, 18, 30),
+        "iso": 400,
+        "fNumber": 2.8
+    }
+
+
+def test_describe_image_dominant_colors():
+    image = Image.new("RGB", (100, 100), (30, 60, 200))
+    image.paste((240, 240, 240), (0, 0, 100, 30))
+    metadata = describe_image(image, {"iso": 100})
+    assert metadata["iso"] == 100
+    assert metadata["orientation"] == "square"
+    assert metadata["colorFamily"] == "blue"
+    shares = [color["share"] for color in metadata["colors"]]
+    assert shares == sorted(shares, reverse=True)
+    assert metadata["colors"][1]["family"] == "white"
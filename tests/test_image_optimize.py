@@ -0,0 +1,81 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from image_optimize import (ORIENTATION_TAG, strip_jpeg_metadata,
+                            optimize_file, _pixels)
+
+
+def noisy_image(mode="RGB", size=(64, 48)):
+    rng = np.random.default_rng(3)
+    channels = len(mode)
+    array = rng.integers(0, 256, (size[1], size[0], channels), dtype=np.uint8)
+    return Image.fromarray(array.squeeze()).convert(mode)
+
+
+def jpeg_with_metadata(orientation=6) -> bytes:
+    exif = Image.Exif()
+    exif[ORIENTATION_TAG] = orientation
+    exif[0x010F] = "Camera Maker"
+    buffer = io.BytesIO()
+    noisy_image().save(buffer,
+                       "JPEG",
+                       quality=90,
+                       exif=exif.tobytes(),
+                       icc_profile=b"\0" * 128,
+                       comment=b"hello")
+    # Trailing data after EOI, like MPF pages or vendor trailers
+    return buffer.getvalue() + b"TRAILER"
+
+
+def test_strip_jpeg_metadata_keeps_pixels_orientation_and_icc():
+    data = jpeg_with_metadata()
+    stripped = strip_jpeg_metadata(data, 6)
+    assert len(stripped) < len(data)
+    assert b"Camera Maker" not in stripped and b"hello" not in stripped
+    assert not stripped.endswith(b"TRAILER")
+    assert _pixels(stripped) == _pixels(data)
+    with Image.open(io.BytesIO(stripped)) as image:
+        assert image.getexif()[ORIENTATION_TAG] == 6
+        assert 0x010F not in image.getexif()
+        assert image.info["icc_profile"] == b"\0" * 128
+
+
+def test_strip_jpeg_metadata_without_orientation():
+    stripped = strip_jpeg_metadata(jpeg_with_metadata(1), 1)
+    with Image.open(io.BytesIO(stripped)) as image:
+        assert not image.getexif()
+
+
+def test_strip_jpeg_metadata_rejects_other_files():
+    with pytest.raises(ValueError):
+        strip_jpeg_metadata(b"\x89PNG\r\n", 1)
+
+
+def test_optimize_png_is_pixel_identical(tmp_path):
+    src, dest = tmp_path / "in.png", tmp_path / "out" / "in.png"
+    # Flat areas compress much better with optimize=True
+    image = Image.new("RGBA", (200, 200), (10, 20, 30, 255))
+    image.paste(noisy_image("RGBA", (40, 40)), (10, 10))
+    image.save(src, compress_level=0)
+    result = optimize_file(str(src), str(dest), strip=True)
+    assert result["status"] == "optimized"
+    assert result["after"] < result["before"]
+    assert _pixels(dest.read_bytes()) == _pixels(src.read_bytes())
+
+
+def test_optimize_jpeg_strip(tmp_path):
+    src, dest = tmp_path / "in.jpg", tmp_path / "out.jpg"
+    src.write_bytes(jpeg_with_metadata())
+    result = optimize_file(str(src), str(dest), strip=True)
+    assert result["status"] == "optimized"
+    assert _pixels(dest.read_bytes()) == _pixels(src.read_bytes())
+
+
+def test_optimize_file_skips_other_formats(tmp_path):
+    src, dest = tmp_path / "in.gif", tmp_path / "out.gif"
+    noisy_image("L").save(src)
+    assert optimize_file(str(src), str(dest), strip=True)["status"] == "skipped"
+    assert not dest.exists()
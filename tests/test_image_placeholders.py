@@ -0,0 +1,33 @@
+import base64
+import io
+
+from PIL import Image
+
+from image_analysis import PLACEHOLDER_WIDTH, analyze_image, render_placeholder
+
+
+def decode(data_uri: str) -> Image.Image:
+    prefix = "data:image/webp;base64,"
+    assert data_uri.startswith(prefix)
+    return Image.open(io.BytesIO(base64.b64decode(data_uri[len(prefix):])))
+
+
+def test_placeholder_is_a_tiny_webp_with_the_aspect_ratio():
+    placeholder = render_placeholder(Image.new("RGBA", (1600, 900),
+                                               (0, 128, 255, 100)))
+    # Small enough to inline in every list response
+    assert len(placeholder) < 400
+    with decode(placeholder) as preview:
+        assert preview.format == "WEBP"
+        assert preview.size == (PLACEHOLDER_WIDTH, 9)
+
+
+def test_analysis_reports_upright_dimensions(tmp_path):
+    src = tmp_path / "portrait.jpg"
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    Image.new("RGB", (300, 200), (250, 20, 20)).save(src, exif=exif.tobytes())
+    result = analyze_image(str(src))
+    assert (result["width"], result["height"]) == (200, 300)
+    with decode(result["placeholder"]) as preview:
+        assert preview.size == (PLACEHOLDER_WIDTH, 24)
@@ -0,0 +1,55 @@
+
+import pytest
+from fastapi import HTTPException
+from PIL import Image
+
+from image_resize import ImageResizer, resize_image
+
+
+@pytest.fixture
+def photo(tmp_path):
+    src = tmp_path / "photo.jpg"
+    Image.new("RGB", (1200, 800), (40, 90, 160)).save(src, quality=90)
+    return src
+
+
+def render(tmp_path, src, w, h, fit, fmt):
+    dest = tmp_path / "out" / f"{w}x{h}.{fmt}"
+    resize_image(str(src), str(dest), w, h, fit, fmt)
+    with Image.open(dest) as image:
+        return image.size, image.format, image.mode
+
+
+def test_contain_keeps_aspect_ratio(tmp_path, photo):
+    assert render(tmp_path, photo, 640, 0, "contain",
+                  "webp") == ((640, 427), "WEBP", "RGB")
+    assert render(tmp_path, photo, 0, 160, "contain",
+                  "jpeg") == ((240, 160), "JPEG", "RGB")
+    # Never upscaled
+    assert render(tmp_path, photo, 2048, 0, "contain",
+                  "png")[0] == (1200, 800)
+
+
+def test_cover_crops_to_the_box(tmp_path, photo):
+    assert render(tmp_path, photo, 256, 256, "cover", "webp")[0] == (256, 256)
+    # A box larger than the image shrinks, keeping its shape
+    assert render(tmp_path, photo, 2048, 1024, "cover",
+                  "webp")[0] == (1200, 600)
+
+
+def test_transparency_flattened_only_for_jpeg(tmp_path):
+    src = tmp_path / "logo.png"
+    Image.new("RGBA", (400, 400), (255, 0, 0, 0)).save(src)
+    assert render(tmp_path, src, 128, 0, "contain", "png")[2] == "RGBA"
+    assert render(tmp_path, src, 128, 0, "contain", "jpeg")[2] == "RGB"
+
+
+@pytest.mark.parametrize("w, h, fit, fmt", [(None, None, "contain", "webp"),
+                                            (123, None, "contain", "webp"),
+                                            (640, None, "stretch", "webp"),
+                                            (640, None, "cover", "webp"),
+                                            (640, None, "contain", "gif")])
+def test_validate_rejects(w, h, fit, fmt):
+    with pytest.raises(HTTPException) as error:
+        ImageResizer.validate(w, h, fit, fmt)
+    assert error.value.status_code == 400
@@ -0,0 +1,38 @@
+from PIL import Image
+
+from image_variants import render_variants, target_widths, upright
+
+
+def test_target_widths():
+    widths = [320, 640, 1024]
+    assert target_widths(800, widths) == [320, 640, 800]
+    assert target_widths(640, widths) == [320, 640]
+    # Larger than every configured width: no upscaled "original" variant
+    assert target_widths(4000, widths) == [320, 640, 1024]
+    assert target_widths(200, widths) == [200]
+
+
+def test_upright_applies_orientation_and_mode():
+    image = Image.new("L", (40, 20))
+    exif = Image.Exif()
+    exif[0x0112] = 6  # rotated 90 degrees clockwise
+    image.info["exif"] = exif.tobytes()
+    result = upright(image)
+    assert result.size == (20, 40)
+    assert result.mode == "RGB"
+    assert upright(Image.new("LA", (4, 4))).mode == "RGBA"
+
+
+def test_render_variants(tmp_path):
+    src = tmp_path / "photo.png"
+    Image.new("RGBA", (900, 600), (200, 100, 50, 128)).save(src)
+    result = render_variants(str(src), str(tmp_path / "out"), [320, 640, 1024],
+                             ["webp"])
+    assert (result["width"], result["height"]) == (900, 600)
+    assert [(v["width"], v["height"], v["name"])
+            for v in result["variants"]] == [(320, 213, "320w.webp"),
+                                             (640, 427, "640w.webp"),
+                                             (900, 600, "900w.webp")]
+    with Image.open(tmp_path / "out" / "640w.webp") as variant:
+        assert variant.size == (640, 427)
+        assert variant.mode == "RGBA"
@@ -0,0 +1,188 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+import job_queue as jq
+from job_queue import JobQueue, job_status
+
+
+async def make_queue(handler=None, max_attempts=3):
+    db = AsyncMongoMockClient()["test"]
+    queue = JobQueue()
+
+    async def ok(db, payload):
+        return {"echo": payload}
+
+    queue.register("demo", handler or ok, max_attempts=max_attempts)
+    await queue.ensure_indexes(db)
+    return db, queue
+
+
+def test_enqueue_rejects_unknown_types():
+
+    async def run():
+        db, queue = await make_queue()
+        with pytest.raises(ValueError):
+            await queue.enqueue(db, "other")
+
+    asyncio.run(run())
+
+
+def test_dedupe_key_returns_the_active_job():
+
+    async def run():
+        db, queue = await make_queue()
+        first = await queue.enqueue(db, "demo", {"n": 1}, dedupe_key="k")
+        again = await queue.enqueue(db, "demo", {"n": 2}, dedupe_key="k")
+        assert again["jobId"] == first["jobId"]
+        other = await queue.enqueue(db, "demo", dedupe_key="other")
+        assert other["jobId"] != first["jobId"]
+
+        # Once finished, the key is free again
+        job = await queue.claim(db)
+        await queue.execute(db, job)
+        fresh = await queue.enqueue(db, "demo", dedupe_key="k")
+        assert fresh["jobId"] != first["jobId"]
+
+    asyncio.run(run())
+
+
+def test_claim_orders_by_priority_then_age_and_skips_delayed():
+
+    async def run():
+        db, queue = await make_queue()
+        low = await queue.enqueue(db, "demo", priority=jq.PRIORITY_LOW)
+        await queue.enqueue(db, "demo", priority=jq.PRIORITY_HIGH,
+                            delay=timedelta(hours=1))
+        normal = await queue.enqueue(db, "demo")
+        claimed = [(await queue.claim(db))["jobId"] for _ in range(2)]
+        assert claimed == [normal["jobId"], low["jobId"]]
+        assert await queue.claim(db) is None
+
+    asyncio.run(run())
+
+
+def test_successful_job_records_result():
+
+    async def run():
+        db, queue = await make_queue()
+        queued = await queue.enqueue(db, "demo", {"n": 1})
+        job = await queue.claim(db)
+        assert job["status"] == "running" and job["attempts"] == 1
+        await queue.execute(db, job)
+        done = await queue.get(db, queued["jobId"])
+        assert done["status"] == "succeeded"
+        assert done["result"] == {"echo": {"n": 1}}
+        assert "activeKey" not in done
+
+    asyncio.run(run())
+
+
+def test_failures_back_off_then_fail():
+
+    async def broken(db, payload):
+        raise RuntimeError("boom")
+
+    async def run():
+        db, queue = await make_queue(broken, max_attempts=2)
+        queued = await queue.enqueue(db, "demo", dedupe_key="k")
+        await queue.execute(db, await queue.claim(db))
+        job = await queue.get(db, queued["jobId"])
+        assert job["status"] == "queued" and job["error"] == "boom"
+        assert job["runAfter"] > datetime.utcnow() + timedelta(seconds=20)
+
+        await db.jobs.update_one({"jobId": job["jobId"]},
+                                 {"$set": {"runAfter": datetime.utcnow()}})
+        await queue.execute(db, await queue.claim(db))
+        job = await queue.get(db, queued["jobId"])
+        assert job["status"] == "failed" and job["attempts"] == 2
+        assert "activeKey" not in job
+
+        assert await queue.retry(db, job["jobId"])
+        job = await queue.get(db, queued["jobId"])
+        assert job["status"] == "queued" and job["attempts"] == 0
+
+    asyncio.run(run())
+
+
+def test_expired_lease_is_reclaimed_and_stale_claims_cannot_write():
+
+    async def run():
+        db, queue = await make_queue()
+        queued = await queue.enqueue(db, "demo")
+        stale = await queue.claim(db)
+        await db.jobs.update_one(
+            {"jobId": stale["jobId"]},
+            {"$set": {"leaseUntil": datetime.utcnow() - timedelta(seconds=1)}})
+        fresh = await queue.claim(db)
+        assert fresh["jobId"] == stale["jobId"]
+        assert fresh["leaseToken"] != stale["leaseToken"]
+
+        await queue.execute(db, stale)
+        assert (await queue.get(db, queued["jobId"]))["status"] == "running"
+        await queue.execute(db, fresh)
+        assert (await queue.get(db, queued["jobId"]))["status"] == "succeeded"
+
+    asyncio.run(run())
+
+
+def test_cancel_only_queued_jobs():
+
+    async def run():
+        db, queue = await make_queue()
+        waiting = await queue.enqueue(db, "demo", delay=timedelta(hours=1))
+        running = await queue.enqueue(db, "demo")
+        await queue.claim(db)
+        assert not await queue.cancel(db, running["jobId"])
+        assert await queue.cancel(db, waiting["jobId"])
+        assert (await queue.get(db, waiting["jobId"]))["status"] == "cancelled"
+
+    asyncio.run(run())
+
+
+def test_job_status_exposes_public_fields_only():
+    job = {
+        "jobId": "j",
+        "type": "demo",
+        "status": "queued",
+        "payload": {"secret": 1},
+        "leaseToken": "t"
+    }
+    status = job_status(job)
+    assert status["jobId"] == "j" and status["result"] is None
+    assert "payload" not in status and "leaseToken" not in status
+
+
+def test_retried_job_is_deduplicated_again():
+
+    async def broken(db, payload):
+        raise RuntimeError("boom")
+
+    async def run():
+        db, queue = await make_queue(broken, max_attempts=1)
+        failed = await queue.enqueue(db, "demo", dedupe_key="k")
+        await queue.execute(db, await queue.claim(db))
+        assert (await queue.get(db, failed["jobId"]))["status"] == "failed"
+
+        assert await queue.retry(db, failed["jobId"])
+        again = await queue.enqueue(db, "demo", dedupe_key="k")
+        assert again["jobId"] == failed["jobId"]
+        assert await db.jobs.count_documents({}) == 1
+
+    asyncio.run(run())
+
+
+def test_retry_refused_while_an_identical_job_is_active():
+
+    async def run():
+        db, queue = await make_queue()
+        first = await queue.enqueue(db, "demo", dedupe_key="k")
+        assert await queue.cancel(db, first["jobId"])
+        second = await queue.enqueue(db, "demo", dedupe_key="k")
+        assert second["jobId"] != first["jobId"]
+        assert not await queue.retry(db, first["jobId"])
+        assert (await queue.get(db, first["jobId"]))["status"] == "cancelled"
+
+    asyncio.run(run())
@@ -0,0 +1,89 @@
+import asyncio
+import base64
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+from mongomock_motor import AsyncMongoMockClient
+
+from pagination import (ListSpec, encode_cursor, decode_cursor, _after,
+                        list_page)
+
+SPEC = ListSpec(sort_fields={
+    "created": "createdAt",
+    "title": "title"
+},
+                filter_fields={"category": "category"},
+                default_sort="created")
+
+
+def raw_cursor(text: str) -> str:
+    return base64.urlsafe_b64encode(text.encode()).decode().rstrip("=")
+
+
+def test_cursor_round_trip_keeps_types():
+    values = [datetime(2024, 5, 1, 12, 30), ObjectId()]
+    assert decode_cursor(encode_cursor(values)) == values
+    assert decode_cursor(encode_cursor([None, "x"])) == [None, "x"]
+
+
+@pytest.mark.parametrize("cursor", [
+    "!!!", "",
+    raw_cursor('[{"$oid": "zz"}, 1]'),
+    raw_cursor('[{"$date": "nope"}, 1]'),
+    raw_cursor('[1, 2, 3]'),
+    raw_cursor('{"a": 1}'),
+    raw_cursor('[{"$gt": ""}, 1]'),
+    base64.urlsafe_b64encode(b"\xff\xfe").decode()
+])
+def test_invalid_cursors_are_400(cursor):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor)
+    assert error.value.status_code == 400
+
+
+def test_after_null_values():
+    # Ascending: nulls come first, so everything non-null follows
+    assert _after("title", 1, None, 5) == {
+        "$or": [{
+            "title": None,
+            "_id": {
+                "$gt": 5
+            }
+        }, {
+            "title": {
+                "$ne": None
+            }
+        }]
+    }
+    # Descending: nulls come last, only other nulls follow
+    assert _after("title", -1, None, 5) == {"title": None, "_id": {"$lt": 5}}
+    assert {"title": None} in _after("title", -1, "b", 5)["$or"]
+    assert _after("_id", 1, 5, 5) == {"_id": {"$gt": 5}}
+
+
+@pytest.mark.parametrize("sort", ["created", "title"])
+@pytest.mark.parametrize("order", ["asc", "desc"])
+def test_pages_cover_every_row_once(sort, order):
+
+    async def walk():
+        collection = AsyncMongoMockClient()["test"]["rows"]
+        await collection.insert_many([{
+            "_id": i,
+            "title": None if i % 4 == 0 else f"t{i % 5}",
+            "createdAt": datetime(2024, 1, 1 + i % 3),
+            "category": "a" if i % 2 else "b"
+        } for i in range(23)])
+        seen, cursor = [], None
+        while True:
+            rows, page = await list_page(collection, SPEC, {}, sort, order, 5,
+                                         cursor)
+            seen += [row["_id"] for row in rows]
+            assert page["total"] == 23
+            cursor = page["nextCursor"]
+            if not cursor:
+                return seen
+
+    seen = asyncio.run(walk())
+    assert sorted(seen) == list(range(23))
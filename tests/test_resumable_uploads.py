@@ -0,0 +1,77 @@
+import asyncio
+import hashlib
+import os
+import time
+
+import pytest
+from fastapi import HTTPException
+from mongomock_motor import AsyncMongoMockClient
+
+from resumable_uploads import ResumableUploads, UPLOAD_TTL
+
+
+class SlowBlobStore:
+    """Records adopted files; slow enough for finalizes to overlap"""
+
+    def __init__(self):
+        self.adopted = []
+
+    async def adopt(self, db, path, sha256, size, filename, content_type):
+        await asyncio.sleep(0.05)
+        self.adopted.append((sha256, size))
+        return {"_id": sha256}, True
+
+
+async def chunks(*parts):
+    for part in parts:
+        yield part
+
+
+def test_upload_and_single_finalize(tmp_path):
+
+    async def run():
+        db = AsyncMongoMockClient()["test"]
+        uploads = ResumableUploads(tmp_path, SlowBlobStore())
+        session = await uploads.create(db, {"size": 6, "filename": "a.mp4"},
+                                       "u1")
+        upload_id = session["uploadId"]
+        with pytest.raises(HTTPException) as error:
+            await uploads.finalize(db, upload_id)
+        assert error.value.status_code == 409
+        assert await uploads.append(db, upload_id, 0, chunks(b"abc")) == 3
+        assert await uploads.append(db, upload_id, 3, chunks(b"def")) == 6
+
+        results = await asyncio.gather(uploads.finalize(db, upload_id),
+                                       uploads.finalize(db, upload_id),
+                                       return_exceptions=True)
+        return uploads, results
+
+    uploads, results = asyncio.run(run())
+    assert uploads.blob_store.adopted == [(hashlib.sha256(b"abcdef").hexdigest(),
+                                           6)]
+    errors = [r for r in results if isinstance(r, HTTPException)]
+    assert len(errors) == 1 and errors[0].status_code == 409
+
+
+def test_collect_garbage_removes_stale_orphans(tmp_path):
+
+    async def run():
+        db = AsyncMongoMockClient()["test"]
+        uploads = ResumableUploads(tmp_path, SlowBlobStore())
+        kept = await uploads.create(db, {"size": 10}, "u1")
+        uploads.partial_dir.mkdir(parents=True, exist_ok=True)
+        orphan = uploads.partial_path("orphan")
+        fresh = uploads.partial_path("fresh")
+        orphan.touch()
+        fresh.touch()
+        old = time.time() - UPLOAD_TTL.total_seconds() - 60
+        os.utime(orphan, (old, old))
+        os.utime(uploads.partial_path(kept["uploadId"]), (old, old))
+        removed = await uploads.collect_garbage(db)
+        return uploads, kept, removed
+
+    uploads, kept, removed = asyncio.run(run())
+    assert removed == 1
+    assert not uploads.partial_path("orphan").exists()
+    assert uploads.partial_path("fresh").exists()
+    assert uploads.partial_path(kept["uploadId"]).exists()
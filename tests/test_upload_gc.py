@@ -0,0 +1,131 @@
+import asyncio
+import os
+from datetime import datetime, timedelta
+
+from mongomock_motor import AsyncMongoMockClient
+
+from storage import LocalStorage
+from upload_gc import UploadGC, blob_id_of, collect_upload_keys, video_dir_of
+
+LIVE = "a" * 64
+DEAD = "b" * 64
+
+
+def test_collect_upload_keys_from_nested_documents():
+    keys = set()
+    collect_upload_keys(
+        {
+            "image": "/uploads/media/a.jpg",
+            "body": '<p><img src="/uploads/media/b.png?v=2"> '
+                    "url('/uploads/media/c.webp')</p>",
+            "gallery": [{"url": "https://cdn.example.com/uploads/media/d.jpg"},
+                        42, None]
+        }, keys)
+    assert keys == {
+        "media/a.jpg", "media/b.png", "media/c.webp", "media/d.jpg"
+    }
+
+
+def test_blob_id_of():
+    assert blob_id_of(f"blobs/aa/aa/{LIVE}.jpg") == LIVE
+    assert blob_id_of(f"variants/{LIVE}/640w.webp") == LIVE
+    assert blob_id_of(f"variants/{LIVE}") is None
+    assert blob_id_of("blobs/aa/aa/photo.jpg") is None
+    assert blob_id_of("media/photo.jpg") is None
+
+
+def test_run_deletes_only_old_unreferenced_files(tmp_path):
+    old = datetime.now().timestamp() - 7 * 24 * 3600
+    files = {
+        f"blobs/aa/aa/{LIVE}.jpg": old,
+        f"variants/{LIVE}/640w.webp": old,
+        f"blobs/bb/bb/{DEAD}.jpg": old,
+        f"variants/{DEAD}/640w.webp": old,
+        "media/linked.jpg": old,
+        "media/orphan.jpg": old,
+        "media/new.jpg": None,
+    }
+    for key, mtime in files.items():
+        path = tmp_path / key
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"x" * 10)
+        if mtime:
+            os.utime(path, (mtime, mtime))
+
+    async def run(dry_run):
+        db = AsyncMongoMockClient()["test"]
+        await db.blobs.insert_many([{
+            "_id": LIVE,
+            "key": f"blobs/aa/aa/{LIVE}.jpg",
+            "refCount": 1
+        }, {
+            "_id": DEAD,
+            "key": f"blobs/bb/bb/{DEAD}.jpg",
+            "refCount": 0,
+            "lastReferencedAt": datetime.utcnow() - timedelta(days=30)
+        }])
+        await db.blog.insert_one({"content": "<img src='/uploads/media/linked.jpg'>"})
+        report = await UploadGC(LocalStorage(tmp_path)).run(
+            db, dry_run=dry_run, grace=timedelta(hours=72))
+        return report, await db.blobs.count_documents({})
+
+    report, blobs = asyncio.run(run(dry_run=True))
+    assert report["orphans"] == 3 and report["recent"] == 1
+    assert report["deleted"] == 0 and blobs == 2
+
+    report, blobs = asyncio.run(run(dry_run=False))
+    assert report["deleted"] == 3 and report["blobRecordsRemoved"] == 1
+    assert blobs == 1
+    remaining = {
+        str(path.relative_to(tmp_path))
+        for path in tmp_path.rglob("*") if path.is_file()
+    }
+    assert remaining == {
+        f"blobs/aa/aa/{LIVE}.jpg", f"variants/{LIVE}/640w.webp",
+        "media/linked.jpg", "media/new.jpg"
+    }
+
+
+def test_video_dir_of():
+    assert video_dir_of(f"variants/{LIVE}/video/abc/poster.jpg") == \
+        f"variants/{LIVE}/video/abc"
+    assert video_dir_of(f"variants/{LIVE}/video/poster.jpg") == \
+        f"variants/{LIVE}/video"
+    assert video_dir_of(f"variants/{LIVE}/640w.webp") is None
+
+
+def test_run_removes_video_renderings_the_blob_moved_away_from(tmp_path):
+    old = datetime.now().timestamp() - 7 * 24 * 3600
+    current = f"variants/{LIVE}/video/hls-new"
+    stale = f"variants/{LIVE}/video/hls-old"
+    files = [
+        f"blobs/aa/aa/{LIVE}.mp4", f"{current}/master.m3u8",
+        f"{current}/hls-360p-0000.ts", f"{stale}/master.m3u8",
+        f"{stale}/hls-480p-0000.ts", f"variants/{LIVE}/video/poster.jpg"
+    ]
+    for key in files:
+        path = tmp_path / key
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"x")
+        os.utime(path, (old, old))
+
+    async def run():
+        db = AsyncMongoMockClient()["test"]
+        await db.blobs.insert_one({
+            "_id": LIVE,
+            "key": f"blobs/aa/aa/{LIVE}.mp4",
+            "refCount": 1,
+            "video": {
+                "poster": f"/uploads/variants/{LIVE}/video/poster.jpg",
+                "hls": f"/uploads/{current}/master.m3u8"
+            }
+        })
+        return await UploadGC(LocalStorage(tmp_path)).run(
+            db, dry_run=False, grace=timedelta(hours=72))
+
+    report = asyncio.run(run())
+    assert report["deleted"] == 2
+    assert not (tmp_path / stale).exists() or not any(
+        (tmp_path / stale).iterdir())
+    assert (tmp_path / current / "hls-360p-0000.ts").exists()
+    assert (tmp_path / f"variants/{LIVE}/video/poster.jpg").exists()
@@ -0,0 +1,102 @@
+import hashlib
+import os
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from upload_serving import RangeNotSatisfiable, parse_range, upload_response
+
+DATA = os.urandom(300000)
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, 999)),
+    ("bytes=-100", (900, 999)),
+    ("bytes=-5000", (0, 999)),
+    ("bytes=990-5000", (990, 999)),
+    ("BYTES = 5-6", (5, 6)),
+    ("bytes=0-1,5-6", None),
+    ("bytes=5-1", None),
+    ("bytes=abc", None),
+    ("items=0-1", None),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=-0"])
+def test_parse_range_not_satisfiable(header):
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range(header, 1000)
+
+
+@pytest.fixture
+def client(tmp_path):
+    (tmp_path / "media").mkdir()
+    (tmp_path / "media" / "clip.mp4").write_bytes(DATA)
+    (tmp_path / ".partial").mkdir()
+    (tmp_path / ".partial" / "x").write_bytes(b"secret")
+    app = FastAPI()
+
+    @app.api_route("/uploads/{file_path:path}", methods=["GET", "HEAD"])
+    async def serve(file_path: str, request: Request):
+        return await upload_response(request, tmp_path, file_path)
+
+    return TestClient(app)
+
+
+def test_full_response_headers(client):
+    response = client.get("/uploads/media/clip.mp4")
+    assert response.status_code == 200
+    assert response.content == DATA
+    assert response.headers["content-type"] == "video/mp4"
+    assert response.headers["accept-ranges"] == "bytes"
+    assert response.headers["etag"] == f'"{hashlib.sha256(DATA).hexdigest()}"'
+    assert "immutable" in response.headers["cache-control"]
+
+    head = client.head("/uploads/media/clip.mp4")
+    assert head.headers["content-length"] == str(len(DATA))
+    assert head.content == b""
+
+
+def test_ranges_and_conditionals(client):
+    etag = client.head("/uploads/media/clip.mp4").headers["etag"]
+
+    response = client.get("/uploads/media/clip.mp4",
+                          headers={"range": "bytes=1000-269999"})
+    assert response.status_code == 206
+    assert response.content == DATA[1000:270000]
+    assert response.headers["content-range"] == f"bytes 1000-269999/{len(DATA)}"
+
+    response = client.get("/uploads/media/clip.mp4",
+                          headers={
+                              "range": "bytes=0-9",
+                              "if-range": etag
+                          })
+    assert response.status_code == 206 and response.content == DATA[:10]
+    # A stale If-Range validator gets the whole file
+    response = client.get("/uploads/media/clip.mp4",
+                          headers={
+                              "range": "bytes=0-9",
+                              "if-range": '"old"'
+                          })
+    assert response.status_code == 200 and len(response.content) == len(DATA)
+
+    response = client.get("/uploads/media/clip.mp4",
+                          headers={"range": f"bytes={len(DATA)}-"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(DATA)}"
+
+    response = client.get("/uploads/media/clip.mp4",
+                          headers={"if-none-match": f'"x", W/{etag}'})
+    assert response.status_code == 304
+
+
+@pytest.mark.parametrize("path", [
+    "/uploads/.partial/x", "/uploads/media/missing.mp4", "/uploads/media",
+    "/uploads/media/../../etc/passwd"
+])
+def test_hidden_and_missing_files(client, path):
+    assert client.get(path).status_code == 404
@@ -0,0 +1,35 @@
+import asyncio
+import hashlib
+import io
+import os
+
+import pytest
+from fastapi import HTTPException, UploadFile
+
+from uploads import UPLOAD_CHUNK_SIZE, stream_upload
+
+
+def upload(data: bytes) -> UploadFile:
+    return UploadFile(io.BytesIO(data), filename="photo.jpg")
+
+
+def test_stream_upload_writes_and_hashes(tmp_path):
+    data = os.urandom(UPLOAD_CHUNK_SIZE * 2 + 17)
+    dest = tmp_path / "photo.jpg"
+    result = asyncio.run(stream_upload(upload(data), dest))
+    assert result == {
+        "size": len(data),
+        "sha256": hashlib.sha256(data).hexdigest()
+    }
+    assert dest.read_bytes() == data
+    assert os.listdir(tmp_path) == ["photo.jpg"]
+
+
+def test_stream_upload_over_limit_leaves_nothing(tmp_path):
+    dest = tmp_path / "photo.jpg"
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(
+            stream_upload(upload(b"x" * (UPLOAD_CHUNK_SIZE + 1)), dest,
+                          max_bytes=UPLOAD_CHUNK_SIZE))
+    assert error.value.status_code == 413
+    assert os.listdir(tmp_path) == []
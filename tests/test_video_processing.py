@@ -0,0 +1,66 @@
+import pytest
+
+from video_processing import (VideoProcessor, format_duration, output_id,
+                              valid_hls_heights, video_dirs, video_kbps)
+
+
+@pytest.mark.parametrize("seconds, text", [(0, "0:00"), (59.6, "1:00"),
+                                           (754, "12:34"),
+                                           (3725, "1:02:05")])
+def test_format_duration(seconds, text):
+    assert format_duration(seconds) == text
+
+
+def test_video_kbps_ladder():
+    assert video_kbps(1080) == 5000
+    assert video_kbps(360) < video_kbps(720) < video_kbps(1080)
+
+
+def test_document_fields():
+    video = {
+        "poster": "/p.jpg",
+        "preview": "/p.mp4",
+        "duration": 12.5,
+        "width": 640,
+        "height": 360
+    }
+    fields = VideoProcessor.document_fields(video)
+    assert fields == {
+        "poster": "/p.jpg",
+        "previewUrl": "/p.mp4",
+        "durationSeconds": 12.5,
+        "width": 640,
+        "height": 360
+    }
+    assert VideoProcessor.document_fields({
+        **video, "hls": "/m.m3u8"
+    })["hlsUrl"] == "/m.m3u8"
+
+
+def test_output_id_changes_with_settings():
+    ladder = {"heights": [360, 720]}
+    assert output_id(ladder) == output_id(dict(ladder))
+    assert output_id(ladder) != output_id({"heights": [360]})
+    blob = {"_id": "a" * 64}
+    assert VideoProcessor.prefix(blob, "hls-x") == \
+        f"variants/{'a' * 64}/video/hls-x"
+
+
+def test_video_dirs():
+    base = "/uploads/variants/s/video"
+    assert video_dirs({
+        "poster": f"{base}/d1/poster.jpg",
+        "preview": f"{base}/d1/preview.mp4",
+        "hls": f"{base}/hls-h1/master.m3u8",
+        "hlsRenditions": [{"url": f"{base}/hls-h1/hls-360p.m3u8"}]
+    }) == {"variants/s/video/d1", "variants/s/video/hls-h1"}
+    assert video_dirs(None) == set()
+
+
+@pytest.mark.parametrize("heights, valid", [([360, 720], True), ([144], True),
+                                            ([361], False), ([360, 721], False),
+                                            ([100], False), ([2162], False),
+                                            ([360.0], False), ([True], False),
+                                            ([], False), (720, False)])
+def test_valid_hls_heights(heights, valid):
+    assert valid_hls_heights(heights) is valid
@@ -0,0 +1,132 @@
+import asyncio
+import io
+
+import pytest
+from fastapi import UploadFile
+from mongomock_motor import AsyncMongoMockClient
+from PIL import Image
+from starlette.datastructures import Headers
+from starlette.requests import Request
+
+from blob_store import BlobStore
+from image_resize import ImageResizer
+from image_variants import shutdown_pool
+from storage import LocalStorage
+from upload_serving import CACHE_CONTROL, PRIVATE_CACHE_CONTROL
+from watermark import Watermarker, render_id
+from watermark_overlay import build_mark
+
+CONFIG = {
+    "text": "",
+    "color": "#ffffff",
+    "scale": 0.18,
+    "opacity": 0.5
+}
+STATE = {"config": CONFIG, "hash": "abc"}
+SHA = "a" * 64
+
+
+def portfolio_doc(**fields):
+    return {
+        "title": "x",
+        "image": f"/uploads/blobs/aa/aa/{SHA}.jpg",
+        "blobId": SHA,
+        "sha256": SHA,
+        "variants": [{"url": f"/uploads/variants/{SHA}/800w.webp"}],
+        "srcset": {"image/webp": f"/uploads/variants/{SHA}/800w.webp 800w"},
+        **fields
+    }
+
+
+def test_public_view_without_watermark_is_unchanged():
+    doc = Watermarker.public_view(portfolio_doc(), None)
+    assert doc["blobId"] == SHA
+    assert doc["image"].endswith(".jpg")
+
+
+def test_public_view_uses_rendering_and_hides_hash():
+    rendered = {
+        "hash": "abc",
+        "renderId": render_id("abc", SHA),
+        "image": "/uploads/watermarked/abc/r/1200w.webp",
+        "variants": [],
+        "srcset": {}
+    }
+    doc = Watermarker.public_view(portfolio_doc(watermarked=rendered), STATE)
+    assert doc["image"] == rendered["image"]
+    assert SHA not in repr(doc)
+
+
+def test_public_view_hides_uploads_until_rendered():
+    assert Watermarker.public_view(portfolio_doc(), STATE) is None
+    legacy = {"hash": "old", "image": f"/uploads/watermarked/old/{SHA}/a.webp",
+              "variants": [], "srcset": {}}
+    assert Watermarker.public_view(portfolio_doc(watermarked=legacy),
+                                   STATE) is None
+
+
+def test_public_view_keeps_external_images():
+    doc = Watermarker.public_view(
+        portfolio_doc(image="https://example.com/a.jpg"), STATE)
+    assert doc["image"] == "https://example.com/a.jpg"
+    assert "variants" not in doc and "blobId" not in doc
+
+
+def test_render_id_does_not_contain_blob_hash():
+    assert SHA not in render_id("abc", SHA)
+    assert render_id("abc", SHA) != render_id("abd", SHA)
+
+
+def test_build_mark_requires_text_or_logo():
+    with pytest.raises(ValueError):
+        build_mark(1000, CONFIG, None)
+    logo = Image.new("RGBA", (100, 50), (255, 0, 0, 255))
+    mark = build_mark(1000, {**CONFIG, "text": "Studio"}, logo)
+    assert mark.width == 180
+    assert mark.getchannel("A").getextrema()[1] <= 128
+
+
+def test_clean_resizes_of_protected_blobs_are_never_publicly_cached(tmp_path):
+
+    async def upload(store, db, color):
+        data = io.BytesIO()
+        Image.new("RGB", (400, 300), color).save(data, "PNG")
+        data.seek(0)
+        blob, _ = await store.store_upload(
+            db,
+            UploadFile(data,
+                       filename="photo.png",
+                       headers=Headers({"content-type": "image/png"})))
+        return blob["_id"]
+
+    async def run():
+        db = AsyncMongoMockClient()["test"]
+        store = BlobStore(LocalStorage(tmp_path), tmp_path)
+        resizer = ImageResizer(store, tmp_path)
+        watermarker = Watermarker(store)
+        portfolio = await upload(store, db, (200, 40, 40))
+        other = await upload(store, db, (40, 40, 200))
+        await db.portfolio.insert_one({"blobId": portfolio})
+        await db.settings.insert_one({
+            "type": "system",
+            "watermark": {
+                "enabled": True,
+                "text": "Studio"
+            }
+        })
+        request = Request({"type": "http", "method": "GET", "headers": []})
+        headers = {}
+        try:
+            for blob_id in (portfolio, other):
+                private = await watermarker.protects(db, blob_id)
+                response = await resizer.response(request, db, blob_id, 320,
+                                                  None, "contain", "webp",
+                                                  private)
+                headers[blob_id] = response.headers["cache-control"]
+        finally:
+            shutdown_pool()
+        return headers[portfolio], headers[other]
+
+    portfolio, other = asyncio.run(run())
+    assert portfolio == PRIVATE_CACHE_CONTROL
+    assert other == CACHE_CONTROL
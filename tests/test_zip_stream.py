@@ -0,0 +1,132 @@
+import asyncio
+import io
+import os
+import zipfile
+import zlib
+from datetime import datetime
+
+from starlette.requests import Request
+
+from zip_stream import ZipEntry, ZipStream, archive_name, zip_response
+
+FILES = {
+    "blobs/a.jpg": os.urandom(70000),
+    "blobs/b.mp4": os.urandom(1234),
+    "blobs/empty.txt": b""
+}
+
+
+class MemoryStorage:
+
+    async def read_range(self, key, start, end):
+        data = FILES[key]
+        for offset in range(start, end + 1, 4096):
+            yield data[offset:min(offset + 4096, end + 1)]
+
+
+def entries(crc=False):
+    return [
+        ZipEntry(name,
+                 key,
+                 len(FILES[key]),
+                 modified=datetime(2024, 6, 1, 12, 30, 10),
+                 crc=zlib.crc32(FILES[key]) if crc else None)
+        for name, key in (("Ünïcode photo.jpg", "blobs/a.jpg"),
+                          ("clip.mp4", "blobs/b.mp4"), ("notes.txt",
+                                                        "blobs/empty.txt"))
+    ]
+
+
+async def collect(stream, start, end):
+    return b"".join([chunk async for chunk in stream.iter_range(start, end)])
+
+
+def test_archive_layout_reads_back():
+    checksums = []
+
+    async def on_checksum(entry):
+        checksums.append((entry.name, entry.crc))
+
+    stream = ZipStream(MemoryStorage(), entries(), on_checksum)
+    assert not stream.resumable
+    data = asyncio.run(collect(stream, 0, stream.size - 1))
+    assert len(data) == stream.size
+
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.testzip() is None
+        assert archive.namelist() == [
+            "Ünïcode photo.jpg", "clip.mp4", "notes.txt"
+        ]
+        info = archive.getinfo("clip.mp4")
+        assert info.compress_type == zipfile.ZIP_STORED
+        assert info.date_time == (2024, 6, 1, 12, 30, 10)
+        assert archive.read("Ünïcode photo.jpg") == FILES["blobs/a.jpg"]
+        assert archive.read("notes.txt") == b""
+    # CRCs computed while streaming are handed back for caching
+    assert checksums == [("Ünïcode photo.jpg", zlib.crc32(FILES["blobs/a.jpg"])),
+                         ("clip.mp4", zlib.crc32(FILES["blobs/b.mp4"]))]
+    assert stream.resumable
+
+
+def test_any_range_matches_the_full_archive():
+    stream = ZipStream(MemoryStorage(), entries(crc=True))
+    assert stream.resumable
+    full = asyncio.run(collect(stream, 0, stream.size - 1))
+    for start, end in ((0, 0), (10, 29), (100, 70100), (stream.size - 22,
+                                                        stream.size - 1)):
+        assert asyncio.run(collect(stream, start, end)) == full[start:end + 1]
+
+
+def test_archive_name():
+    taken = set()
+    assert archive_name("Beach: day/1", "blobs/x.JPG", taken) == "Beach_ day_1.jpg"
+    assert archive_name("beach_ day_1.jpg", "blobs/y.jpg",
+                        taken) == "beach_ day_1 (2).jpg"
+    assert archive_name(None, "blobs/z.png", taken) == "file.png"
+    assert archive_name("...", "blobs/z.png", taken) == "file (2).png"
+
+
+def request(headers):
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "path": "/",
+        "headers": [(k.lower().encode(), v.encode())
+                    for k, v in headers.items()]
+    })
+
+
+def test_zip_response_ranges():
+    stream = ZipStream(MemoryStorage(), entries(crc=True))
+    etag = stream.etag()
+    response = zip_response(request({"range": "bytes=100-199"}), stream,
+                            "gallery.zip")
+    assert response.status_code == 206
+    assert response.headers["content-range"] == f"bytes 100-199/{stream.size}"
+    assert response.headers["content-length"] == "100"
+
+    # If-Range with a stale validator gets the whole archive
+    response = zip_response(
+        request({
+            "range": "bytes=100-199",
+            "if-range": '"stale"'
+        }), stream, "gallery.zip")
+    assert response.status_code == 200
+    response = zip_response(request({
+        "range": "bytes=100-",
+        "if-range": etag
+    }), stream, "gallery.zip")
+    assert response.status_code == 206
+
+    response = zip_response(request({"range": f"bytes={stream.size}-"}),
+                            stream, "gallery.zip")
+    assert response.status_code == 416
+
+
+def test_zip_response_without_crcs_ignores_range():
+    stream = ZipStream(MemoryStorage(), entries())
+    response = zip_response(request({"range": "bytes=100-199"}), stream,
+                            "gallery.zip")
+    assert response.status_code == 200
+    assert response.headers["accept-ranges"] == "none"
+    assert response.headers["content-length"] == str(stream.size)